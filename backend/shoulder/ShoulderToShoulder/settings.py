@@ -14,6 +14,7 @@ from pathlib import Path
 import environ
 from datetime import timedelta
 import os
+from .database import database_settings
 
 env = environ.Env()
 environ.Env.read_env()
@@ -56,6 +57,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "s2s.middleware.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -65,6 +67,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "s2s.middleware.ApplicationTokenMiddleware",
+    "s2s.middleware.ProfilingMiddleware",
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -116,20 +119,9 @@ WSGI_APPLICATION = "ShoulderToShoulder.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    # "default": {
-    #     "ENGINE": "django.db.backends.postgresql_psycopg2",
-    #     "NAME": env("DB_NAME"),
-    #     "USER": env("DB_USER"),
-    #     "PASSWORD": env("DB_PASSWORD"),
-    #     "HOST": env("DB_HOST"),
-    #     "PORT": env("DB_PORT"),
-    # }
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": os.path.join(BASE_DIR, "s2s.sqlite"),
-    }
-}
+# Selected by DATABASE_URL or the DB_* variables; SQLite by default (see
+# ShoulderToShoulder/database.py)
+DATABASES = database_settings(env, BASE_DIR)
 
 # Rest framework
 # https://www.django-rest-framework.org/tutorial/quickstart/
@@ -195,6 +187,46 @@ SIMPLE_JWT = {
 
 APP_TOKEN = env("APP_TOKEN")
 
+# Seconds the digests of valid application tokens are cached per process, and
+# optionally the alias of a cache in CACHES to share them between processes
+APP_TOKEN_CACHE_TTL = 60
+APP_TOKEN_SHARED_CACHE = None
+
+# Requests with more database queries than this are logged as warnings
+INSTRUMENTATION_QUERY_THRESHOLD = 50
+
+# Where requests and commands profiled on demand write their profiles, and the
+# default profiler ("sampling" or "cprofile"; see s2s.utils.profiling)
+PROFILING_DIR = os.path.join(BASE_DIR, "profiles")
+PROFILING_MODE = "sampling"
+
+# The external services called by s2s.utils.upstream, the timeout of their
+# calls in seconds, and the size of the connection pool per event loop
+ZIPCODE_API_URL = "https://api.zipcodestack.com/v1/search"
+ZIPCODE_API_KEY = env.str("ZIPCODE_API_KEY", default="")
+GEOCODE_API_URL = "https://nominatim.openstreetmap.org/search"
+UPSTREAM_TIMEOUT = 10
+UPSTREAM_MAX_CONNECTIONS = 20
+
+# Number of zip codes whose lookups are cached in memory per process (see
+# s2s.utils.zipcodes)
+ZIPCODE_CACHE_SIZE = 10000
+
+# Days before a zip code the API didn't know is looked up again, i.e. in case
+# it's a new code (see s2s.utils.zipcodes)
+ZIPCODE_NEGATIVE_TTL = 30
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "s2s": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
 # Configure AWS S3 settings
 AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME")
 AWS_S3_REGION_NAME = env("AWS_S3_REGION_NAME")
@@ -213,3 +245,14 @@ DEFAULT_PROFILE_IMAGE_PATH = MEDIA_URL + "default_profile.jpg"
 EMAIL_BACKEND = "django_ses.SESBackend"
 AWS_REGION_NAME = env("AWS_S3_REGION_NAME")
 S2S_FROM_EMAIL = "shouldertoshoulder.contact@gmail.com"
+
+# Sending of the email outbox (see s2s.utils.email_outbox): the SES account's
+# maximum send rate in emails per second, the threads sending, the emails
+# claimed at a time, the retries of transient errors and their first backoff
+# in seconds, and the seconds a claimed email is held by its worker
+EMAIL_SEND_RATE = 14
+EMAIL_SEND_WORKERS = 8
+EMAIL_BATCH_SIZE = 500
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_RETRY_BACKOFF = 60
+EMAIL_CLAIM_TIMEOUT = 600
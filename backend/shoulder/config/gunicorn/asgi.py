@@ -0,0 +1,20 @@
+"""Gunicorn *ASGI* config file"""
+
+# Django ASGI application path in pattern MODULE_NAME:VARIABLE_NAME, so the
+# async views (s2s.async_views) don't hold a worker while they wait on the
+# external services
+wsgi_app = "ShoulderToShoulder.asgi:application"
+# Run the application in an event loop (requires uvicorn)
+worker_class = "uvicorn.workers.UvicornWorker"
+# The granularity of Error log outputs
+loglevel = "info"
+# The number of worker processes for handling requests
+workers = 2
+# The socket to bind
+bind = "0.0.0.0:8000"
+# Write access and error info to /var/log
+accesslog = errorlog = "/var/log/gunicorn/asgi.log"
+# Redirect stdout/stderr to log file
+capture_output = True
+# PID file so you can easily fetch process ID
+pidfile = "/var/run/gunicorn/asgi.pid"
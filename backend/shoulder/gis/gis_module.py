@@ -1,4 +1,6 @@
 # Module for common GIS utilities relevant to shoulder2shoulder.
+import hashlib
+import os
 import certifi
 import ssl
 import geopy.geocoders
@@ -10,11 +12,38 @@ ctx = ssl.create_default_context(cafile=certifi.where())
 geopy.geocoders.options.default_ssl_context = ctx
 
 
+# with GEOCODE_STUB=1 in the environment, geocode doesn't call Nominatim and
+# places every address near STUB_CENTER instead (i.e. for load tests)
+STUB_CENTER = (41.8781, -87.6298)
+
+
+def stub_geocode(address):
+    """
+    Returns a made-up geocoding result for an address, within about 10 miles
+    of STUB_CENTER. The same address always gets the same coordinates.
+    """
+    digest = hashlib.sha256(address.encode()).digest()
+    offsets = [int.from_bytes(digest[i:i + 4], "big") / 2**32 - 0.5 for i in (0, 4)]
+    return {
+        "address": address,
+        "coords": (STUB_CENTER[0] + 0.3 * offsets[0], STUB_CENTER[1] + 0.4 * offsets[1]),
+    }
+
+
+def geocode_stubbed():
+    """
+    Returns whether GEOCODE_STUB is set, i.e. geocode returns stub_geocode.
+    """
+    return os.environ.get("GEOCODE_STUB", "") not in ("", "0")
+
+
 def geocode(address):
     """
     Geocode an address as a string and returns dictionarity with the standardized address and a
     returns a 'coords' key with a tuple that has latitude, then longitude.
     """
+    if geocode_stubbed():
+        return stub_geocode(address)
 
     # Nominatim has a rate limit of 1 second. For testing purposes,
     # I am using my (Ethan's) email as the registered user.
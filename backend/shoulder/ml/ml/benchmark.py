@@ -0,0 +1,434 @@
+"""
+Offline benchmarks of the recommender.
+
+run_benchmark trains a DeepFM on synthetic rows shaped like the training rows
+(s2s.utils.training_rows) and measures:
+
+    preprocess: tokens/s of converting feature rows into tokens, with NumPy
+        (ml.inference.tokens) and JAX (ml.recommendation.tokenize)
+    training: steps/s and rows/s of a jitted training step with the optimizer
+        update, after compilation, and the wall time of training (which
+        includes compiling it when no earlier run in the process has)
+    inference: rows/s at several batch sizes for the NumPy backend at every
+        precision and for the jitted JAX forward pass, with the peak memory
+        NumPy allocates per batch
+    quality: AUC, precision@k per user, log loss, and accuracy on held-out
+        rows, for every precision of the NumPy backend
+
+The results are plain JSON (sorted keys, rounded floats) so two runs can be
+diffed between commits; timings are the best of a few repeats.
+
+The synthetic rows follow the panel schemas: every event has exactly one
+hobby category, group size, duration, and day/time period column set, every
+row one distance bin, and every user a fixed random set of pref_ columns. A
+row's target is more likely the more of its event's columns the user
+prefers, so a trained model should rank held-out rows better than chance.
+"""
+
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+from . import inference
+from .inference import PRECISIONS, USER_BUCKETS, tokens, vocab_size
+
+# column prefixes of the one-hot event and distance groups; the remaining
+# columns without a pref_ prefix are the day/time periods
+ONE_HOT_GROUPS = ("hobby_category_", "num_particip_", "duration_", "dist_within_")
+ROW_GROUPS = ("dist_within_",)
+BATCH_SIZES = (1, 32, 256, 4096)
+
+
+def feature_groups(columns: list) -> dict:
+    """
+    Group the event and distance columns of a schema into one-hot groups
+
+    Parameters:
+    -----------
+        columns (list): feature column names, i.e. FEATURE_COLUMNS
+
+    Returns:
+    --------
+        A dictionary of column indices by group name ("time" for the day/time
+        periods); pref_ columns aren't in any group
+    """
+    groups = {}
+    for i, column in enumerate(columns):
+        if column.startswith("pref_"):
+            continue
+        group = next((prefix for prefix in ONE_HOT_GROUPS if column.startswith(prefix)), "time")
+        groups.setdefault(group, []).append(i)
+    return groups
+
+
+def synthetic_rows(columns: list, num_rows: int, num_users: int = 500,
+                   num_events: int = 200, seed: int = 0) -> tuple:
+    """
+    Generate synthetic training rows following the panel schemas
+
+    Parameters:
+    -----------
+        columns (list): feature column names, i.e. FEATURE_COLUMNS
+        num_rows (int): the number of user-event rows
+        num_users (int): the number of distinct users
+        num_events (int): the number of distinct events
+        seed (int): a seed for the random number generator
+
+    Returns:
+    --------
+        A (features, user_ids, targets) tuple of arrays, like
+        s2s.utils.training_rows.read_training_rows
+    """
+    rng = np.random.default_rng(seed)
+    index = {column: i for i, column in enumerate(columns)}
+    prefs = [i for i, column in enumerate(columns) if column.startswith("pref_")]
+
+    # every event sets one column of every event group
+    events = np.zeros((num_events, len(columns)), dtype=bool)
+    users = np.zeros((num_users, len(columns)), dtype=bool)
+    users[:, prefs] = rng.random((num_users, len(prefs))) < 0.3
+    groups = feature_groups(columns)
+    for group, group_columns in groups.items():
+        if group not in ROW_GROUPS:
+            events[np.arange(num_events), rng.choice(group_columns, num_events)] = True
+
+    user_rows = rng.integers(num_users, size=num_rows)
+    event_rows = rng.integers(num_events, size=num_rows)
+    features = users[user_rows] | events[event_rows]
+    for group in ROW_GROUPS:
+        if group in groups:
+            features[np.arange(num_rows), rng.choice(groups[group], num_rows)] = True
+
+    # the event (and distance) columns the user of the row has a pref_ column for
+    matched = [column for column in columns if "pref_" + column in index]
+    event_columns = np.array([index[column] for column in matched], dtype=np.int64)
+    pref_columns = np.array([index["pref_" + column] for column in matched], dtype=np.int64)
+    matches = (features[:, event_columns] & features[:, pref_columns]).sum(axis=1)
+    user_bias = rng.normal(0, 0.5, num_users)[user_rows]
+    logits = 1.5 * (matches - matches.mean()) + user_bias - 0.6
+    targets = rng.random(num_rows) < 1 / (1 + np.exp(-logits))
+
+    return features, user_rows.astype(np.int64) + 1, targets
+
+
+def auc(y, scores) -> float:
+    """
+    Get the area under the ROC curve, i.e. the probability that a random
+    positive row is scored above a random negative one (ties count half)
+
+    Returns:
+    --------
+        The AUC, or None if y has only one class
+    """
+    y = np.asarray(y, dtype=bool).reshape(-1)
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    num_pos, num_neg = y.sum(), (~y).sum()
+    if num_pos == 0 or num_neg == 0:
+        return None
+
+    # average ranks of tied scores
+    order = np.argsort(scores, kind="mergesort")
+    sorted_scores = scores[order]
+    ranks = np.empty(len(scores))
+    starts = np.flatnonzero(np.r_[True, sorted_scores[1:] != sorted_scores[:-1]])
+    ends = np.r_[starts[1:], len(scores)]
+    for start, end in zip(starts, ends):
+        ranks[order[start:end]] = (start + end + 1) / 2
+
+    return float((ranks[y].sum() - num_pos * (num_pos + 1) / 2) / (num_pos * num_neg))
+
+
+def precision_at_k(y, scores, groups, k: int = 5) -> float:
+    """
+    Get the mean over groups (i.e. users) of the share of positive rows among
+    the group's k highest-scored rows, or all of its rows if it has fewer
+
+    Returns:
+    --------
+        The mean precision@k, or None if there are no rows
+    """
+    y = np.asarray(y, dtype=bool).reshape(-1)
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    groups = np.asarray(groups).reshape(-1)
+    if len(y) == 0:
+        return None
+
+    # rows sorted by group, then by descending score
+    order = np.lexsort((-scores, groups))
+    groups, y = groups[order], y[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    rank = np.arange(len(y)) - np.repeat(starts, np.diff(np.r_[starts, len(y)]))
+    top = rank < k
+
+    hits = np.add.reduceat((y & top).astype(np.int64), starts)
+    counts = np.add.reduceat(top.astype(np.int64), starts)
+    return float(np.mean(hits / counts))
+
+
+def log_loss(y, probabilities) -> float:
+    """
+    Get the mean binary cross-entropy of predicted probabilities
+    """
+    y = np.asarray(y, dtype=bool).reshape(-1)
+    p = np.clip(np.asarray(probabilities, dtype=np.float64).reshape(-1), 1e-7, 1 - 1e-7)
+    return float(-np.mean(np.where(y, np.log(p), np.log(1 - p))))
+
+
+def _seconds(fn, repeat: int = 3, min_time: float = 0.1) -> float:
+    """
+    Get the best time of one call of fn over repeat rounds, calling it as often
+    as needed for a round to take at least min_time seconds (after one warm-up
+    call)
+    """
+    fn()
+    best = float("inf")
+    for _ in range(repeat):
+        calls, start = 0, time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / calls)
+    return best
+
+
+def _peak_mb(fn) -> float:
+    """
+    Get the peak memory allocated by Python and NumPy during one call of fn
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def _max_rss_mb() -> float:
+    """
+    Get the peak resident memory of the process
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def _rounded(value, digits: int = 6):
+    """
+    Round the floats of a result to significant digits, so JSON diffs only show
+    meaningful changes
+    """
+    if isinstance(value, dict):
+        return {key: _rounded(item, digits) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_rounded(item, digits) for item in value]
+    if isinstance(value, float):
+        return float(f"{value:.{digits}g}")
+    return value
+
+
+def _flatten(results: dict, prefix: str = "") -> dict:
+    """
+    Flatten the numbers of nested results into a dictionary keyed by dotted
+    paths
+    """
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(previous: dict, current: dict, sections: tuple = (
+        "preprocess", "training", "inference", "quality")) -> list:
+    """
+    Compare the measurements of two benchmark runs
+
+    Parameters:
+    -----------
+        previous (dict): the results of the earlier run
+        current (dict): the results of the later run
+        sections (tuple): the sections of the results to compare
+
+    Returns:
+    --------
+        A list of (key, previous value, current value, relative change)
+        tuples for every measurement in both runs
+    """
+    before = _flatten({key: previous[key] for key in sections if key in previous})
+    after = _flatten({key: current[key] for key in sections if key in current})
+    return [
+        (key, before[key], after[key],
+         (after[key] - before[key]) / abs(before[key]) if before[key] else None)
+        for key in sorted(before.keys() & after.keys())
+    ]
+
+
+def run_benchmark(
+    columns: list,
+    num_rows: int = 20000,
+    num_users: int = 500,
+    num_events: int = 200,
+    num_epochs: int = 5,
+    batch_size: int = 256,
+    batch_sizes: tuple = BATCH_SIZES,
+    holdout: float = 0.2,
+    k: int = 5,
+    num_buckets: int = USER_BUCKETS,
+    seed: int = 0,
+    output: str = None,
+) -> dict:
+    """
+    Benchmark preprocessing, training, inference, and ranking quality on
+    synthetic data
+
+    Parameters:
+    -----------
+        columns (list): feature column names, i.e. FEATURE_COLUMNS
+        num_rows (int): the number of synthetic rows
+        num_users (int): the number of synthetic users
+        num_events (int): the number of synthetic events
+        num_epochs (int): the number of epochs to train for
+        batch_size (int): the training batch size
+        batch_sizes (tuple): the inference batch sizes to measure
+        holdout (float): the share of the rows to measure quality on
+        k (int): the cutoff of precision@k
+        num_buckets (int): the number of user buckets
+        seed (int): a seed for the data, the split, and the model
+        output (str): a JSON file to write the results to
+
+    Returns:
+    --------
+        A dictionary of results
+    """
+    import jax
+    import jax.numpy as jnp
+    import optax
+    from .dataset import Dataset
+    from .model import foward_deep_fm, init_deep_fm
+    from .recommendation import tokenize
+    from .train import LR, step, train
+
+    features, user_ids, targets = synthetic_rows(columns, num_rows, num_users, num_events, seed)
+    results = {
+        "config": {
+            "num_rows": num_rows,
+            "num_features": len(columns),
+            "num_users": num_users,
+            "num_events": num_events,
+            "num_epochs": num_epochs,
+            "batch_size": batch_size,
+            "holdout": holdout,
+            "k": k,
+            "num_buckets": num_buckets,
+            "seed": seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "jax": jax.__version__,
+            "platform": platform.platform(),
+            "devices": [str(device) for device in jax.devices()],
+        },
+    }
+
+    # preprocess
+    results["preprocess"] = {
+        "numpy_rows_per_second": num_rows / _seconds(
+            lambda: tokens(features, user_ids, dtype=np.int64, num_buckets=num_buckets)
+        ),
+        "jax_rows_per_second": num_rows / _seconds(
+            lambda: tokenize(features, user_ids, num_buckets).block_until_ready()
+        ),
+    }
+
+    X = tokens(features, user_ids, dtype=np.float32, num_buckets=num_buckets)
+    order = np.random.default_rng(seed).permutation(num_rows)
+    num_train = num_rows - max(1, int(num_rows * holdout))
+    train_rows, holdout_rows = order[:num_train], order[num_train:]
+    x_train, y_train = jnp.asarray(X[train_rows]), jnp.asarray(targets[train_rows], dtype=float)
+
+    params = init_deep_fm(vocab_size(len(columns), num_buckets), X.shape[1], 5)
+
+    # training
+    solver = optax.adam(LR)
+    x_batch, y_batch = x_train[:batch_size], y_train[:batch_size]
+
+    state = {"params": params, "solver_state": solver.init(params)}
+
+    def train_step():
+        _, _, grads, _ = step(state["params"], x_batch, y_batch)
+        updates, state["solver_state"] = solver.update(grads, state["solver_state"])
+        state["params"] = optax.apply_updates(state["params"], updates)
+        jax.block_until_ready(state["params"])
+
+    step_seconds = _seconds(train_step)
+    results["training"] = {
+        "steps_per_second": 1 / step_seconds,
+        "rows_per_second": x_batch.shape[0] / step_seconds,
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "parameters.pkl")
+        start = time.perf_counter()
+        _, loss_list, _, params = train(
+            params, Dataset(x_train, y_train, batch_size, seed), num_epochs, path
+        )
+        results["training"]["seconds"] = time.perf_counter() - start
+        results["training"]["final_loss"] = loss_list[-1]
+
+        # quality
+        x_holdout = X[holdout_rows].astype(np.int64)
+        y_holdout = targets[holdout_rows]
+        results["quality"] = {"holdout_rows": len(holdout_rows), "base_rate": float(y_holdout.mean())}
+        for precision in PRECISIONS:
+            probabilities = inference.predict(x_holdout, path, precision)[:, 0]
+            results["quality"][precision] = {
+                "auc": auc(y_holdout, probabilities),
+                f"precision_at_{k}": precision_at_k(
+                    y_holdout, probabilities, user_ids[holdout_rows], k
+                ),
+                "log_loss": log_loss(y_holdout, probabilities),
+                "accuracy": float(np.mean((probabilities >= 0.5) == y_holdout)),
+            }
+
+        # inference
+        forward = jax.jit(lambda X: foward_deep_fm(params, X, 0.0))
+        results["inference"] = {}
+        for size in batch_sizes:
+            batch = X[np.arange(size) % num_rows]
+            int_batch = batch.astype(np.int64)
+            jax_batch = jnp.asarray(batch)
+            entry = {}
+            for precision in PRECISIONS:
+                predict = lambda: inference.predict(int_batch, path, precision)
+                entry[f"numpy_{precision}"] = {
+                    "rows_per_second": size / _seconds(predict),
+                    "peak_mb": _peak_mb(predict),
+                }
+            entry["jax_float32"] = {
+                "rows_per_second": size / _seconds(
+                    lambda: forward(jax_batch).block_until_ready()
+                ),
+            }
+            results["inference"][str(size)] = entry
+
+    results["memory"] = {"max_rss_mb": _max_rss_mb()}
+    results = _rounded(results)
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+    return results
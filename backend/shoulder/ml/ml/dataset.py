@@ -1,5 +1,10 @@
-import jax.numpy as jnp
+import os
+import jax
 import math
+import queue
+import threading
+import numpy as np
+import jax.numpy as jnp
 from jax.random import key, permutation, split
 
 class Dataset:
@@ -54,3 +59,111 @@ class Dataset:
         self.batch_index += 1
 
         return x_batch, y_batch
+
+
+class MemmapDataset:
+    """
+    A Dataset for corpora larger than memory, backed by memory-mapped arrays
+
+    The rows are split into blocks of consecutive rows. Every epoch visits the
+    blocks in a random order and shuffles the rows within each block, so every
+    read from disk is sequential. A background thread reads, shuffles, and
+    copies the next minibatches to the device while the current one trains.
+    Iterating yields (x_batch, y_batch) jax arrays like Dataset; all batches
+    have batch_size rows except the last one of an epoch.
+
+    Parameters:
+    -----------
+        X (np.ndarray | str): an array of features, i.e. an np.memmap, or the path of a .npy file to memory-map
+        Y (np.ndarray | str): an array of targets, or the path of a .npy file to memory-map
+        batch_size (int): the number of data points in each batch
+        seed (int): a seed for the random number generator to generate random minibatches
+        block_size (int): the number of consecutive rows shuffled together
+        prefetch (int): the number of batches prepared ahead of training
+    """
+
+    def __init__(self, X, Y, batch_size: int, seed: int, block_size: int = 65536,
+                 prefetch: int = 2) -> None:
+        self.X = np.load(X, mmap_mode="r") if isinstance(X, (str, os.PathLike)) else X
+        self.Y = np.load(Y, mmap_mode="r") if isinstance(Y, (str, os.PathLike)) else Y
+        self.batch_size = batch_size
+        self.block_size = max(block_size, batch_size)
+        self.prefetch = prefetch
+        self.rng = np.random.default_rng(seed)
+
+        self.num_samples = self.X.shape[0]
+        self.num_batches = math.ceil(self.num_samples / batch_size)
+        self._queue = None
+        self._stop = None
+
+    def _batches(self, rng: np.random.Generator):
+        """Generate the shuffled minibatches of one epoch on the host"""
+        starts = np.arange(0, self.num_samples, self.block_size)
+        rng.shuffle(starts)
+
+        x_rest = self.X[:0]
+        y_rest = self.Y[:0]
+        for start in starts:
+            end = min(start + self.block_size, self.num_samples)
+            perm = rng.permutation(end - start)
+
+            # rows left over from the previous block start the next batch
+            x_block = np.concatenate([x_rest, np.asarray(self.X[start:end])[perm]])
+            y_block = np.concatenate([y_rest, np.asarray(self.Y[start:end])[perm]])
+
+            num_full = len(x_block) // self.batch_size * self.batch_size
+            for i in range(0, num_full, self.batch_size):
+                yield x_block[i:i + self.batch_size], y_block[i:i + self.batch_size]
+            x_rest, y_rest = x_block[num_full:], y_block[num_full:]
+
+        if len(x_rest):
+            yield x_rest, y_rest
+
+    def _produce(self, batches, out: queue.Queue, stop: threading.Event) -> None:
+        """Copy minibatches to the device until the epoch ends or is abandoned"""
+        try:
+            for x_batch, y_batch in batches:
+                item = (jax.device_put(x_batch), jax.device_put(y_batch))
+                while not stop.is_set():
+                    try:
+                        out.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            out.put(StopIteration)
+        except Exception as e:
+            out.put(e)
+
+    def __iter__(self):
+        """Start a new epoch"""
+        if self._stop is not None:
+            self._stop.set()
+
+        # every epoch gets its own generator, so an abandoned epoch's thread
+        # can't share one with the next epoch
+        rng = np.random.default_rng(self.rng.integers(2**32))
+        self._queue = queue.Queue(maxsize=self.prefetch)
+        self._stop = threading.Event()
+        threading.Thread(
+            target=self._produce,
+            args=(self._batches(rng), self._queue, self._stop),
+            daemon=True,
+        ).start()
+        return self
+
+    def __next__(self) -> tuple:
+        """Generate next minibatch"""
+        if self._queue is None:
+            iter(self)
+
+        item = self._queue.get()
+        if item is StopIteration:
+            self._queue = None
+            raise StopIteration
+        if isinstance(item, Exception):
+            self._queue = None
+            raise item
+
+        return item
@@ -0,0 +1,636 @@
+"""
+Inference backends for the DeepFM.
+
+Serving only needs the forward pass with train=False, so the "numpy" backend
+runs the same math as ml.train.predict with NumPy on weights exported from the
+parameter pickle, without importing JAX. The "jax" backend calls
+ml.train.predict. The backend defaults to the ML_INFERENCE_BACKEND environment
+variable, or "numpy" when it isn't set.
+
+The exported weights live next to the pickle with an .npz suffix
+(weights/parameters.npz); ml.train.save_outputs writes both files. The npz
+file stores the SHA-256 hash of the pickle it was exported from, so it stays
+valid however a checkout or deploy sets the files' mtimes; if it is missing or
+was exported from another pickle, it is exported from the pickle on first use,
+which needs JAX once to unpickle the weights.
+
+The NumPy backend can also serve reduced-precision copies of the weights,
+selected with the ML_INFERENCE_PRECISION environment variable: "float16"
+halves the embedding table and MLP weights, and "int8" stores them as int8
+with one float32 scale per embedding row / MLP output unit, which are
+dequantized on the fly. The copies (parameters.float16.npz and
+parameters.int8.npz) are derived from parameters.npz on first use;
+quantization_report compares them against full precision.
+
+Users are embedded with the hashing trick: every user ID is hashed into one of
+a fixed number of buckets (ML_USER_BUCKETS, 1024 by default), so the
+embedding table doesn't grow with the user base and a new user shares the
+trained embedding of its bucket instead of needing a retrain. A trained model
+keeps the number of buckets it was initialized with; model_buckets reads it
+back from the weights.
+
+Models trained before the hashing trick (such as weights/parameters.pkl as
+shipped) embed user ID i at token 2 * num_features + 1 + i, with IDs past the
+table on its last row, and the tokens of their users keep that mapping, so
+every user keeps the embedding trained for them. They are told apart by the
+model format saved with the weights (see load_parameters): ml.train.save_outputs
+pickles the parameters with MODEL_FORMAT and writes it into the npz file, and
+pickles of bare parameters are LEGACY_FORMAT.
+"""
+
+import os
+import hashlib
+import pathlib
+import threading
+import numpy as np
+
+PARAMETERS_PATH = os.path.join(pathlib.Path(__file__).parent, "weights/parameters.pkl")
+BACKENDS = ("numpy", "jax")
+INFERENCE_BACKEND = os.environ.get("ML_INFERENCE_BACKEND", "numpy")
+USER_BUCKETS = int(os.environ.get("ML_USER_BUCKETS", 1024))
+PRECISIONS = ("float32", "float16", "int8")
+INFERENCE_PRECISION = os.environ.get("ML_INFERENCE_PRECISION", "float32")
+
+# the version of the saved weights; LEGACY_FORMAT models embed users by ID
+MODEL_FORMAT = 2
+LEGACY_FORMAT = 1
+
+# the quantized arrays, their scale arrays, and the axis the scales reduce
+QUANTIZED = {"embedding_weights": ("embedding_scales", 1)}
+
+_WEIGHTS = {}
+_SOURCE_HASHES = {}
+_WEIGHTS_LOCK = threading.Lock()
+
+
+def user_buckets(user_ids, num_buckets: int = USER_BUCKETS) -> np.ndarray:
+    """
+    Hash user IDs into a fixed number of buckets
+
+    Uses Fibonacci hashing, so the buckets are the same in every process and
+    consecutive IDs are spread across the buckets.
+
+    Parameters:
+    -----------
+        user_ids (array): user IDs
+        num_buckets (int): the number of buckets
+
+    Returns:
+    --------
+        An int64 array with the bucket of every user ID
+    """
+    hashed = np.asarray(user_ids, dtype=np.uint64).reshape(-1) * np.uint64(0x9E3779B97F4A7C15)
+    return ((hashed >> np.uint64(32)) % np.uint64(num_buckets)).astype(np.int64)
+
+
+def vocab_size(num_features: int, num_buckets: int = USER_BUCKETS) -> int:
+    """
+    Get the number of tokens of a DeepFM over num_features boolean features
+    and num_buckets user buckets
+    """
+    return 2 * num_features + num_buckets
+
+
+def model_buckets(params: list) -> int:
+    """
+    Get the number of user buckets of trained DeepFM parameters
+
+    The embedding table has vocab_size + 1 rows and the MLP's input has one
+    embedding per feature plus one for the user.
+    """
+    embedding_params, _, mlp_params = params
+    embedding_weights = embedding_params[0]["embedding_weights"]
+    num_features = mlp_params[0]["weights"].shape[0] // embedding_weights.shape[1] - 1
+    num_buckets = len(embedding_weights) - 1 - 2 * num_features
+    if num_buckets < 1:
+        raise ValueError("The embedding table has no rows for users")
+    return num_buckets
+
+
+def hashes_users(model_format: int) -> bool:
+    """
+    Check whether a model of the given format embeds users by hashed bucket
+    (see user_buckets) rather than by user ID
+    """
+    return model_format != LEGACY_FORMAT
+
+
+def exported_path(path: str = PARAMETERS_PATH, precision: str = "float32") -> str:
+    """
+    Get the path of the NumPy weights exported from a parameter pickle
+    """
+    base = os.path.splitext(str(path))[0]
+    return base + ".npz" if precision == "float32" else f"{base}.{precision}.npz"
+
+
+def holdout_path(path: str = PARAMETERS_PATH) -> str:
+    """
+    Get the path of the rows held out from training the weights of a
+    parameter pickle (see ml.recommendation.save_holdout)
+    """
+    return os.path.splitext(str(path))[0] + ".holdout.npz"
+
+
+def load_holdout(path: str = PARAMETERS_PATH) -> tuple:
+    """
+    Load the tokens and targets of the rows held out from training the
+    weights of a parameter pickle
+
+    Returns:
+    --------
+        A tuple of token and target arrays
+    """
+    if not os.path.isfile(holdout_path(path)):
+        raise ValueError(
+            "The weights have no held-out rows; train them with a validation share"
+        )
+    with np.load(holdout_path(path)) as arrays:
+        return arrays["X"], arrays["y"]
+
+
+def _check_precision(precision: str) -> None:
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+
+
+def quantize_int8(array, axis: int) -> tuple:
+    """
+    Symmetric int8 quantization with one scale per slice of an array
+
+    Parameters:
+    -----------
+        array (array): the array to quantize
+        axis (int): the axis each scale covers, e.g. 1 for one scale per row
+
+    Returns:
+    --------
+        A tuple of int8 values and float32 scales such that values * scales
+        approximates the array
+    """
+    array = np.asarray(array, dtype=np.float32)
+    scales = np.abs(array).max(axis=axis, keepdims=True) / 127
+    scales[scales == 0] = 1
+    values = np.clip(np.rint(array / scales), -127, 127).astype(np.int8)
+
+    return values, scales.astype(np.float32)
+
+
+def write_atomically(path: str, write) -> None:
+    """
+    Write a file next to path and move it over path, so another process never
+    loads a partly written file
+
+    The temporary name is per process, since every worker may export stale
+    weights at once.
+
+    Parameters:
+    -----------
+        path (str): the file to write
+        write (callable): writes the contents to the binary file it's given
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        write(file)
+    os.replace(temporary, path)
+
+
+def file_hash(path: str) -> str:
+    """
+    Get the SHA-256 hex digest of a file's contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_weights(
+    params: list,
+    path: str,
+    precision: str = "float32",
+    source_hash: str = None,
+    model_format: int = MODEL_FORMAT,
+) -> None:
+    """
+    Save DeepFM parameters as NumPy arrays in an npz file
+
+    The embedding table and MLP weights are stored with the given precision;
+    the FM parameters and the biases always stay float32.
+
+    Parameters:
+    -----------
+        params (list): the embedding, FM, and MLP parameters of a DeepFM
+        path (str): the npz file to write
+        precision (str): "float32", "float16", or "int8"
+        source_hash (str): the file_hash of the parameter pickle the weights
+            come from, which weights compares to tell whether the file is stale
+        model_format (int): the format of the model (see load_parameters)
+    """
+    _check_precision(precision)
+    embedding_params, fm_params, mlp_params = params
+    w, v, b = fm_params
+    arrays = {
+        "embedding_weights": embedding_params[0]["embedding_weights"],
+        "fm_w": w["w"],
+        "fm_V": v["V"],
+        "fm_bias": b["bias"],
+    }
+    quantized = dict(QUANTIZED)
+    for i, layer in enumerate(mlp_params):
+        arrays[f"mlp_weights_{i}"] = layer["weights"]
+        arrays[f"mlp_biases_{i}"] = layer["biases"]
+        quantized[f"mlp_weights_{i}"] = (f"mlp_scales_{i}", 0)
+
+    arrays = {k: np.asarray(v, dtype=np.float32) for k, v in arrays.items()}
+    arrays["model_format"] = np.array(model_format)
+    if source_hash is not None:
+        arrays["source_hash"] = np.array(source_hash)
+    for key, (scale_key, axis) in quantized.items():
+        if precision == "float16":
+            arrays[key] = arrays[key].astype(np.float16)
+        elif precision == "int8":
+            arrays[key], arrays[scale_key] = quantize_int8(arrays[key], axis)
+
+    write_atomically(path, lambda file: np.savez(file, **arrays))
+
+
+def load_parameters(path: str = PARAMETERS_PATH) -> tuple:
+    """
+    Load a parameter pickle written by ml.train.save_outputs
+
+    The pickle holds the parameters along with the format of the model;
+    pickles of the bare parameters, such as weights/parameters.pkl as
+    shipped, were saved before the hashing trick and are LEGACY_FORMAT.
+
+    Parameters:
+    -----------
+        path (str): the parameter pickle; unpickling it imports JAX
+
+    Returns:
+    --------
+        A tuple of the embedding, FM, and MLP parameters and the model format
+    """
+    import pickle
+
+    with open(path, "rb") as file:
+        saved = pickle.load(file)
+    if isinstance(saved, dict):
+        return saved["params"], saved["format"]
+    return saved, LEGACY_FORMAT
+
+
+def export_parameter_pickle(path: str = PARAMETERS_PATH) -> str:
+    """
+    Export the weights of a parameter pickle for the NumPy backend
+
+    Parameters:
+    -----------
+        path (str): the parameter pickle; unpickling it imports JAX
+
+    Returns:
+    --------
+        The path of the npz file
+    """
+    params, model_format = load_parameters(path)
+    export_weights(
+        params, exported_path(path), source_hash=file_hash(path), model_format=model_format
+    )
+    return exported_path(path)
+
+
+def load_weights(path: str) -> tuple:
+    """
+    Load exported weights in the layout of the DeepFM parameters
+
+    Quantized arrays are kept quantized; their scales are added to the
+    embedding and MLP layer dictionaries under "scales".
+
+    Parameters:
+    -----------
+        path (str): an npz file written by export_weights
+
+    Returns:
+    --------
+        A tuple of embedding, FM, and MLP parameters as NumPy arrays
+    """
+    with np.load(path) as arrays:
+        num_layers = sum(1 for key in arrays.files if key.startswith("mlp_weights_"))
+        embedding_params = [dict(embedding_weights=arrays["embedding_weights"])]
+        if "embedding_scales" in arrays.files:
+            embedding_params[0]["scales"] = arrays["embedding_scales"]
+        fm_params = [
+            dict(w=arrays["fm_w"]),
+            dict(V=arrays["fm_V"]),
+            dict(bias=arrays["fm_bias"]),
+        ]
+        mlp_params = []
+        for i in range(num_layers):
+            layer = dict(weights=arrays[f"mlp_weights_{i}"], biases=arrays[f"mlp_biases_{i}"])
+            if f"mlp_scales_{i}" in arrays.files:
+                layer["scales"] = arrays[f"mlp_scales_{i}"]
+            mlp_params.append(layer)
+    return embedding_params, fm_params, mlp_params
+
+
+def exported_format(path: str) -> int:
+    """
+    Get the model format of exported weights (see load_parameters)
+    """
+    with np.load(path) as arrays:
+        if "model_format" not in arrays.files:
+            return LEGACY_FORMAT
+        return int(arrays["model_format"])
+
+
+def _source_hash(path: str) -> str:
+    """
+    Get the file_hash of a parameter pickle, or None if it doesn't exist
+
+    The hash is only recomputed when the file is replaced or modified, so
+    serving doesn't read the pickle on every call.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _SOURCE_HASHES.get(path)
+    if cached is None or cached[0] != key:
+        cached = (key, file_hash(path))
+        _SOURCE_HASHES[path] = cached
+    return cached[1]
+
+
+def _is_stale(path: str, source_hash: str) -> bool:
+    """
+    Checks whether an exported file is missing or was exported from another
+    parameter pickle than the one with the given hash
+    """
+    if not os.path.isfile(path):
+        return True
+    if source_hash is None:
+        return False
+    with np.load(path) as arrays:
+        return "source_hash" not in arrays.files or str(arrays["source_hash"]) != source_hash
+
+
+def _cached_weights(path: str, precision: str) -> tuple:
+    """
+    Get the cached source hash, NumPy weights, and model format of a
+    parameter pickle, exporting the weights if the npz file is missing or
+    stale and reloading them whenever the pickle changes
+    """
+    _check_precision(precision)
+    full_path = exported_path(path)
+    npz_path = exported_path(path, precision)
+    with _WEIGHTS_LOCK:
+        source_hash = _source_hash(path)
+        cached = _WEIGHTS.get(npz_path)
+        if cached is None or (source_hash is not None and cached[0] != source_hash):
+            if _is_stale(full_path, source_hash):
+                export_parameter_pickle(path)
+            if precision != "float32" and _is_stale(npz_path, source_hash):
+                export_weights(
+                    load_weights(full_path), npz_path, precision, source_hash,
+                    exported_format(full_path),
+                )
+            cached = (source_hash, load_weights(npz_path), exported_format(npz_path))
+            _WEIGHTS[npz_path] = cached
+        return cached
+
+
+def weights(path: str = PARAMETERS_PATH, precision: str = "float32") -> tuple:
+    """
+    Get the NumPy weights of a parameter pickle, exporting them if the npz file
+    is missing or stale and reloading them whenever the pickle changes
+
+    Parameters:
+    -----------
+        path (str): the parameter pickle
+        precision (str): "float32", "float16", or "int8"
+
+    Returns:
+    --------
+        A tuple of embedding, FM, and MLP parameters as NumPy arrays
+    """
+    return _cached_weights(path, precision)[1]
+
+
+def weights_format(path: str = PARAMETERS_PATH, precision: str = "float32") -> int:
+    """
+    Get the model format of the NumPy weights of a parameter pickle (see
+    weights and load_parameters)
+    """
+    return _cached_weights(path, precision)[2]
+
+
+def foward_embedding(params: list[dict], X: np.ndarray) -> np.ndarray:
+    """
+    Get embeddings for each feature with NumPy
+
+    Tokens past the end of the vocabulary (e.g. users that weren't in the
+    training data) get zero vectors, like ml.train.predict.
+
+    Parameters:
+    -----------
+        params (list[dict]): a list with a dictionary containing the embedding weights
+        X (array): tokens to get embeddings for
+
+    Returns:
+    --------
+        An array with the concatenated embeddings of every row
+    """
+    embedding_weights = params[0]["embedding_weights"]
+    tokens = np.asarray(X).astype(np.int64)
+    unseen = (tokens < 0) | (tokens >= len(embedding_weights))
+    rows = np.where(unseen, 0, tokens)
+    embeddings = embedding_weights[rows].astype(np.float32)
+    if "scales" in params[0]:
+        embeddings *= params[0]["scales"][rows]
+    embeddings[unseen] = 0
+
+    return embeddings.reshape(embeddings.shape[0], -1)
+
+
+def foward_fm(params: list, X: np.ndarray) -> np.ndarray:
+    """
+    Calculate one foward pass of a factorization machine with NumPy
+
+    Parameters:
+    -----------
+        params (list): a list of parameters for the factorization machine
+        X (array): embeddings
+
+    Returns:
+    --------
+        An array of raw scores with one row per example
+    """
+    w, v, b = params
+    linear_term = X @ w["w"] + b["bias"]
+    squares_of_sums = (X @ v["V"]) ** 2
+    sums_of_squares = (X**2) @ (v["V"] ** 2)
+    interactions = 0.5 * (squares_of_sums - sums_of_squares).sum(axis=1)
+
+    return linear_term + interactions[:, None]
+
+
+def foward_mlp(params: list, X: np.ndarray) -> np.ndarray:
+    """
+    Execute one foward pass of a multilayer perceptron with NumPy, without
+    dropout
+
+    Parameters:
+    -----------
+        params (list): a list of model parameters
+        X (array): embeddings
+
+    Returns:
+    --------
+        An array of raw scores with one row per example
+    """
+    x = X
+    for layer in params:
+        # per-unit scales factor out of the product: x @ (W * s) == (x @ W) * s
+        x = x @ layer["weights"]
+        if "scales" in layer:
+            x = x * layer["scales"]
+        x = np.maximum(x + layer["biases"], 0)
+
+    return x
+
+
+def predict(X, path: str = PARAMETERS_PATH, precision: str = None) -> np.ndarray:
+    """
+    Predict the probability of a user RSVPing to an event with NumPy
+
+    Parameters:
+    -----------
+        X (array): an array of tokens
+        path (str): the parameter pickle whose weights to use
+        precision (str): "float32", "float16", or "int8"; defaults to
+            INFERENCE_PRECISION
+
+    Returns:
+    --------
+        An array of predicted probabilities with shape (rows, 1)
+    """
+    embedding_params, fm_params, mlp_params = weights(
+        path, precision or INFERENCE_PRECISION
+    )
+    embeddings = foward_embedding(embedding_params, X)
+    scores = foward_fm(fm_params, embeddings) + foward_mlp(mlp_params, embeddings)
+
+    return 1 / (1 + np.exp(-scores))
+
+
+def recommend_features(
+    features, user_ids, backend: str = None, precision: str = None
+) -> np.ndarray:
+    """
+    Get recommendations for users and events from boolean feature arrays
+
+    Parameters:
+    -----------
+        features (array): a boolean array with one row per user-event pair and
+            one column per feature, in sorted feature name order
+        user_ids (array): the user ID of every row
+        backend (str): "numpy" or "jax"; defaults to INFERENCE_BACKEND
+        precision (str): the weight precision of the NumPy backend; defaults
+            to INFERENCE_PRECISION
+
+    Returns:
+    --------
+        An array of predicted probabilities of attending events, shape (rows, 1)
+    """
+    backend = backend or INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS}")
+
+    if backend == "jax":
+        from . import train
+        from .recommendation import tokenize
+
+        train._ensure_weights()
+        X = tokenize(
+            features, user_ids, model_buckets(train.WEIGHTS),
+            hashes_users(train.WEIGHTS_FORMAT),
+        )
+        return np.asarray(train.predict(X))
+
+    precision = precision or INFERENCE_PRECISION
+    params = weights(PARAMETERS_PATH, precision)
+    X = tokens(
+        features, user_ids, dtype=np.int64, num_buckets=model_buckets(params),
+        hashed=hashes_users(weights_format(PARAMETERS_PATH, precision)),
+    )
+    return predict(X, precision=precision)
+
+
+def quantization_report(
+    X, y, path: str = PARAMETERS_PATH, precisions=PRECISIONS
+) -> dict:
+    """
+    Compare reduced-precision weights against full precision on held-out data
+
+    Parameters:
+    -----------
+        X (array): an array of tokens
+        y (array): whether each row's user attended the event
+        path (str): the parameter pickle whose weights to compare
+        precisions (tuple): the precisions to report on
+
+    Returns:
+    --------
+        A dictionary with, for every precision, the size of the weights in
+        bytes, the largest and mean absolute difference of the predicted
+        probabilities from full precision, the share of rows whose predicted
+        class agrees with full precision, and the accuracy
+    """
+    if len(X) == 0:
+        raise ValueError("No held-out rows to compare on")
+
+    y = np.asarray(y, dtype=bool).reshape(-1)
+    full = predict(X, path, "float32")[:, 0]
+
+    report = {}
+    for precision in precisions:
+        probabilities = predict(X, path, precision)[:, 0]
+        errors = np.abs(probabilities - full)
+        report[precision] = {
+            "bytes": sum(
+                array.nbytes
+                for group in weights(path, precision)
+                for layer in group
+                for array in map(np.asarray, layer.values())
+                if array.dtype != object
+            ),
+            "max_abs_error": float(errors.max()),
+            "mean_abs_error": float(errors.mean()),
+            "agreement": float(np.mean((probabilities >= 0.5) == (full >= 0.5))),
+            "accuracy": float(np.mean((probabilities >= 0.5) == y)),
+        }
+    return report
+
+
+def tokens(
+    features, user_ids, dtype=float, num_buckets: int = USER_BUCKETS, hashed: bool = True
+) -> np.ndarray:
+    """
+    Convert boolean feature rows into DeepFM tokens on the host (see
+    ml.recommendation.tokenize); with hashed=False, users get the tokens of
+    models trained before the hashing trick (see hashes_users)
+    """
+    user_ids = np.asarray(user_ids)
+    features = np.asarray(features, dtype=bool).reshape(len(user_ids), -1)
+    num_features = features.shape[1]
+
+    array = np.empty((len(user_ids), num_features + 1), dtype=dtype)
+    array[:, :num_features] = 2 * np.arange(num_features) + features
+    if hashed:
+        array[:, num_features] = 2 * num_features + user_buckets(user_ids, num_buckets)
+    else:
+        user_tokens = 2 * num_features + 1 + user_ids.astype(np.int64)
+        array[:, num_features] = np.minimum(user_tokens, 2 * num_features + num_buckets)
+
+    return array
@@ -210,24 +210,26 @@ def init_deep_fm(vocab_length: int, num_features: int, num_factors: int,
     return embedding_params, fm_params, mlp_params
 
 
-def foward_deep_fm(params: list, X: jax.Array) -> jaxlib.xla_extension.ArrayImpl:
+def foward_deep_fm(params: list, X: jax.Array,
+                   dropout: float=0.01) -> jaxlib.xla_extension.ArrayImpl:
     """
-    Calculate the foward pass of a deep factorization machine
+    Calculate the training foward pass of a deep factorization machine
 
     Parameters:
         params (list): a list of parameters for computing a foward pass
         X (jax.Array): features to use in the foward pass
-        predict (bool): whether prediction or training is being done
+        dropout (float): the proportion of MLP neurons to zero out
 
     Returns:
     --------
-        predictions (jax.Array): predicted probabilities of users RSVPing to events
+        predictions (jax.Array): predicted probabilities of users RSVPing to events,
+            with one row per example
     """
     embedding_params, fm_params, mlp_params = params
     embeddings = foward_embedding(embedding_params, X)
     fm_out = foward_fm(fm_params, embeddings)
-    mlp_out = foward_mlp(mlp_params, embeddings)
-    y = jax.nn.sigmoid(fm_out + mlp_out.T).T
+    mlp_out = foward_mlp(mlp_params, embeddings, dropout=dropout)
+    y = jax.nn.sigmoid(fm_out + mlp_out)
 
     return y
 
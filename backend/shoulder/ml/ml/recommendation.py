@@ -1,18 +1,60 @@
-import pickle
+from __future__ import annotations
+
+import json
 import jaxlib
-import requests
+import numpy as np
 import jax.numpy as jnp
 from .dataset import Dataset
+from .inference import USER_BUCKETS, hashes_users, holdout_path, load_parameters
+from .inference import model_buckets, vocab_size
+from .inference import recommend_features as _recommend_features
+from .inference import tokens as _tokens
 from .model import init_deep_fm
-from .train import train, predict
+from . import train as train_module
+from .train import _ensure_weights, train, predict, validation_split
 import os, pathlib
-from copy import deepcopy
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
 
 WEIGHTS_PATH = os.path.join(pathlib.Path(__file__).parent, "weights/parameters.pkl")
 PARAMETERS_PATH = os.path.join(pathlib.Path(__file__).parent, "weights/parameters.pkl")
 
 
-def preprocess(raw_data: list, predict=False) -> jaxlib.xla_extension.ArrayImpl:
+def tokenize(
+    features, user_ids, num_buckets: int = USER_BUCKETS, hashed: bool = True
+) -> jaxlib.xla_extension.ArrayImpl:
+    """
+    Convert boolean feature rows into DeepFM tokens
+
+    Feature i becomes token 2i + 1 when True and 2i otherwise, which gives
+    every response in every field a unique integer (a vocabulary for the
+    embedding layer). The user ID is hashed into one of num_buckets buckets,
+    whose token comes after the last feature token so it doesn't overlap with
+    another token; models trained before the hashing trick (hashed=False) get
+    the token of the user ID instead (see ml.inference.load_parameters).
+
+    Parameters:
+    -----------
+        features (array): a boolean array with one row per user-event pair and
+            one column per feature, in sorted feature name order
+        user_ids (array): the user ID of every row
+        num_buckets (int): the number of user buckets
+        hashed (bool): whether the model embeds users by hashed bucket
+
+    Returns:
+    --------
+        A jax NumPy array of tokens with one more column than features
+    """
+    return jnp.array(
+        _tokens(features, user_ids, num_buckets=num_buckets, hashed=hashed), dtype=float
+    )
+
+
+def preprocess(
+    raw_data: list, predict=False, num_buckets: int = USER_BUCKETS, hashed: bool = True
+) -> jaxlib.xla_extension.ArrayImpl:
     """
     Prepare data for training or predicting
 
@@ -20,47 +62,36 @@ def preprocess(raw_data: list, predict=False) -> jaxlib.xla_extension.ArrayImpl:
     -----------
         raw_data (list[Dict]): a list of dictionaries from the event suggestions database
         predict (bool): whether including targets for training or only features to predict
+        num_buckets (int): the number of user buckets
+        hashed (bool): whether the model embeds users by hashed bucket
 
     Returns:
         A tuple of preprocessed arrays for training or predicting
     """
-    feature_list, target_list = [], []
-    raw_copy = deepcopy(raw_data)
+    feature_list, target_list, user_ids = [], [], []
 
-    for d in raw_copy:
-        user_id = d["user_id"]
-        del d["user_id"]
-        del d["id"]
+    for d in raw_data:
+        skip = {"user_id", "id"}
         if d.get("scenario_id"):
-            del d["scenario_id"]
+            skip.add("scenario_id")
         if d.get("event_id"):
-            del d["event_id"]
+            skip.add("event_id")
 
         if not predict:
             if d["attended_event"] == 1:
                 target_list.append(1)
             else:
                 target_list.append(0)
-            del d["attended_event"]
+            skip.add("attended_event")
 
-        user_event_list, low, high = [], 0, 1
+        keys = sorted(key for key in d if key not in skip)
+        feature_list.append([d[key] is True for key in keys])
+        user_ids.append(d["user_id"])
 
-        for key in sorted(d.keys()):
-            if d[key] is True:
-                user_event_list.append(high)
-            else:
-                user_event_list.append(low)
-
-            # Ensures unique integers for every response in very field, basically creating
-            # a vocabulary for the embedding layer
-            low += 2
-            high += 2
-
-        # Makes sure the user ID doesn't overlap with another "token"
-        user_event_list.append(high + user_id)
-        feature_list.append(user_event_list)
-
-    x = jnp.array(feature_list, dtype=float)
+    if not raw_data:
+        x = jnp.array(feature_list, dtype=float)
+    else:
+        x = tokenize(feature_list, user_ids, num_buckets, hashed)
 
     if not predict:
         y = jnp.array(target_list, dtype=float)
@@ -69,6 +100,188 @@ def preprocess(raw_data: list, predict=False) -> jaxlib.xla_extension.ArrayImpl:
         return x
 
 
+def _training_arrays(raw_data, num_buckets: int = USER_BUCKETS, hashed: bool = True) -> tuple:
+    """
+    Prepare training data given either as dictionaries or as feature arrays
+
+    Parameters:
+    -----------
+        raw_data (list[Dict] | tuple): a list of dictionaries from the event
+            suggestions database, or a (features, user_ids, targets) tuple of
+            arrays (see s2s.utils.training_rows.read_training_rows)
+        num_buckets (int): the number of user buckets
+        hashed (bool): whether the model embeds users by hashed bucket
+
+    Returns:
+    --------
+        A tuple of token and target arrays
+    """
+    if isinstance(raw_data, tuple):
+        features, user_ids, targets = raw_data
+        return tokenize(features, user_ids, num_buckets, hashed), jnp.array(targets, dtype=float)
+    return preprocess(raw_data, num_buckets=num_buckets, hashed=hashed)
+
+
+def _open_training_file(path: str):
+    """
+    Open a training data snapshot, memory-mapping it
+
+    Returns:
+    --------
+        A tuple of the pyarrow Table and the number of features
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Reading training data snapshots requires pyarrow (pip install pyarrow)"
+        ) from e
+
+    if str(path).endswith(".parquet"):
+        table = pq.read_table(str(path), memory_map=True)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+    return table, len(json.loads(table.schema.metadata[b"feature_columns"]))
+
+
+def _iter_training_batches(table, num_features: int):
+    """
+    Decode the record batches of a training data snapshot one at a time
+
+    Returns:
+    --------
+        A generator of (features, user_ids, targets) tuples of arrays
+    """
+    num_bytes = table.schema.field("features").type.byte_width
+
+    for batch in table.to_batches():
+        if not batch.num_rows:
+            continue
+
+        # a view of the fixed-size binary values in the mapped file
+        values = batch.column("features")
+        data = np.frombuffer(values.buffers()[1], dtype=np.uint8)
+        start = values.offset * num_bytes
+        packed = data[start:start + len(values) * num_bytes].reshape(-1, num_bytes)
+
+        yield (
+            np.unpackbits(packed, axis=1, count=num_features).astype(bool),
+            batch.column("user_id").to_numpy(),
+            batch.column("attended_event").to_numpy(zero_copy_only=False),
+        )
+
+
+def read_training_file(path: str) -> tuple:
+    """
+    Read a training data snapshot written by the export_training_data_m command
+
+    Arrow IPC files (.arrow) are memory-mapped, so the packed features are
+    decoded straight from the mapped file without reading it into memory
+    first. Parquet files (.parquet) are memory-mapped too, but every row group
+    is decompressed.
+
+    Parameters:
+    -----------
+        path (str): the location of the snapshot
+
+    Returns:
+    --------
+        A (features, user_ids, targets) tuple of arrays, which pretrain and
+        finetune accept in place of raw_data
+    """
+    table, num_features = _open_training_file(path)
+    batches = list(_iter_training_batches(table, num_features))
+    if not batches:
+        return (
+            np.zeros((0, num_features), dtype=bool),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=bool),
+        )
+
+    return tuple(np.concatenate(arrays) for arrays in zip(*batches))
+
+
+def write_training_memmap(
+    path: str, x_path: str, y_path: str, num_buckets: int = USER_BUCKETS
+) -> tuple:
+    """
+    Tokenize a training data snapshot into .npy files one record batch at a
+    time, for training on corpora larger than memory with a MemmapDataset
+
+    Parameters:
+    -----------
+        path (str): the location of the snapshot
+        x_path (str): a location to write the tokens to
+        y_path (str): a location to write the targets to
+        num_buckets (int): the number of user buckets
+
+    Returns:
+    --------
+        A tuple of the number of rows and the largest token
+    """
+    table, num_features = _open_training_file(path)
+    x = np.lib.format.open_memmap(
+        x_path, mode="w+", dtype=np.float32, shape=(table.num_rows, num_features + 1)
+    )
+    y = np.lib.format.open_memmap(
+        y_path, mode="w+", dtype=np.float32, shape=(table.num_rows,)
+    )
+
+    row, max_token = 0, 0
+    for features, user_ids, targets in _iter_training_batches(table, num_features):
+        tokens = _tokens(features, user_ids, dtype=np.float32, num_buckets=num_buckets)
+        x[row:row + len(tokens)] = tokens
+        y[row:row + len(tokens)] = targets
+        row += len(tokens)
+        max_token = max(max_token, int(tokens.max()))
+
+    x.flush()
+    y.flush()
+    return row, max_token
+
+
+def load_training_file(path: str) -> tuple:
+    """
+    Load a training data snapshot written by the export_training_data_m command
+    as token and target arrays for a Dataset
+
+    Parameters:
+    -----------
+        path (str): the location of the snapshot
+
+    Returns:
+    --------
+        A tuple of token and target arrays
+    """
+    return _training_arrays(read_training_file(path))
+
+
+def save_holdout(path: str, validation_data: tuple) -> None:
+    """
+    Record the rows held out from training the weights at path, for
+    comparing the weights on rows they were never trained on (see
+    ml.inference.quantization_report); weights trained on every row have
+    none
+
+    Parameters:
+    -----------
+        path (str): the location of the weights
+        validation_data (tuple): the (X, Y) validation arrays, or None
+    """
+    target = holdout_path(path)
+    if validation_data is None:
+        if os.path.isfile(target):
+            os.remove(target)
+        return
+
+    X, Y = validation_data
+    with open(target + ".tmp", "wb") as file:
+        np.savez(file, X=np.asarray(X), y=np.asarray(Y))
+    os.replace(target + ".tmp", target)
+
+
 def pretrain(
     raw_data: requests.models.Response,
     num_factors: int = 5,
@@ -77,28 +290,54 @@ def pretrain(
     seed=1994,
     seeds=(8, 6, 7),
     path: str = PARAMETERS_PATH,
+    num_buckets: int = USER_BUCKETS,
+    num_devices: int = 1,
+    validation: float = 0.0,
+    patience: int = None,
+    checkpoint_path: str = None,
+    resume: bool = False,
 ) -> tuple[list]:
     """
     Pretrain a DeepFM
 
     Parameters:
     -----------
-        raw_data (requests.models.Response): a response from the event suggestions table
+        raw_data (requests.models.Response): a response from the event suggestions table,
+            or a (features, user_ids, targets) tuple of arrays
         num_factors (int): the number of latent factors to consider for the FM
         batch_size (int): the number of training examples in each batch
         num_epochs (int): the number of passes to perform on the dataset durind training
         seed (int): a seed for shuffling the data
         seeds (tuple): a tuple of three seeds for model initialization
         path (str): a location to write thew eights to
+        num_buckets (int): the number of user buckets; the size of the model
+            doesn't depend on the number of users
+        num_devices (int): the number of devices to split minibatches across
+        validation (float): the share of the rows to hold out for measuring
+            the validation loss after every epoch; the held-out rows are
+            recorded next to the weights (see save_holdout)
+        patience (int): the number of epochs without improvement of the
+            validation loss to stop after, keeping the best weights
+        checkpoint_path (str): a location to write a checkpoint to after every
+            epoch
+        resume (bool): whether to continue from the checkpoint at
+            checkpoint_path if there is one
 
     Returns:
     --------
         A tuple of lists of epochs, loss, and accuracy
     """
-    full_x, full_y = preprocess(raw_data)
-    data = Dataset(full_x, full_y, batch_size, seed)
-    params = init_deep_fm(int(jnp.max(full_x)), full_x.shape[1], num_factors, seeds)
-    epochs, loss_list, acc_list, params = train(params, data, num_epochs, path)
+    full_x, full_y = _training_arrays(raw_data, num_buckets)
+    (train_x, train_y), validation_data = validation_split(full_x, full_y, validation, seed)
+    data = Dataset(train_x, train_y, batch_size, seed)
+    vocab_length = vocab_size(full_x.shape[1] - 1, num_buckets)
+    params = init_deep_fm(vocab_length, full_x.shape[1], num_factors, seeds)
+    epochs, loss_list, acc_list, params = train(
+        params, data, num_epochs, path, num_devices=num_devices,
+        validation=validation_data, patience=patience,
+        checkpoint_path=checkpoint_path, resume=resume,
+    )
+    save_holdout(path, validation_data)
 
     return epochs, loss_list, acc_list
 
@@ -109,29 +348,52 @@ def finetune(
     num_epochs: int = 5,
     seed=1999,
     path: str = PARAMETERS_PATH,
+    num_devices: int = 1,
+    validation: float = 0.0,
+    patience: int = None,
+    checkpoint_path: str = None,
+    resume: bool = False,
 ) -> tuple[list]:
     """
     Finetune a DeepFM
 
     Parameters:
     -----------
-        raw_data (requests.models.Response): a response from the event suggestions table.
+        raw_data (requests.models.Response): a response from the event suggestions table,
+            or a (features, user_ids, targets) tuple of arrays.
         batch_size (int): the number of training examples in each batch.
         num_epochs (int): the number of passes to perform on the dataset durind training.
         seed (int): a seed for shuffling the data
         path (str): a location to write the updated weights to
+        num_devices (int): the number of devices to split minibatches across
+        validation (float): the share of the rows to hold out for measuring
+            the validation loss after every epoch; the held-out rows are
+            recorded next to the weights (see save_holdout)
+        patience (int): the number of epochs without improvement of the
+            validation loss to stop after, keeping the best weights
+        checkpoint_path (str): a location to write a checkpoint to after every
+            epoch
+        resume (bool): whether to continue from the checkpoint at
+            checkpoint_path if there is one
 
     Returns:
     --------
         A tuple of lists of epochs, loss, and accuracy
     """
-    full_x, full_y = preprocess(raw_data)
-    data = Dataset(full_x, full_y, batch_size, seed)
+    params, model_format = load_parameters(WEIGHTS_PATH)
 
-    with open(WEIGHTS_PATH, "rb") as file:
-        params = pickle.load(file)
+    full_x, full_y = _training_arrays(
+        raw_data, model_buckets(params), hashes_users(model_format)
+    )
+    (train_x, train_y), validation_data = validation_split(full_x, full_y, validation, seed)
+    data = Dataset(train_x, train_y, batch_size, seed)
 
-    epochs, loss_list, acc_list, params = train(params, data, num_epochs, path=path)
+    epochs, loss_list, acc_list, params = train(
+        params, data, num_epochs, path=path, num_devices=num_devices,
+        validation=validation_data, patience=patience,
+        checkpoint_path=checkpoint_path, resume=resume, model_format=model_format,
+    )
+    save_holdout(path, validation_data)
 
     return epochs, loss_list, acc_list
 
@@ -148,5 +410,27 @@ def recommend(raw_data: requests.models.Response) -> jaxlib.xla_extension.ArrayI
        --------
            A jax NumPy array of predicted probabilities of attending events
     """
-    full_x = preprocess(raw_data, predict=True)
+    _ensure_weights()
+    full_x = preprocess(
+        raw_data, predict=True, num_buckets=model_buckets(train_module.WEIGHTS),
+        hashed=hashes_users(train_module.WEIGHTS_FORMAT),
+    )
     return predict(full_x)
+
+
+def recommend_features(features, user_ids) -> jaxlib.xla_extension.ArrayImpl:
+    """
+    Get recommendations for users and events from boolean feature arrays.
+
+    Parameters:
+    -----------
+        features (array): a boolean array with one row per user-event pair and
+            one column per feature, in sorted feature name order
+        user_ids (array): the user ID of every row
+
+    Returns:
+    --------
+        An array of predicted probabilities of attending events, computed
+        with the inference backend selected in ml.inference
+    """
+    return _recommend_features(features, user_ids)
@@ -0,0 +1,303 @@
+"""
+Hyperparameter search for the DeepFM.
+
+The training data is tokenized once and copied into shared memory, and the
+trials run in a pool of worker processes that map it instead of each
+re-extracting and re-tokenizing it. A fixed share of the rows is held out and
+every trial is scored by its loss on them. The weights of the best trial are
+copied to the path the application serves the model from.
+
+Strategies:
+    "grid": every combination of the values in the search space
+    "random": num_trials random combinations
+    "halving": successive halving over num_trials random combinations. Every
+        rung trains the surviving trials for eta times as many epochs as the
+        previous rung (continuing from their weights, with a fresh optimizer),
+        up to num_epochs, and keeps the best 1 / eta of them.
+
+Every trial records its hyperparameters, per-epoch training loss and accuracy,
+and held-out loss and accuracy; the records are written to trials.json in the
+output directory together with every trial's weights.
+"""
+
+import itertools
+import json
+import os
+import random
+import shutil
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+from .inference import USER_BUCKETS, exported_path, load_parameters, tokens, vocab_size
+from .inference import write_atomically
+
+PARAMETERS_PATH = os.path.join(os.path.dirname(__file__), "weights/parameters.pkl")
+STRATEGIES = ("grid", "random", "halving")
+
+# the hyperparameters of a trial and their defaults (those of pretrain)
+DEFAULTS = {
+    "num_factors": 5,
+    "batch_size": 32,
+    "lr": 0.0001,
+    "seed": 1994,
+    "seeds": (8, 6, 7),
+}
+
+
+def grid(space: dict) -> list:
+    """
+    Get every combination of the values in a search space
+
+    Parameters:
+    -----------
+        space (dict): a list of values for some of the keys of DEFAULTS
+
+    Returns:
+    --------
+        A list of hyperparameter dictionaries
+    """
+    keys = sorted(space)
+    return [
+        {**DEFAULTS, **dict(zip(keys, values))}
+        for values in itertools.product(*(space[key] for key in keys))
+    ]
+
+
+def sample(space: dict, num_trials: int, seed: int = 0) -> list:
+    """
+    Get num_trials random combinations of the values in a search space, without
+    repeats when the space has at least num_trials combinations
+
+    Returns:
+    --------
+        A list of hyperparameter dictionaries
+    """
+    trials = grid(space)
+    rng = random.Random(seed)
+    if num_trials <= len(trials):
+        return rng.sample(trials, num_trials)
+    return [rng.choice(trials) for _ in range(num_trials)]
+
+
+class SharedDataset:
+    """
+    Token and target arrays copied into shared memory, so worker processes can
+    map them without copying
+
+    Use as a context manager in the parent process; the blocks are freed on
+    exit. spec is picklable and is what the workers attach with.
+
+    Parameters:
+    -----------
+        X (np.ndarray): an array of tokens
+        Y (np.ndarray): an array of targets
+    """
+
+    def __init__(self, X: np.ndarray, Y: np.ndarray) -> None:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        Y = np.ascontiguousarray(Y, dtype=np.float32).reshape(-1)
+        self._blocks = []
+        self.spec = tuple(self._share(array) for array in (X, Y))
+
+    def _share(self, array):
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._blocks.append(block)
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        return block.name, array.shape
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+
+
+def _attach(spec):
+    """
+    Map the arrays of a SharedDataset in a worker process
+
+    Returns:
+    --------
+        A tuple of the arrays and the shared memory blocks to close
+    """
+    blocks, arrays = [], []
+    for name, shape in spec:
+        block = SharedMemory(name=name)
+        blocks.append(block)
+        arrays.append(np.ndarray(shape, np.float32, buffer=block.buf))
+    return arrays, blocks
+
+
+def run_trial(spec, num_train: int, vocab_length: int, trial: dict,
+              num_epochs: int, path: str, resume: str = None) -> dict:
+    """
+    Train one trial on a SharedDataset and score it on the held-out rows
+
+    Parameters:
+    -----------
+        spec (tuple): the spec of a SharedDataset
+        num_train (int): the number of leading rows to train on; the rest are
+            held out
+        vocab_length (int): the size of the embedding vocabulary
+        trial (dict): the trial's hyperparameters
+        num_epochs (int): the number of epochs to train for
+        path (str): a location to write the trial's weights to
+        resume (str): weights to continue training from, instead of
+            initializing new ones
+
+    Returns:
+    --------
+        A dictionary with the trial's training curves and held-out loss and
+        accuracy
+    """
+    import jax.numpy as jnp
+    from .dataset import Dataset
+    from .model import init_deep_fm
+    from .train import evaluate, train
+
+    # JAX may alias host memory, so copy the rows out before unmapping them
+    (X, Y), blocks = _attach(spec)
+    arrays = [np.array(a) for a in (X[:num_train], Y[:num_train], X[num_train:], Y[num_train:])]
+    del X, Y
+    for block in blocks:
+        block.close()
+    x_train, y_train, x_holdout, y_holdout = map(jnp.asarray, arrays)
+
+    if resume:
+        params, _ = load_parameters(resume)
+    else:
+        params = init_deep_fm(
+            vocab_length, x_train.shape[1], trial["num_factors"], tuple(trial["seeds"])
+        )
+
+    data = Dataset(x_train, y_train, trial["batch_size"], trial["seed"])
+    epochs, loss_list, acc_list, params = train(
+        params, data, num_epochs, path, lr=trial["lr"]
+    )
+    holdout_loss, holdout_acc = evaluate(params, x_holdout, y_holdout)
+
+    return {
+        "loss_list": loss_list,
+        "acc_list": acc_list,
+        "holdout_loss": holdout_loss,
+        "holdout_acc": holdout_acc,
+    }
+
+
+def search(
+    raw_data: tuple,
+    space: dict,
+    strategy: str = "grid",
+    num_trials: int = 10,
+    num_epochs: int = 10,
+    output_dir: str = "hyperparameter_search",
+    path: str = PARAMETERS_PATH,
+    max_workers: int = None,
+    holdout: float = 0.2,
+    eta: int = 3,
+    min_epochs: int = 1,
+    num_buckets: int = USER_BUCKETS,
+    seed: int = 0,
+) -> tuple:
+    """
+    Search the hyperparameters of pretraining a DeepFM
+
+    Parameters:
+    -----------
+        raw_data (tuple): a (features, user_ids, targets) tuple of arrays (see
+            s2s.utils.training_rows.read_training_rows)
+        space (dict): a list of values for some of the keys of DEFAULTS
+        strategy (str): "grid", "random", or "halving"
+        num_trials (int): the number of trials of "random" and "halving"
+        num_epochs (int): the number of epochs to train every trial for (the
+            most epochs of "halving")
+        output_dir (str): a directory to write trials.json and every trial's
+            weights to
+        path (str): a location to copy the best trial's weights to, or None
+        max_workers (int): the number of worker processes; defaults to the
+            number of CPUs
+        holdout (float): the share of the rows to score the trials on
+        eta (int): the factor "halving" multiplies the epochs by and divides
+            the trials by at every rung
+        min_epochs (int): the epochs of the first rung of "halving"
+        num_buckets (int): the number of user buckets
+        seed (int): a seed for sampling trials and picking the held-out rows
+
+    Returns:
+    --------
+        A tuple of the best trial's record and the list of all records
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {strategy!r}, expected one of {STRATEGIES}")
+
+    features, user_ids, targets = raw_data
+    X = tokens(features, user_ids, dtype=np.float32, num_buckets=num_buckets)
+    order = np.random.default_rng(seed).permutation(len(X))
+    X, Y = X[order], np.asarray(targets, dtype=np.float32)[order]
+    num_train = len(X) - max(1, int(len(X) * holdout))
+    if num_train < 1:
+        raise ValueError("Not enough rows to hold some out")
+
+    trials = grid(space) if strategy == "grid" else sample(space, num_trials, seed)
+    records = [
+        {
+            "trial": i,
+            "hyperparameters": trial,
+            "epochs": 0,
+            "loss_list": [],
+            "acc_list": [],
+            "weights": os.path.join(output_dir, f"trial_{i}.pkl"),
+        }
+        for i, trial in enumerate(trials)
+    ]
+    # the total epochs of the surviving trials after every rung
+    rungs = [min(min_epochs, num_epochs) if strategy == "halving" else num_epochs]
+    while rungs[-1] < num_epochs:
+        rungs.append(min(rungs[-1] * eta, num_epochs))
+
+    os.makedirs(output_dir, exist_ok=True)
+    vocab_length = vocab_size(X.shape[1] - 1, num_buckets)
+    alive = records
+    with SharedDataset(X, Y) as shared, ProcessPoolExecutor(
+        max_workers, mp_context=get_context("spawn")
+    ) as pool:
+        for rung, epochs in enumerate(rungs):
+            futures = [
+                pool.submit(
+                    run_trial, shared.spec, num_train, vocab_length,
+                    record["hyperparameters"], epochs - record["epochs"],
+                    record["weights"], record["weights"] if record["epochs"] else None,
+                )
+                for record in alive
+            ]
+            for record, future in zip(alive, futures):
+                result = future.result()
+                record["epochs"] = epochs
+                record["loss_list"] += result["loss_list"]
+                record["acc_list"] += result["acc_list"]
+                record["holdout_loss"] = result["holdout_loss"]
+                record["holdout_acc"] = result["holdout_acc"]
+                record["rung"] = rung
+
+            alive = sorted(alive, key=lambda record: record["holdout_loss"])
+            if rung < len(rungs) - 1:
+                alive = alive[:max(1, len(alive) // eta)]
+
+    best = alive[0]
+    with open(os.path.join(output_dir, "trials.json"), "w") as file:
+        json.dump({"best": best["trial"], "trials": records}, file, indent=2)
+
+    if path:
+        # the weights may be served from path, so they're replaced atomically
+        for source, target in [
+            (best["weights"], path),
+            (exported_path(best["weights"]), exported_path(path)),
+        ]:
+            with open(source, "rb") as file:
+                write_atomically(target, lambda copy: shutil.copyfileobj(file, copy))
+
+    return best, records
@@ -1,35 +1,39 @@
 import os
 import jax
-import optax
 import pickle
 import jaxlib
-from tqdm import tqdm
 import jax.numpy as jnp
-import matplotlib.pyplot as plt
 from .dataset import Dataset
+from .inference import MODEL_FORMAT, export_weights, exported_path, file_hash
+from .inference import load_parameters, write_atomically
 import pathlib
 
 from jax import value_and_grad, jit
 from .model import foward_deep_fm, foward_fm, foward_mlp, foward_embedding
 
 LR = 0.0001
+DROPOUT = 0.01
 WEIGHTS = None
+WEIGHTS_FORMAT = None
 TRAINING_CURVES_PATH = os.path.join(pathlib.Path(__file__).parent, "figures/training_curves.jpg")
 PARAMETERS_PATH = os.path.join(pathlib.Path(__file__).parent, "weights/parameters.pkl")
 
 
 def _ensure_weights():
     """Add the pretrained weights to the global scope"""
-    global WEIGHTS
+    global WEIGHTS, WEIGHTS_FORMAT
     if WEIGHTS is None:
-        with open(PARAMETERS_PATH, 'rb') as file:
-            WEIGHTS = pickle.load(file)
+        WEIGHTS, WEIGHTS_FORMAT = load_parameters(PARAMETERS_PATH)
 
 
 def save_outputs(epochs: list, loss_list: list, acc_list: list, params: list,
-                 path: str=PARAMETERS_PATH) -> None:
+                 path: str=PARAMETERS_PATH, model_format: int=MODEL_FORMAT) -> None:
     """
-    Save diagnostic plots and weights from training a DeepFM
+    Save diagnostic plots and weights from training a DeepFM, along with the
+    weights exported for the NumPy inference backend
+
+    The weights are pickled with their model format (see
+    ml.inference.load_parameters).
 
     Parameters:
     -----------
@@ -38,10 +42,14 @@ def save_outputs(epochs: list, loss_list: list, acc_list: list, params: list,
         acc_list (list): a list of accuracy for each epoch
         params (list): a list of model parameters
         path (str): a path for saving the weights
+        model_format (int): the format of the model, which finetuning keeps
     """    
     # Saving the weights
-    with open(path, 'wb') as file:
-        pickle.dump(params, file)
+    saved = {"format": model_format, "params": params}
+    write_atomically(path, lambda file: pickle.dump(saved, file))
+    export_weights(
+        params, exported_path(path), source_hash=file_hash(path), model_format=model_format
+    )
 
     # plot_training_curves(epochs, loss_list, acc_list)
 
@@ -56,6 +64,8 @@ def plot_training_curves(epochs: list, loss_list: list, acc_list: list) -> None:
         loss_list (list): a list of losses at each epoch
         acc_list (list): a list of accuracy for each epoch
     """
+    import matplotlib.pyplot as plt
+
     if os.path.isfile(TRAINING_CURVES_PATH):
         os.remove(TRAINING_CURVES_PATH)
 
@@ -67,9 +77,20 @@ def plot_training_curves(epochs: list, loss_list: list, acc_list: list) -> None:
     plt.savefig(TRAINING_CURVES_PATH)
     plt.close()
 
+def _losses(params: tuple, x: jaxlib.xla_extension.ArrayImpl,
+            y: jaxlib.xla_extension.ArrayImpl, dropout: float) -> tuple:
+    """
+    Get the binary cross-entropy and predicted probability of every example
+    """
+    ys = foward_deep_fm(params, x, dropout).reshape(-1)
+    ys = jnp.clip(ys, 1e-7, 1 - 1e-7)
+
+    return -(y * jnp.log(ys) + (1 - y) * jnp.log(1 - ys)), ys
+
+
 @jit
 def step(params: tuple, x: jaxlib.xla_extension.ArrayImpl,
-         y: jaxlib.xla_extension.ArrayImpl) -> tuple:
+         y: jaxlib.xla_extension.ArrayImpl, dropout: float=DROPOUT) -> tuple:
     """
     Make one update to a DeepFM
 
@@ -78,6 +99,7 @@ def step(params: tuple, x: jaxlib.xla_extension.ArrayImpl,
         params (list): a list of DeepFM parameters
         x (jaxlib.xla_extension.ArrayImpl): a minibatch of features
         y (jaxlib.xla_extension.ArrayImpl): a minibatch of targets
+        dropout (float): the proportion of MLP neurons to zero out
 
     Returns:
     --------
@@ -85,51 +107,264 @@ def step(params: tuple, x: jaxlib.xla_extension.ArrayImpl,
     """
 
     def loss_fn(params, x, y):
-        ys = foward_deep_fm(params, x)
-        ys = jnp.clip(ys, 1e-7, 1 - 1e-7)
-
-        return -jnp.mean(y * jnp.log(ys) + (1 - y) * jnp.log(1 - ys))
+        losses, ys = _losses(params, x, y, dropout)
+        return jnp.mean(losses), ys
 
-    loss, grads = value_and_grad(loss_fn)(params, x, y)
-    predicted_class = jnp.round(foward_deep_fm(params, x))
-    accuracy = jnp.mean(predicted_class == y)
+    (loss, ys), grads = value_and_grad(loss_fn, has_aux=True)(params, x, y)
+    accuracy = jnp.mean(jnp.round(ys) == y)
     return params, loss, grads, accuracy
 
 
+def evaluate(params: tuple, x: jaxlib.xla_extension.ArrayImpl,
+             y: jaxlib.xla_extension.ArrayImpl) -> tuple:
+    """
+    Get the loss and accuracy of a DeepFM on held-out data, without dropout
+
+    Returns:
+    --------
+        A tuple of the mean loss and the accuracy as floats
+    """
+    losses, ys = _losses(params, x, y, 0.0)
+    return float(jnp.mean(losses)), float(jnp.mean(jnp.round(ys) == y))
+
+
+def shard(x: jax.Array, num_devices: int) -> jax.Array:
+    """
+    Split a minibatch across devices, padding it with zero rows to a multiple
+    of num_devices rows
+
+    Returns:
+    --------
+        An array with a leading axis of length num_devices
+    """
+    rows = -(-x.shape[0] // num_devices)
+    padding = rows * num_devices - x.shape[0]
+    x = jnp.concatenate([x, jnp.zeros((padding,) + x.shape[1:], x.dtype)])
+    return x.reshape((num_devices, rows) + x.shape[1:])
+
+
+def parallel_step(solver, devices: list):
+    """
+    Build a data-parallel update of a DeepFM over devices
+
+    Every device computes the gradient of its shard's share of the minibatch
+    loss (the sum of its examples' losses divided by the minibatch size), and
+    the gradients are summed across devices, so every device applies the
+    gradient of the mean loss over the whole minibatch, like step.
+
+    Parameters:
+    -----------
+        solver (optax.GradientTransformation): the optimizer
+        devices (list): the devices to run on
+
+    Returns:
+    --------
+        A function of replicated params and solver state, sharded x, y, and
+        mask (which is 0 for padding rows), and the minibatch size, returning
+        the updated params and solver state, the loss, and the accuracy
+    """
+    import optax
+
+    def update(params, solver_state, x, y, mask, count, dropout):
+        def loss_fn(params):
+            losses, ys = _losses(params, x, y, dropout)
+            return jnp.sum(mask * losses) / count, ys
+
+        (loss, ys), grads = value_and_grad(loss_fn, has_aux=True)(params)
+        grads = jax.lax.psum(grads, "devices")
+        loss = jax.lax.psum(loss, "devices")
+        accuracy = jax.lax.psum(jnp.sum(mask * (jnp.round(ys) == y)), "devices") / count
+
+        updates, solver_state = solver.update(grads, solver_state)
+        params = optax.apply_updates(params, updates)
+        return params, solver_state, loss, accuracy
+
+    return jax.pmap(
+        update, axis_name="devices", in_axes=(0, 0, 0, 0, 0, None, None), devices=devices
+    )
+
+
+def validation_split(X: jax.Array, Y: jax.Array, fraction: float,
+                     seed: int=0) -> tuple:
+    """
+    Hold out a random share of the rows for validation
+
+    Parameters:
+    -----------
+        X (array): an array of features
+        Y (array): an array of targets
+        fraction (float): the share of the rows to hold out
+        seed (int): a seed for picking the held-out rows
+
+    Returns:
+    --------
+        A tuple of the (X, Y) training arrays and the (X, Y) validation
+        arrays, or None for the validation arrays if no rows are held out
+    """
+    num_validation = int(X.shape[0] * fraction)
+    if num_validation == 0:
+        return (X, Y), None
+
+    perm = jax.random.permutation(jax.random.key(seed), X.shape[0])
+    train_rows, validation_rows = perm[num_validation:], perm[:num_validation]
+    return (X[train_rows], Y[train_rows]), (X[validation_rows], Y[validation_rows])
+
+
+def _save_checkpoint(path: str, state: dict) -> None:
+    """
+    Write a training checkpoint, replacing the previous one atomically
+    """
+    with open(path + ".tmp", 'wb') as file:
+        pickle.dump(jax.device_get(state), file)
+    os.replace(path + ".tmp", path)
+
+
 def train(params: list, data: Dataset, num_epochs: int,
-          path: str=PARAMETERS_PATH):
+          path: str=PARAMETERS_PATH, num_devices: int=1,
+          dropout: float=DROPOUT, lr: float=LR, validation: tuple=None,
+          patience: int=None, checkpoint_path: str=None,
+          checkpoint_every: int=1, resume: bool=False,
+          model_format: int=MODEL_FORMAT):
     """
     Train a deep factorization machine, visualize the results, and save the weights
 
+    The loss and accuracy of every epoch are averaged over its minibatches.
+    With validation data, the validation loss is measured after every epoch;
+    with patience as well, training stops once the validation loss hasn't
+    improved for patience epochs, and the weights of the best epoch are kept.
+
+    With a checkpoint_path, the weights, optimizer state, and curves are
+    written there every checkpoint_every epochs, and resume=True continues an
+    interrupted run from its last checkpoint (the minibatch order after
+    resuming may differ); a run that had stopped early isn't trained further. The checkpoint is removed once training finishes.
+
+    With num_devices > 1, every minibatch is split across that many devices
+    and the gradients are all-reduced, which matches training on one device
+    with the same minibatches (up to dropout, which is drawn per device). To
+    train on several CPU cores, start Python with
+    XLA_FLAGS=--xla_force_host_platform_device_count=<cores>; num_devices is
+    capped at the number of local devices.
+
     Parameters:
     -----------
         params (list): a list of DeepFM parameters
         data (Dataset): a Dataset object
         num_epochs (int): the number of epochs to train for
         path (str): a location to write the weights to
+        num_devices (int): the number of devices to split minibatches across
+        dropout (float): the proportion of MLP neurons to zero out
+        lr (float): the learning rate
+        validation (tuple): (X, Y) arrays to measure the validation loss on
+        patience (int): the number of epochs without improvement of the
+            validation loss to stop after
+        checkpoint_path (str): a location to write checkpoints to
+        checkpoint_every (int): the number of epochs between checkpoints
+        resume (bool): whether to continue from the checkpoint at
+            checkpoint_path if there is one
+        model_format (int): the format of the model, saved with the weights
+            (see save_outputs)
 
     Returns:
     --------
         A tuple containing lists of epochs, loss, accuracy, and parameters
     """
-    epochs, loss_list, acc_list = [], [], []
-    solver = optax.adam(LR)
-    solver_state = solver.init(params)
-
-    for epoch in tqdm(range(num_epochs)):
+    import optax
+    from tqdm import tqdm
+
+    solver = optax.adam(lr)
+    state = {
+        "epoch": 0,
+        "params": params,
+        "solver_state": solver.init(params),
+        "loss_list": [],
+        "acc_list": [],
+        "val_loss_list": [],
+        "val_acc_list": [],
+        "best_params": params,
+        "best_val_loss": float("inf"),
+        "bad_epochs": 0,
+        "stopped": False,
+    }
+    if resume and checkpoint_path and os.path.isfile(checkpoint_path):
+        with open(checkpoint_path, 'rb') as file:
+            state = pickle.load(file)
+        print(f"Resuming from epoch {state['epoch']}")
+    params, solver_state = state["params"], state["solver_state"]
+
+    devices = jax.local_devices()[:max(num_devices, 1)]
+    if len(devices) > 1:
+        update = parallel_step(solver, devices)
+        params = jax.device_put_replicated(params, devices)
+        solver_state = jax.device_put_replicated(solver_state, devices)
+
+    def unreplicated(tree):
+        return jax.tree.map(lambda leaf: leaf[0], tree) if len(devices) > 1 else tree
+
+    # a run that stopped early is done, even if it was interrupted afterwards
+    last_epoch = state["epoch"] if state.get("stopped") else num_epochs
+    for epoch in tqdm(range(state["epoch"], last_epoch)):
+        loss_sum, acc_sum, rows = 0.0, 0.0, 0
         for x_batch, y_batch in data:
-            params, loss, grads, acc = step(params, x_batch, y_batch)
-            updates, solver_state = solver.update(grads, solver_state)
-            params = optax.apply_updates(params, updates)
-
-        epochs.append(epoch + 1)
-        loss_list.append(float(loss))  # Ensure loss is a float
-        acc_list.append(float(acc))    # Ensure accuracy is a float
-
-        if epoch % 10 == 0:
-            print(f"Epoch: {epoch}, Loss: {loss}, Accuracy: {acc}")
-
-    save_outputs(epochs, loss_list, acc_list, params, path)
+            if len(devices) > 1:
+                mask = jnp.ones(x_batch.shape[0], dtype=jnp.float32)
+                params, solver_state, loss, acc = update(
+                    params, solver_state, shard(x_batch, len(devices)),
+                    shard(y_batch, len(devices)), shard(mask, len(devices)),
+                    x_batch.shape[0], dropout,
+                )
+                loss, acc = loss[0], acc[0]
+            else:
+                params, loss, grads, acc = step(params, x_batch, y_batch, dropout)
+                updates, solver_state = solver.update(grads, solver_state)
+                params = optax.apply_updates(params, updates)
+
+            loss_sum += loss * x_batch.shape[0]
+            acc_sum += acc * x_batch.shape[0]
+            rows += x_batch.shape[0]
+
+        loss, acc = float(loss_sum / rows), float(acc_sum / rows)
+        state["epoch"] = epoch + 1
+        state["loss_list"].append(loss)
+        state["acc_list"].append(acc)
+
+        message = f"Epoch: {epoch}, Loss: {loss}, Accuracy: {acc}"
+        stop = False
+        if validation is not None:
+            val_loss, val_acc = evaluate(unreplicated(params), *validation)
+            state["val_loss_list"].append(val_loss)
+            state["val_acc_list"].append(val_acc)
+            message += f", Validation loss: {val_loss}, Validation accuracy: {val_acc}"
+
+            if val_loss < state["best_val_loss"]:
+                state["best_val_loss"] = val_loss
+                state["best_params"] = unreplicated(params)
+                state["bad_epochs"] = 0
+            else:
+                state["bad_epochs"] += 1
+                stop = patience is not None and state["bad_epochs"] >= patience
+
+        if epoch % 10 == 0 or stop:
+            print(message)
+
+        state["stopped"] = stop
+        if checkpoint_path and (state["epoch"] % checkpoint_every == 0 or stop):
+            state["params"] = unreplicated(params)
+            state["solver_state"] = unreplicated(solver_state)
+            _save_checkpoint(checkpoint_path, state)
+
+        if stop:
+            print(f"Stopping early: no improvement in {patience} epochs")
+            break
+
+    params = unreplicated(params)
+    if validation is not None and patience is not None and state["epoch"] > 0:
+        params = state["best_params"]
+
+    epochs = list(range(1, state["epoch"] + 1))
+    loss_list, acc_list = state["loss_list"], state["acc_list"]
+    save_outputs(epochs, loss_list, acc_list, params, path, model_format)
+    if checkpoint_path and os.path.isfile(checkpoint_path):
+        os.remove(checkpoint_path)
     return epochs, loss_list, acc_list, params
 
 
@@ -17,5 +17,9 @@ admin.site.register(SuggestionResults)
 admin.site.register(PanelEvent)
 admin.site.register(PanelUserPreferences)
 admin.site.register(PanelScenario)
+admin.site.register(TrainingRow)
+admin.site.register(ZipCode)
+admin.site.register(EmailMessage)
+admin.site.register(OutboxEmail)
 class ApplicationTokenAdmin(admin.ModelAdmin):
     list_display = ('name', 'token', 'created_at')
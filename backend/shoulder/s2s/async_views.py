@@ -0,0 +1,66 @@
+"""
+Async views of the endpoints that wait on external services, so a slow
+upstream doesn't hold a worker thread under an ASGI server (see
+config/gunicorn/asgi.py). DRF views are sync only, so these are plain Django
+views; their calls go through the pooled clients of s2s.utils.upstream.
+"""
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .utils.upstream import geocode_async, upstream_view
+from .utils.zipcodes import UpstreamError, lookup_zipcodes, parse_zip_codes
+
+MAX_ZIP_CODES = 100
+
+
+@require_GET
+@upstream_view
+async def zipcodes(request):
+    """
+    Looks up the city and state of zip codes (the zip_code parameter, up to
+    MAX_ZIP_CODES codes separated by commas), and returns them in the
+    zipcodestack API's format: {"query": {"codes": [...], "country": "us"},
+    "results": {code: [...]}}, with an empty list of results if none of the
+    codes exist.
+    """
+    codes = parse_zip_codes(request.GET.get("zip_code", ""))
+    if not codes:
+        return JsonResponse({"error": "Zip code not provided"}, status=400)
+    if len(codes) > MAX_ZIP_CODES:
+        return JsonResponse(
+            {"error": f"At most {MAX_ZIP_CODES} zip codes per request"}, status=400
+        )
+
+    try:
+        results = await lookup_zipcodes(codes)
+    except UpstreamError as e:
+        return JsonResponse(e.data, status=e.status, safe=False)
+
+    results = {code: rows for code, rows in results.items() if rows}
+    return JsonResponse(
+        {"query": {"codes": codes, "country": "us"}, "results": results or []}
+    )
+
+
+@require_GET
+@upstream_view
+async def geocode(request):
+    """
+    Geocodes an address (the address parameter), i.e. to validate it before
+    submitting a form. Requires an application token.
+    """
+    # verified by ApplicationTokenMiddleware
+    if not request.app_token_valid:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."}, status=403
+        )
+
+    address = request.GET.get("address")
+    if not address:
+        return JsonResponse({"error": "Address not provided"}, status=400)
+
+    result = await geocode_async(address)
+    if not result:
+        return JsonResponse({"error": "Invalid address"}, status=404)
+    return JsonResponse(result)
@@ -13,3 +13,7 @@ from s2s.db_models.suggestion_results import SuggestionResults
 from s2s.db_models.panel_events import PanelEvent
 from s2s.db_models.panel_user_preferences import PanelUserPreferences
 from s2s.db_models.panel_scenarios import PanelScenario
+from s2s.db_models.training_row import TrainingRow
+from s2s.db_models.zipcode import ZipCode
+from s2s.db_models.email_message import EmailMessage
+from s2s.db_models.outbox_email import OutboxEmail
@@ -32,6 +32,15 @@ class Availability(models.Model):
         default=1
     )
 
+    class Meta:
+        # one row per hour of the week; also serves the lookups by user, day,
+        # and hour
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user_id", "day_of_week", "hour"], name="unique_availability_slot"
+            ),
+        ]
+
     def __str__(self) -> str:
         return 'User {}, Day {}, Hour {} Available {}'.format(self.user_id, self.day_of_week, self.hour, self.available)
  
@@ -0,0 +1,36 @@
+from django.db import models
+from .event import Event
+
+class EmailMessage(models.Model):
+    '''
+    Creates a Django Model holding the rendered subject and body of an email,
+    shared by every OutboxEmail row it is sent to, so a message sent to many
+    users is stored once. The RSVP confirmation of an event is rendered once
+    and reused for every attendee (see s2s.utils.event_emails).
+
+    Table Columns:
+        kind (str): the kind of email, i.e. "weekly" or "event"
+        subject (str): subject line
+        body (str): plain text body
+        event_id (fk): the event of an event confirmation, until the event
+            changes and the message is rendered again
+        created_at: time the message was rendered
+    '''
+    kind = models.CharField(max_length=16)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    event_id = models.ForeignKey(Event, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # one current message of every kind per event
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "event_id"],
+                condition=models.Q(event_id__isnull=False),
+                name="unique_event_message",
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} email: {self.subject}'
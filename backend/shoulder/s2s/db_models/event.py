@@ -41,6 +41,12 @@ class Event(models.Model):
             MinValueValidator(2),
             MaxValueValidator(50)])
 
+    class Meta:
+        # events are listed and filtered by date
+        indexes = [
+            models.Index(fields=["datetime"], name="event_datetime"),
+        ]
+
     def __str__(self) -> str:
         return 'Event name {} (DateTime {}) - Created By {}'.format(
             self.title, self.datetime, self.created_by)
\ No newline at end of file
@@ -0,0 +1,52 @@
+from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
+from .email_message import EmailMessage
+
+class OutboxEmail(models.Model):
+    '''
+    Creates a Django Model holding the emails waiting to be sent, one row per
+    recipient, so sends survive a crash of the process that queued them and
+    failed sends are retried (see s2s.utils.email_outbox).
+
+    Table Columns:
+        message_id (fk): the message sent
+        user_id (fk): the recipient, whose Profile.last_email_sent is updated
+            once the email is sent
+        recipient (str): email address of the recipient
+        status (str): "pending" until the email is sent ("sent") or given up
+            on ("failed")
+        attempts (int): number of failed attempts
+        next_attempt_at (datetime): time the email is next due; also moved
+            forward while a worker sends it, so no other worker does
+        last_error (str): error of the last failed attempt
+        sent_at (datetime): time the email was sent
+        created_at: time the email was queued
+    '''
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    ALLOWED_STATUSES = (
+        (PENDING, PENDING),
+        (SENT, SENT),
+        (FAILED, FAILED),
+    )
+
+    message_id = models.ForeignKey(EmailMessage, on_delete=models.CASCADE)
+    user_id = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    recipient = models.EmailField()
+    status = models.CharField(choices=ALLOWED_STATUSES, max_length=7, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # the workers' lookup of due emails
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due"),
+        ]
+
+    def __str__(self):
+        return f'Email {self.message_id_id} to {self.recipient} ({self.status})'
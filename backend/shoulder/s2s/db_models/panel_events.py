@@ -18,8 +18,11 @@ class PanelEvent(models.Model):
             cateogry) or 1 (correct category)
         [num_participant ranges] (bool): max number of event participants 
             range; 0 (incorrect cateogry) or 1 (correct category)
+        packed_features (bytes): the boolean columns packed into a bitmask,
+            one bit per column in field order (see s2s.utils.panelization)
     '''
     event_id = models.ForeignKey(Event, on_delete=models.CASCADE)
+    packed_features = models.BinaryField(null=True, blank=True, editable=False)
 
     hobby_category_travel = models.BooleanField(default=False)
     hobby_category_arts_and_culture = models.BooleanField(default=False)
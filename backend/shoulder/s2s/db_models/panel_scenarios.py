@@ -21,9 +21,12 @@ class PanelScenario(models.Model):
             range; 0 (incorrect cateogry) or 1 (correct category)
         attended_event (bool): indicates if user attended/would attend event 
             0 (not attended) or 1 (attended)
+        packed_features (bytes): the boolean columns packed into a bitmask,
+            one bit per column in field order (see s2s.utils.panelization)
     '''
     scenario_id = models.ForeignKey(Scenarios, on_delete=models.CASCADE)
     user_id = models.ForeignKey(User, on_delete=models.CASCADE)
+    packed_features = models.BinaryField(null=True, blank=True, editable=False)
 
     hobby_category_travel = models.BooleanField(default=False)
     hobby_category_arts_and_culture = models.BooleanField(default=False)
@@ -22,9 +22,12 @@ class PanelUserPreferences(models.Model):
             1 (preferred)
         [preferred hobby categories] (bool): hobby categories user prefers;
             0 (not preferred) or 1 (preferred)
+        packed_features (bytes): the boolean columns packed into a bitmask,
+            one bit per column in field order (see s2s.utils.panelization)
     '''
     # User Preferences
     user_id = models.ForeignKey(User, on_delete=models.CASCADE)
+    packed_features = models.BinaryField(null=True, blank=True, editable=False)
     
     # availability
     pref_monday_early_morning = models.BooleanField(default=False)
@@ -18,4 +18,17 @@ class SuggestionResults(models.Model):
     event_id = models.ForeignKey(Event, on_delete=models.CASCADE)
     event_date = models.DateTimeField()
     probability_of_attendance = models.FloatField(
-        validators=[MinValueValidator(0.0), MaxValueValidator(1.0)])
\ No newline at end of file
+        validators=[MinValueValidator(0.0), MaxValueValidator(1.0)])
+
+    class Meta:
+        # one suggestion per user and event, so suggestions can be upserted in
+        # bulk; the index serves a user's suggestions by probability
+        constraints = [
+            models.UniqueConstraint(fields=["user_id", "event_id"], name="unique_suggestion"),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user_id", "-probability_of_attendance"],
+                name="suggestion_user_probability",
+            ),
+        ]
\ No newline at end of file
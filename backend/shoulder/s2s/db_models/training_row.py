@@ -0,0 +1,46 @@
+from django.db import models
+from django.contrib.auth.models import User
+from .event import Event
+from .panel_scenarios import PanelScenario
+from .user_events import UserEvents
+
+class TrainingRow(models.Model):
+    '''
+    Creates a Django Model holding fully featurized rows for training the ML
+    model, so training reads one table instead of re-joining the panel tables.
+    Rows are kept current by the receivers in s2s/signals.py and can be
+    rebuilt with the training_rows_m command.
+
+    Table Columns:
+        user_id (fk): user id
+        source (str): "scenario" for pretraining rows built from a
+            PanelScenario row, "event" for finetuning rows built from a
+            UserEvents row
+        scenario_panel_id (fk): the PanelScenario row of a scenario row
+        user_event_id (fk): the UserEvents row of an event row
+        event_id (fk): the event of an event row
+        event_date (datetime): datetime of the event of an event row
+        features (bytes): the model features packed into a bitmask, one bit
+            per feature in sorted feature name order
+        attended_event (bool): indicates if user attended/would attend event
+            0 (not attended) or 1 (attended)
+    '''
+    ALLOWED_SOURCES = (
+        ("scenario", "scenario"),
+        ("event", "event"),
+    )
+
+    user_id = models.ForeignKey(User, on_delete=models.CASCADE)
+    source = models.CharField(choices=ALLOWED_SOURCES, max_length=8)
+    scenario_panel_id = models.ForeignKey(
+        PanelScenario, on_delete=models.CASCADE, null=True, blank=True)
+    user_event_id = models.ForeignKey(
+        UserEvents, on_delete=models.CASCADE, null=True, blank=True)
+    event_id = models.ForeignKey(
+        Event, on_delete=models.CASCADE, null=True, blank=True)
+    event_date = models.DateTimeField(null=True, blank=True)
+    features = models.BinaryField()
+    attended_event = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f'User {self.user_id_id} {self.source} training row'
@@ -33,6 +33,12 @@ class UserEvents(models.Model):
     rsvp = models.CharField(choices=ALLOWED_RSVP, max_length=3, null=True, blank=True)
     attended = models.BooleanField(default=False)
 
+    class Meta:
+        # one RSVP per user and event
+        constraints = [
+            models.UniqueConstraint(fields=["user_id", "event_id"], name="unique_user_event"),
+        ]
+
     def __str__(self) -> str:
         return 'User: {}, Event: {}'.format(
             self.user_id, self.event_id)
\ No newline at end of file
@@ -0,0 +1,22 @@
+from django.db import models
+
+class ZipCode(models.Model):
+    '''
+    Creates a Django Model caching the zipcodestack API's results of zip codes,
+    which never change, so the API is only called for codes not seen before.
+    Rows are written by s2s.utils.zipcodes on a miss, or loaded from a
+    GeoNames postal code file by the load_zipcodes_m command.
+
+    Table Columns:
+        zip_code (str): the zip code
+        results (json): the API's results of the zip code, a list of
+            dictionaries with the "city", "state", "state_code", etc. of every
+            place the code belongs to; empty if the code doesn't exist
+        created_at: time the code was looked up or loaded
+    '''
+    zip_code = models.CharField(max_length=5, unique=True)
+    results = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.zip_code
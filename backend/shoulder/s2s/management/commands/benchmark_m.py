@@ -0,0 +1,79 @@
+"""
+Command for benchmarking the recommender offline.
+
+Trains the ML model on synthetic rows laid out like the training rows and
+writes its preprocessing, training, and inference throughput, peak memory,
+and held-out ranking quality to a JSON file (see ml.benchmark). The model's
+weights are not touched. With --compare, the measurements are compared with
+the results of an earlier run, i.e. one from another commit.
+
+To use this command, run:
+    python manage.py benchmark_m [--output benchmark.json] [--compare previous.json]
+"""
+
+import json
+from django.core.management.base import BaseCommand
+from s2s.utils.panelization import FEATURE_COLUMNS
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the ML model on synthetic data."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            type=str,
+            default="benchmark.json",
+            help="JSON file to write the results to",
+        )
+        parser.add_argument(
+            "--compare",
+            type=str,
+            default=None,
+            help="JSON file of an earlier run to compare the results with",
+        )
+        parser.add_argument("--rows", type=int, default=20000, help="Number of synthetic rows")
+        parser.add_argument("--users", type=int, default=500, help="Number of synthetic users")
+        parser.add_argument("--events", type=int, default=200, help="Number of synthetic events")
+        parser.add_argument("--epochs", type=int, default=5, help="Epochs to train for")
+        parser.add_argument(
+            "--batch-sizes",
+            type=int,
+            nargs="+",
+            default=None,
+            help="Inference batch sizes to measure",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **kwargs):
+        try:
+            from ml.ml.benchmark import BATCH_SIZES, compare, run_benchmark
+
+            results = run_benchmark(
+                FEATURE_COLUMNS,
+                num_rows=kwargs["rows"],
+                num_users=kwargs["users"],
+                num_events=kwargs["events"],
+                num_epochs=kwargs["epochs"],
+                batch_sizes=kwargs["batch_sizes"] or BATCH_SIZES,
+                seed=kwargs["seed"],
+                output=kwargs["output"],
+            )
+
+            if kwargs["compare"]:
+                with open(kwargs["compare"]) as file:
+                    previous = json.load(file)
+                for key, before, after, change in compare(previous, results):
+                    change = "n/a" if change is None else f"{change:+.1%}"
+                    self.stdout.write(f"{key}: {before} -> {after} ({change})")
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Benchmark completed successfully. Results written to {kwargs['output']}"
+                )
+            )
+
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR("Error running the benchmark: {}".format(str(e)))
+            )
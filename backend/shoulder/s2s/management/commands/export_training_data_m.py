@@ -0,0 +1,67 @@
+"""
+Command for snapshotting the training data of the ML model into columnar files,
+so the model can be trained on another machine without querying the database.
+
+The pretraining rows are written to pretraining.<format> and the finetuning
+rows to finetuning.<format> in the output directory; load them with
+ml.recommendation.read_training_file or load_training_file.
+
+To use this command, run:
+    python manage.py export_training_data_m <output directory> [--format parquet]
+"""
+
+import os
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from s2s.utils.panelization import BATCH_SIZE
+from s2s.utils.training_rows import EVENT, SCENARIO, export_training_rows
+
+
+class Command(BaseCommand):
+    help = "Exports the training data to Arrow IPC or Parquet files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output", type=str, help="Directory to write the files to"
+        )
+        parser.add_argument(
+            "--format",
+            type=str,
+            default="arrow",
+            choices=["arrow", "parquet"],
+            help="Arrow IPC files can be memory-mapped; Parquet files are smaller",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of rows per record batch / row group",
+        )
+        parser.add_argument(
+            "--include-past-events",
+            action="store_true",
+            help="Also export finetuning rows of events that already happened",
+        )
+
+    def handle(self, *args, **kwargs):
+        output = kwargs["output"]
+        extension = kwargs["format"]
+        batch_size = kwargs["batch_size"]
+        since = None if kwargs["include_past_events"] else timezone.now()
+
+        try:
+            os.makedirs(output, exist_ok=True)
+            for name, source, source_since in [
+                ("pretraining", SCENARIO, None),
+                ("finetuning", EVENT, since),
+            ]:
+                path = os.path.join(output, f"{name}.{extension}")
+                written = export_training_rows(path, source, source_since, batch_size)
+                self.stdout.write(f"Wrote {written} {name} rows to {path}")
+
+            self.stdout.write(self.style.SUCCESS("Training data exported successfully"))
+
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR("Error exporting training data: {}".format(str(e)))
+            )
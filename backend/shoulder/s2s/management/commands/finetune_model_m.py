@@ -1,18 +1,58 @@
 """
 Custom migration command for fine-tuning the ML model.
+
+With --devices N, training minibatches are split across N CPU cores (see
+ml.train.train). Training checkpoints after every epoch; after an
+interruption, rerun with --resume to continue from the last checkpoint (and
+without pretraining again if pretraining had finished). With
+--profile [sampling|cprofile], the run is profiled, including JAX compilation
+times, and the profile is written to the PROFILING_DIR setting (see
+s2s.utils.profiling).
 """
 
+import os
 from django.core.management.base import BaseCommand
 from s2s.views import SuggestionResultsViewSet
+from s2s.utils.profiling import add_profile_argument, command_profile
 import datetime
 
 
 class Command(BaseCommand):
     help = "Fine-tunes the ML model."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--devices",
+            type=int,
+            default=1,
+            help="Number of CPU cores to split training minibatches across",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue an interrupted run from its last checkpoint",
+        )
+        add_profile_argument(parser)
+
     def handle(self, *args, **kwargs):
+        num_devices = kwargs["devices"]
+        if num_devices > 1:
+            # XLA reads this when JAX first initializes its CPU backend, which
+            # the lazily imported ML code hasn't done yet
+            os.environ["XLA_FLAGS"] = " ".join(
+                [
+                    os.environ.get("XLA_FLAGS", ""),
+                    f"--xla_force_host_platform_device_count={num_devices}",
+                ]
+            ).strip()
+
         viewset = SuggestionResultsViewSet()
-        result = viewset.perform_finetune()
+        with command_profile("finetune_model", kwargs) as profile:
+            result = viewset.perform_finetune(
+                num_devices=num_devices, resume=kwargs["resume"]
+            )
+        if profile:
+            self.stdout.write(f"Profile written to {', '.join(profile.paths)}")
         if "error" in result:
             self.stderr.write(self.style.ERROR(f"Error: {result['error']}"))
         else:
@@ -0,0 +1,90 @@
+"""
+Command for searching the hyperparameters of pretraining the ML model.
+
+The pretraining rows are read from the database once and shared with the
+worker processes that run the trials (see ml.search). The weights of the best
+trial replace the model's weights unless --keep-weights is given.
+
+To use this command, run:
+    python manage.py hyperparameter_search_m --strategy halving --lr 0.001 0.0001 --num-factors 5 10
+"""
+
+from django.core.management.base import BaseCommand
+from s2s.utils.training_rows import SCENARIO, read_training_rows
+
+
+class Command(BaseCommand):
+    help = "Searches the hyperparameters of pretraining the ML model."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--strategy",
+            type=str,
+            default="grid",
+            choices=["grid", "random", "halving"],
+            help="How to pick the trials",
+        )
+        parser.add_argument("--num-factors", type=int, nargs="+", default=[5])
+        parser.add_argument("--batch-size", type=int, nargs="+", default=[32])
+        parser.add_argument("--lr", type=float, nargs="+", default=[0.0001])
+        parser.add_argument("--seed", type=int, nargs="+", default=[1994])
+        parser.add_argument(
+            "--trials", type=int, default=10, help="Number of random/halving trials"
+        )
+        parser.add_argument(
+            "--epochs", type=int, default=10, help="Epochs to train every trial for"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None, help="Number of worker processes"
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            default="hyperparameter_search",
+            help="Directory to write the trial log and weights to",
+        )
+        parser.add_argument(
+            "--keep-weights",
+            action="store_true",
+            help="Don't replace the model's weights with the best trial's",
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            from ml.ml.search import PARAMETERS_PATH, search
+
+            raw_data = read_training_rows(SCENARIO)
+            space = {
+                "num_factors": kwargs["num_factors"],
+                "batch_size": kwargs["batch_size"],
+                "lr": kwargs["lr"],
+                "seed": kwargs["seed"],
+            }
+            best, records = search(
+                raw_data,
+                space,
+                strategy=kwargs["strategy"],
+                num_trials=kwargs["trials"],
+                num_epochs=kwargs["epochs"],
+                output_dir=kwargs["output"],
+                path=None if kwargs["keep_weights"] else PARAMETERS_PATH,
+                max_workers=kwargs["workers"],
+            )
+
+            for record in records:
+                self.stdout.write(
+                    f"Trial {record['trial']}: {record['hyperparameters']}, "
+                    f"{record['epochs']} epochs, "
+                    f"held-out loss {record['holdout_loss']:.4f}, "
+                    f"held-out accuracy {record['holdout_acc']:.4f}"
+                )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Hyperparameter search completed successfully. Best trial: {best['trial']}"
+                )
+            )
+
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR("Error searching hyperparameters: {}".format(str(e)))
+            )
@@ -0,0 +1,62 @@
+"""
+Command for creating synthetic users and events to load test the API with.
+
+Every user gets a profile, onboarding responses, availability, and scenario
+responses, and the events get RSVPs and suggestion results (see
+s2s.utils.load_test). Addresses are placed near Chicago without geocoding.
+Rerunning the command adds more users; --clear removes the synthetic users
+and events instead.
+
+To use this command, run:
+    python manage.py load_test_data_m --users 1000 --events 200
+"""
+
+from django.core.management.base import BaseCommand
+from s2s.utils.load_test import clear_load_test_data, generate_load_test_data
+
+
+class Command(BaseCommand):
+    help = "Creates synthetic users and events for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100, help="Number of users to create")
+        parser.add_argument("--events", type=int, default=50, help="Number of events to create")
+        parser.add_argument(
+            "--scenarios", type=int, default=5, help="Scenario responses per user"
+        )
+        parser.add_argument("--rsvps", type=int, default=3, help="Events every user RSVPed to")
+        parser.add_argument(
+            "--suggestions", type=int, default=20, help="Suggestion results per user"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete the synthetic users and events instead",
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            if kwargs["clear"]:
+                num_users = clear_load_test_data()
+                self.stdout.write(
+                    self.style.SUCCESS(f"Deleted {num_users} load test users successfully")
+                )
+                return
+
+            counts = generate_load_test_data(
+                kwargs["users"],
+                kwargs["events"],
+                num_scenarios=kwargs["scenarios"],
+                num_rsvps=kwargs["rsvps"],
+                num_suggestions=kwargs["suggestions"],
+                seed=kwargs["seed"],
+            )
+            for table, count in counts.items():
+                self.stdout.write(f"{table}: {count}")
+            self.stdout.write(self.style.SUCCESS("Load test data created successfully"))
+
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR("Error creating load test data: {}".format(str(e)))
+            )
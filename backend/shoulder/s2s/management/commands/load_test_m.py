@@ -0,0 +1,87 @@
+"""
+Command for load testing the API with the users of load_test_data_m.
+
+Sends a seeded mix of submit_onboarding, suggestionresults/get_suggestions,
+userevents/upcoming_past_events, and availability/bulk_update requests from
+--concurrency threads and reports the p50/p95/p99 latency and the database
+queries per request of every endpoint (see s2s.utils.load_test). Without
+--base-url the requests run in this process through the Django test client;
+with it they go to a running server (started with GEOCODE_STUB=1), and the
+query counts are read from the X-DB-Queries response header.
+
+To use this command, run:
+    python manage.py load_test_m --requests 1000 --concurrency 8 [--base-url http://localhost:8000 --app-token <token>] [--output load_test.json]
+"""
+
+import json
+from django.core.management.base import BaseCommand
+from s2s.utils.load_test import ENDPOINTS, run_load_test
+
+
+class Command(BaseCommand):
+    help = "Load tests the API and reports latency percentiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Number of requests")
+        parser.add_argument(
+            "--concurrency", type=int, default=4, help="Number of concurrent clients"
+        )
+        parser.add_argument(
+            "--mix",
+            type=str,
+            nargs="+",
+            default=None,
+            help=f"Endpoint weights as name=weight, of {', '.join(ENDPOINTS)}",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--base-url", type=str, default=None, help="URL of a running server"
+        )
+        parser.add_argument(
+            "--app-token", type=str, default=None, help="Application token of the server"
+        )
+        parser.add_argument(
+            "--output", type=str, default=None, help="JSON file to write the report to"
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            mix = None
+            if kwargs["mix"]:
+                mix = {
+                    name: float(weight)
+                    for name, weight in (item.split("=") for item in kwargs["mix"])
+                }
+
+            report = run_load_test(
+                kwargs["requests"],
+                kwargs["concurrency"],
+                mix=mix,
+                seed=kwargs["seed"],
+                base_url=kwargs["base_url"],
+                token=kwargs["app_token"],
+            )
+
+            for name, summary in report.items():
+                queries = summary["queries_per_request"]
+                self.stdout.write(
+                    f"{name}: {summary['requests']} requests, {summary['errors']} errors, "
+                    f"p50 {summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, "
+                    f"p99 {summary['p99_ms']:.1f} ms, "
+                    f"queries/request {'n/a' if queries is None else f'{queries:.1f}'}"
+                )
+            if kwargs["output"]:
+                with open(kwargs["output"], "w") as file:
+                    json.dump(report, file, indent=2, sort_keys=True)
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Load test completed successfully: "
+                    f"{report['all']['requests_per_second']:.1f} requests/s"
+                )
+            )
+
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR("Error running the load test: {}".format(str(e)))
+            )
@@ -0,0 +1,84 @@
+"""
+Command for loading zip codes into the ZipCode table from a GeoNames postal
+code file (i.e. US.txt of https://download.geonames.org/export/zip/US.zip),
+so lookups of the /api/zipcodes/ endpoint don't need the zipcodestack API.
+
+To use this command, run:
+    python manage.py load_zipcodes_m path/to/US.txt
+"""
+
+import csv
+
+from django.core.management.base import BaseCommand
+from s2s.db_models import ZipCode
+from s2s.utils.zipcodes import ZIP_CODE, cache
+
+# the columns of a GeoNames postal code file
+COLUMNS = (
+    "country_code", "postal_code", "city", "state", "state_code", "province",
+    "province_code", "community", "community_code", "latitude", "longitude",
+    "accuracy",
+)
+
+
+def read_geonames(path):
+    """
+    Reads a GeoNames postal code file into results like the zipcodestack
+    API's.
+
+    Inputs:
+        path (str): path of the file
+
+    Returns: a dictionary of zip codes to their list of results
+    """
+    results = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            row = dict(zip(COLUMNS, row))
+            if not ZIP_CODE.match(row.get("postal_code", "")):
+                continue
+            results.setdefault(row["postal_code"], []).append({
+                "postal_code": row["postal_code"],
+                "country_code": row["country_code"],
+                "latitude": float(row["latitude"]),
+                "longitude": float(row["longitude"]),
+                "city": row["city"],
+                "state": row["state"],
+                "state_code": row["state_code"],
+                "province": row["province"],
+                "province_code": row["province_code"],
+            })
+    return results
+
+
+class Command(BaseCommand):
+    help = "Loads zip codes into the ZipCode table from a GeoNames postal code file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=str, help="Path of the GeoNames file")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of zip codes written per bulk query",
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            results = read_geonames(kwargs["path"])
+            ZipCode.objects.bulk_create(
+                [ZipCode(zip_code=code, results=rows) for code, rows in results.items()],
+                batch_size=kwargs["batch_size"],
+                update_conflicts=True,
+                unique_fields=["zip_code"],
+                update_fields=["results"],
+            )
+            cache.clear()
+            self.stdout.write(
+                self.style.SUCCESS(f"Zip codes loaded successfully: {len(results)} codes")
+            )
+
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR("Error loading zip codes: {}".format(str(e)))
+            )
@@ -0,0 +1,70 @@
+"""
+Command for rebuilding the panel tables in bulk, i.e. after a change to the
+panel schema or to the panelization rules.
+
+To use this command, run:
+    python manage.py panels_m [events|scenarios|preferences|all]
+"""
+
+from django.core.management.base import BaseCommand
+from s2s.db_models import Event, Onboarding, Scenarios
+from s2s.utils.panelization import (
+    BATCH_SIZE,
+    save_event_panels,
+    save_scenario_panels,
+    save_user_preference_panels,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the panel tables from events, scenarios, and onboarding data."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "panel",
+            type=str,
+            nargs="?",
+            default="all",
+            choices=["events", "scenarios", "preferences", "all"],
+            help="Which panel table to rebuild",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of rows written per bulk query",
+        )
+
+    def handle(self, *args, **kwargs):
+        panel = kwargs["panel"]
+        batch_size = kwargs["batch_size"]
+
+        try:
+            if panel in ["events", "all"]:
+                created, updated = save_event_panels(Event.objects.all(), batch_size)
+                self.stdout.write(
+                    f"Event panels: {created} created, {updated} updated"
+                )
+
+            if panel in ["scenarios", "all"]:
+                created, deleted = save_scenario_panels(
+                    Scenarios.objects.all(), batch_size
+                )
+                self.stdout.write(
+                    f"Scenario panels: {created} created, {deleted} replaced"
+                )
+
+            if panel in ["preferences", "all"]:
+                created, updated = save_user_preference_panels(
+                    Onboarding.objects.filter(onboarded=True), batch_size
+                )
+                self.stdout.write(
+                    f"User preference panels: {created} created, {updated} updated"
+                )
+
+            self.stdout.write(self.style.SUCCESS("Panels rebuilt successfully"))
+
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR("Error rebuilding panels: {}".format(str(e)))
+            )
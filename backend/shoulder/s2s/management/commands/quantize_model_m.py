@@ -0,0 +1,42 @@
+"""
+Command for exporting reduced-precision copies of the ML model's weights and
+reporting how they compare against full precision.
+
+The comparison runs on the rows held out from the model's last training
+(the validation share of the finetuning rows, recorded next to the weights by
+the finetune endpoint), which the model never trained on. Serve a copy by
+setting ML_INFERENCE_PRECISION to float16 or int8.
+
+To use this command, run:
+    python manage.py quantize_model_m
+"""
+
+from django.core.management.base import BaseCommand
+from ml.ml.inference import PRECISIONS, load_holdout, quantization_report
+
+
+class Command(BaseCommand):
+    help = "Exports float16/int8 model weights and reports their accuracy."
+
+    def handle(self, *args, **kwargs):
+        try:
+            X, y = load_holdout()
+            report = quantization_report(X, y)
+
+            self.stdout.write(f"Held-out rows: {len(X)}")
+            for precision in PRECISIONS:
+                result = report[precision]
+                self.stdout.write(
+                    f"{precision}: {result['bytes']} bytes, "
+                    f"max abs error {result['max_abs_error']:.6f}, "
+                    f"mean abs error {result['mean_abs_error']:.6f}, "
+                    f"agreement {result['agreement']:.4f}, "
+                    f"accuracy {result['accuracy']:.4f}"
+                )
+
+            self.stdout.write(self.style.SUCCESS("Quantized weights exported successfully"))
+
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR("Error quantizing model weights: {}".format(str(e)))
+            )
@@ -0,0 +1,89 @@
+"""
+Command for benchmarking the hottest database lookups.
+
+Prints the query plan and the p50/p95 time of every query in
+s2s.utils.query_plans.HOT_QUERIES. With --before-after, it first migrates s2s
+back to before the composite indexes and unique constraints (0007), measures,
+migrates forward again to the latest migration, and measures once more.
+Migrating back drops the tables of the migrations after 0008 with their data,
+so it refuses to unless --force is given. Seed the database first, i.e. with
+load_test_data_m, and don't run it against production.
+
+To use this command, run:
+    python manage.py query_plans_m [--before-after [--force]] [--repeat 50] [--output query_plans.json]
+"""
+
+import json
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from s2s.utils.query_plans import (
+    AFTER_MIGRATION,
+    BEFORE_MIGRATION,
+    leaf_migration,
+    measure_queries,
+)
+
+
+class Command(BaseCommand):
+    help = "Prints the plans and timings of the hottest database lookups."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before-after",
+            action="store_true",
+            help="Measure before and after migration 0008 (migrates s2s back and forth)",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="With --before-after, migrate back even if it drops the tables of later migrations",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=50, help="Number of runs of every query"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", type=str, default=None, help="JSON file to write the results to"
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            report = {}
+            if kwargs["before_after"]:
+                leaf = leaf_migration()
+                if leaf != AFTER_MIGRATION and not kwargs["force"]:
+                    raise CommandError(
+                        f"{leaf} is the latest migration of s2s, so migrating back to "
+                        f"{BEFORE_MIGRATION} would drop the tables (and data) of the "
+                        "migrations after 0008; pass --force to do so anyway"
+                    )
+                call_command("migrate", "s2s", BEFORE_MIGRATION, verbosity=0)
+                try:
+                    report["before"] = measure_queries(kwargs["repeat"], kwargs["seed"])
+                finally:
+                    call_command("migrate", "s2s", leaf, verbosity=0)
+                report["after"] = measure_queries(kwargs["repeat"], kwargs["seed"])
+            else:
+                report["current"] = measure_queries(kwargs["repeat"], kwargs["seed"])
+
+            for name in report[next(iter(report))]:
+                self.stdout.write(f"{name}:")
+                for schema, results in report.items():
+                    result = results[name]
+                    self.stdout.write(
+                        f"  {schema}: p50 {result['p50_ms']:.3f} ms, "
+                        f"p95 {result['p95_ms']:.3f} ms"
+                    )
+                    for line in result["plan"].splitlines():
+                        self.stdout.write(f"    {line}")
+
+            if kwargs["output"]:
+                with open(kwargs["output"], "w") as file:
+                    json.dump(report, file, indent=2, sort_keys=True)
+
+            self.stdout.write(self.style.SUCCESS("Query plans measured successfully."))
+
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR("Error measuring the query plans: {}".format(str(e)))
+            )
@@ -1,6 +1,9 @@
 """
 Custom migration command for adding recurring events.
 
+With --profile [sampling|cprofile], the run is profiled and the profile is
+written to the PROFILING_DIR setting (see s2s.utils.profiling).
+
 To use this command, run:
     python manage.py recurring_events_m [path_to_csv_file]
 """
@@ -9,6 +12,7 @@ from django.core.management.base import BaseCommand
 from s2s.db_models import Event
 from django.contrib.auth.models import User
 from s2s.views import EventViewSet
+from s2s.utils.profiling import add_profile_argument, command_profile
 import datetime
 import time
 from csv import reader
@@ -32,10 +36,16 @@ class Command(BaseCommand):
                 "recurring_events.csv",
             ),
         )
+        add_profile_argument(parser)
 
     def handle(self, *args, **kwargs):
+        with command_profile("recurring_events", kwargs) as profile:
+            self.add_events(kwargs["file_path"])
+        if profile:
+            self.stdout.write(f"Profile written to {', '.join(profile.paths)}")
+
+    def add_events(self, file_path):
         viewset = EventViewSet()
-        file_path = kwargs["file_path"]
 
         try:
             df = pd.read_csv(file_path)
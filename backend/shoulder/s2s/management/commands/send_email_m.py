@@ -6,6 +6,10 @@ Contains parent class SendEmail and child classes:
     SendEventEmail: sends email when user RSVPs yes to event and contains all 
         event details
 
+Emails are queued in the outbox (the OutboxEmail table), one per recipient,
+and sent by s2s.utils.email_outbox.send_pending; with --enqueue-only they are
+left for the send_outbox_m worker.
+
 Sources:
     https://docs.djangoproject.com/en/5.0/topics/email/
 
@@ -13,20 +17,19 @@ Sources:
 
 import os
 import django
-import boto3
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ShoulderToShoulder.settings')
 django.setup()
 
 from django.core.management.base import BaseCommand
-from django.conf import settings
-from botocore.exceptions import ClientError
-
+from s2s.db_models import EmailMessage
+from s2s.utils.email_outbox import enqueue, send_pending
 
-ses_client = boto3.client('ses', region_name='us-east-2')
 
 class SendEmail(BaseCommand):
     help = "parent class for sending an email"
+    # the kind of the EmailMessage
+    kind = None
 
     def add_arguments(self, parser):
         '''
@@ -34,18 +37,44 @@ class SendEmail(BaseCommand):
         '''
         parser.add_argument('user', type=str, help='user email', nargs='?')
         parser.add_argument('event_info', type=str, help='event object', nargs='?')
+        parser.add_argument(
+            '--enqueue-only',
+            action='store_true',
+            help='Queue the emails in the outbox for send_outbox_m instead of sending them now',
+        )
 
     def handle(self, *args, **kwargs):
         '''
-        Runs data collection and sending of emails
+        Runs data collection, queues the emails in the outbox, and sends them
         '''
         user = kwargs.get('user')
         event_info = kwargs.get('event_info')
+        message = self._get_message(event_info)
+        queued = enqueue(message, self._get_recipient_list(user))
+        if not queued:
+            return
+
+        if kwargs.get('enqueue_only'):
+            self.stdout.write(self.style.SUCCESS(f"Emails queued for {queued} users."))
+            return
+
+        counts = send_pending(message=message)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Emails sent to {sent} users ({retried} to retry, {failed} failed).".format(**counts)
+            )
+        )
+
+    def _get_message(self, event_info=None):
+        '''
+        Renders the email into an EmailMessage
+        '''
         data = self._get_data(event_info)
-        message = self._create_message_body(data)
-        subject = self._get_subject(data)
-        recipient_list = self._get_recipient_list(user)
-        self._send_email(subject, message, recipient_list)
+        return EmailMessage.objects.create(
+            kind=self.kind,
+            subject=self._get_subject(data),
+            body=self._create_message_body(data),
+        )
 
     def _get_data(self, event_info=None):
         '''
@@ -68,32 +97,6 @@ class SendEmail(BaseCommand):
     
     def _get_recipient_list(self, user=None):
         '''
-        Creates list of email addresses to send emails to
+        Lists the (user id, email address) pairs to send emails to
         '''
         raise NotImplementedError("Subclasses must implement _get_recipient_list() method")
-    
-    def _send_email(self, subject, message, recipient_list):
-        '''
-        Sends specified email to recipient list.
-        '''
-
-        try:
-            response = ses_client.send_email(
-                Source=settings.S2S_FROM_EMAIL,
-                Destination={
-                    'ToAddresses': recipient_list,
-                },
-                Message={
-                    'Subject': {
-                        'Data': subject,
-                    },
-                    'Body': {
-                        'Text': {
-                            'Data': message,
-                        },
-                    },
-                }
-            )
-            print(f"Weekly emails sent to {len(recipient_list)} users.")
-        except ClientError as e:
-            print(f"SES error occurred: {e}")
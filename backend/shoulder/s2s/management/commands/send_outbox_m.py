@@ -0,0 +1,56 @@
+"""
+Command for sending the emails queued in the outbox, i.e. by
+send_weekly_email_m --enqueue-only. With --loop it runs as a background
+worker, polling the outbox every --interval seconds.
+
+To use this command, run:
+    python manage.py send_outbox_m [--loop]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from s2s.utils.email_outbox import send_pending
+
+
+class Command(BaseCommand):
+    help = "Sends the due emails of the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Maximum number of emails sent per run",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox instead of exiting once it's empty",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds between polls of the outbox with --loop",
+        )
+
+    def handle(self, *args, **kwargs):
+        while True:
+            try:
+                counts = send_pending(limit=kwargs["limit"])
+                if any(counts.values()) or not kwargs["loop"]:
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            "Outbox sent: {sent} sent, {retried} to retry, {failed} failed".format(**counts)
+                        )
+                    )
+
+            except Exception as e:
+                self.stdout.write(
+                    self.style.ERROR("Error sending the outbox: {}".format(str(e)))
+                )
+
+            if not kwargs["loop"]:
+                break
+            time.sleep(kwargs["interval"])
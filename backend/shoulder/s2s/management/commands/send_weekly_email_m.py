@@ -4,11 +4,13 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ShoulderToShoulder.settings')
 django.setup()
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from .send_email_m import SendEmail
 
 class Command(SendEmail):
     help = 'sends weekly email to check in on new events'
+    kind = 'weekly'
 
     def _get_data(self, _):
         '''
@@ -35,8 +37,6 @@ class Command(SendEmail):
         '''
         Retrieves all user emails from the database
         '''
-        print(User.objects.all())
-        recipient_list = [user.email for user in User.objects.all() if user.email]
-        print(f"RECIPIENT LIST: {recipient_list}")
-        return ['ehabich@uchicago.edu', 'kate.habich@gmail.com'] #TESTING (upgrade SES)
-        return recipient_list
+        return User.objects.exclude(email="").values_list("id", "email").iterator(
+            chunk_size=settings.EMAIL_BATCH_SIZE
+        )
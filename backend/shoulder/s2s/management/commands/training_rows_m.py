@@ -0,0 +1,37 @@
+"""
+Command for rebuilding the materialized training table, i.e. after a backfill
+of the panel tables or a change to the model features.
+
+To use this command, run:
+    python manage.py training_rows_m
+"""
+
+from django.core.management.base import BaseCommand
+from s2s.utils.panelization import BATCH_SIZE
+from s2s.utils.training_rows import rebuild_training_rows
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the TrainingRow table from the panel and UserEvents tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of users rebuilt, and rows written, per bulk query",
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            created = rebuild_training_rows(kwargs["batch_size"])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Training rows rebuilt successfully: {created} rows"
+                )
+            )
+
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR("Error rebuilding training rows: {}".format(str(e)))
+            )
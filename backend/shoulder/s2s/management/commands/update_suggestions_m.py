@@ -1,6 +1,9 @@
 """
 Command for updating the event suggestions table.
 
+With --profile [sampling|cprofile], the run is profiled and the profile is
+written to the PROFILING_DIR setting (see s2s.utils.profiling).
+
 To use this command, run:
     python manage.py update_suggestions_m
 """
@@ -8,12 +11,22 @@ To use this command, run:
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from s2s.views import SuggestionResultsViewSet
+from s2s.utils.profiling import add_profile_argument, command_profile
 
 
 class Command(BaseCommand):
     help = "Updates the event suggestions table."
 
+    def add_arguments(self, parser):
+        add_profile_argument(parser)
+
     def handle(self, *args, **kwargs):
+        with command_profile("update_suggestions", kwargs) as profile:
+            self.update_suggestions()
+        if profile:
+            self.stdout.write(f"Profile written to {', '.join(profile.paths)}")
+
+    def update_suggestions(self):
         viewset = SuggestionResultsViewSet()
         user_ids = User.objects.values_list("id", flat=True)
         results = []
@@ -1,17 +1,112 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.http import JsonResponse
-from .db_models import ApplicationToken
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .utils.app_tokens import token_from_request, verifier
+from .utils.instrumentation import collect, record_request
+from .utils.profiling import profile, requested_mode
+
+
+class SyncAndAsyncMiddleware:
+    """
+    Base of middleware that runs in both sync (WSGI) and async (ASGI) chains,
+    so Django doesn't move the async views below it to a thread. Subclasses
+    implement handle and ahandle.
+    """
+    sync_capable = True
+    async_capable = True
 
-class ApplicationTokenMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        # Attempt to get the token from the Authorization header
-        token = request.headers.get('X-App-Token')
-        if token:
-            token = token.split('Bearer ')[1] if 'Bearer ' in token else token
-            if not ApplicationToken.objects.filter(token=token).exists():
-                return JsonResponse({'detail': 'Invalid token'}, status=401)
-        
+        if iscoroutinefunction(self):
+            return self.ahandle(request)
+        return self.handle(request)
+
+
+class ApplicationTokenMiddleware(SyncAndAsyncMiddleware):
+    def handle(self, request):
+        # Attempt to get the token from the Authorization header; the result
+        # is kept on the request for the HasAppToken permission
+        token = token_from_request(request)
+        request.app_token_valid = verifier.verify(token)
+        if token and not request.app_token_valid:
+            return JsonResponse({'detail': 'Invalid token'}, status=401)
+
         response = self.get_response(request)
         return response
+
+    async def ahandle(self, request):
+        token = token_from_request(request)
+        request.app_token_valid = await sync_to_async(verifier.verify)(token)
+        if token and not request.app_token_valid:
+            return JsonResponse({'detail': 'Invalid token'}, status=401)
+
+        return await self.get_response(request)
+
+
+class InstrumentationMiddleware(SyncAndAsyncMiddleware):
+    def handle(self, request):
+        # Count the queries and time of the request, including those of the
+        # middleware below this one (see s2s.utils.instrumentation)
+        start = time.perf_counter()
+        with collect() as metrics:
+            response = self.get_response(request)
+        record_request(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    async def ahandle(self, request):
+        start = time.perf_counter()
+        with collect() as metrics:
+            response = await self.get_response(request)
+        record_request(request, response, metrics, time.perf_counter() - start)
+        return response
+
+
+def _is_staff(request):
+    """
+    Authenticates a request the way the API views do (session or JWT), which
+    DRF otherwise only does once the view runs.
+    """
+    if request.user.is_authenticated:
+        return request.user.is_staff
+    drf_request = Request(request)
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authentication_class().authenticate(drf_request)
+        except APIException:
+            return False
+        if result is not None:
+            return result[0].is_staff
+    return False
+
+
+class ProfilingMiddleware(SyncAndAsyncMiddleware):
+    def handle(self, request):
+        # Staff users opt in with an X-Profile header or a profile query
+        # parameter (see s2s.utils.profiling)
+        mode = requested_mode(request)
+        if mode is None or not _is_staff(request):
+            return self.get_response(request)
+
+        name = request.path.strip("/").replace("/", "_") or "index"
+        with profile(name, mode) as result:
+            response = self.get_response(request)
+        response["X-Profile"] = result.stem
+        return response
+
+    async def ahandle(self, request):
+        mode = requested_mode(request)
+        if mode is None or not await sync_to_async(_is_staff)(request):
+            return await self.get_response(request)
+
+        name = request.path.strip("/").replace("/", "_") or "index"
+        with profile(name, mode) as result:
+            response = await self.get_response(request)
+        response["X-Profile"] = result.stem
+        return response
@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("s2s", "0004_alter_profile_profile_picture"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="panelevent",
+            name="packed_features",
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="panelscenario",
+            name="packed_features",
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="paneluserpreferences",
+            name="packed_features",
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.0.14 on 2026-10-19 13:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("s2s", "0005_panel_packed_features"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrainingRow",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("scenario", "scenario"), ("event", "event")],
+                        max_length=8,
+                    ),
+                ),
+                ("event_date", models.DateTimeField(blank=True, null=True)),
+                ("features", models.BinaryField()),
+                ("attended_event", models.BooleanField(default=False)),
+                (
+                    "event_id",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="s2s.event",
+                    ),
+                ),
+                (
+                    "scenario_panel_id",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="s2s.panelscenario",
+                    ),
+                ),
+                (
+                    "user_event_id",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="s2s.userevents",
+                    ),
+                ),
+                (
+                    "user_id",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
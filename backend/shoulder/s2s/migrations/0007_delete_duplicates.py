@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.models import Max
+
+# the models that get a unique constraint in 0008 and its fields
+UNIQUE_FIELDS = {
+    "availability": ("user_id", "day_of_week", "hour"),
+    "suggestionresults": ("user_id", "event_id"),
+    "userevents": ("user_id", "event_id"),
+}
+
+
+def delete_duplicates(apps, schema_editor):
+    """
+    Keeps the latest row of every group the unique constraints would reject.
+    """
+    for model_name, fields in UNIQUE_FIELDS.items():
+        model = apps.get_model("s2s", model_name)
+        keep = (
+            model.objects.values(*fields)
+            .annotate(latest=Max("id"))
+            .values_list("latest", flat=True)
+        )
+        model.objects.exclude(id__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+    # Separate from 0008, so the deletes (and the deferred foreign key
+    # triggers of the rows referencing them, i.e. TrainingRow) are committed
+    # before 0008 alters the tables; Postgres refuses to ALTER TABLE with
+    # pending trigger events
+
+    dependencies = [
+        ('s2s', '0006_trainingrow'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('s2s', '0007_delete_duplicates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['datetime'], name='event_datetime'),
+        ),
+        migrations.AddIndex(
+            model_name='suggestionresults',
+            index=models.Index(fields=['user_id', '-probability_of_attendance'], name='suggestion_user_probability'),
+        ),
+        migrations.AddConstraint(
+            model_name='availability',
+            constraint=models.UniqueConstraint(fields=('user_id', 'day_of_week', 'hour'), name='unique_availability_slot'),
+        ),
+        migrations.AddConstraint(
+            model_name='suggestionresults',
+            constraint=models.UniqueConstraint(fields=('user_id', 'event_id'), name='unique_suggestion'),
+        ),
+        migrations.AddConstraint(
+            model_name='userevents',
+            constraint=models.UniqueConstraint(fields=('user_id', 'event_id'), name='unique_user_event'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('s2s', '0008_unique_constraints_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ZipCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zip_code', models.CharField(max_length=5, unique=True)),
+                ('results', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
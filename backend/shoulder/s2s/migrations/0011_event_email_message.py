@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('s2s', '0010_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='event_id',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='s2s.event'),
+        ),
+        migrations.AddConstraint(
+            model_name='emailmessage',
+            constraint=models.UniqueConstraint(condition=models.Q(('event_id__isnull', False)), fields=('kind', 'event_id'), name='unique_event_message'),
+        ),
+    ]
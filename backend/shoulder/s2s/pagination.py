@@ -0,0 +1,26 @@
+from rest_framework.pagination import CursorPagination
+
+
+class EventCursorPagination(CursorPagination):
+    """
+    Cursor pagination of a user's events by their datetime, annotated as
+    event_datetime (see UserEventsViewSet.user_event_rows): the pages are
+    found with an indexed WHERE instead of an OFFSET scan, and stay stable
+    while events are added. Clients follow the next and previous links.
+    """
+    ordering = "event_datetime"
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Cursor pagination by primary key for the large tables, whose deep pages
+    would otherwise be OFFSET scans. The page size matches the PAGE_SIZE of
+    the other list endpoints.
+    """
+    ordering = "id"
+    page_size = 200
+    page_size_query_param = "page_size"
+    max_page_size = 1000
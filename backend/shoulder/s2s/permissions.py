@@ -1,10 +1,6 @@
 from rest_framework import permissions
-from .db_models import ApplicationToken
+from .utils.app_tokens import request_has_valid_token
 
 class HasAppToken(permissions.BasePermission):
     def has_permission(self, request, view):
-        token = request.headers.get('X-App-Token')
-        if token:
-            token = token.split('Bearer ')[1] if 'Bearer ' in token else token
-            return ApplicationToken.objects.filter(token=token).exists()
-        return False
+        return request_has_valid_token(request)
@@ -1,43 +1,78 @@
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import (
+    BooleanField,
+    CharField,
+    IntegerField,
+    ModelSerializer,
+    RelatedField,
+)
 from django.contrib.auth.models import User
 from .db_models import *
 
-class HobbyTypeSerializer(ModelSerializer):
+
+def requested_fields(request):
+    """
+    Gets the fields a GET request asks for with ?fields=a,b,c.
+
+    Returns: a set of field names, or None to return every field
+    """
+    if request is None or request.method not in ("GET", "HEAD"):
+        return None
+    fields = request.query_params.get("fields")
+    if not fields:
+        return None
+    return {field.strip() for field in fields.split(",") if field.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Drops the fields a GET request didn't ask for with ?fields= from the
+    serializer (unknown names are ignored). Writes always use every field.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = requested_fields(self.context.get("request"))
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+
+class HobbyTypeSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = HobbyType
         fields = "__all__"
 
-class HobbySerializer(ModelSerializer):
+class HobbySerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = Hobby
         fields = "__all__"
 
-class GroupSerializer(ModelSerializer):
+class GroupSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = Group
         fields = "__all__"
         
-class EventSerializer(ModelSerializer):
+class EventSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = Event
         fields = "__all__"
 
-class OnbordingSerializer(ModelSerializer):
+class OnbordingSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = Onboarding
         fields = "__all__"
 
-class ScenariosSerializer(ModelSerializer):   
+class ScenariosSerializer(SparseFieldsMixin, ModelSerializer):   
     class Meta:
         model = Scenarios
         fields = "__all__"    
          
-class AvailabilitySerializer(ModelSerializer):
+class AvailabilitySerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = Availability
         fields = "__all__"
 
-class BulkAvailabilitySerializer(ModelSerializer):
+class BulkAvailabilitySerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = Availability
         fields = "__all__"
@@ -50,12 +85,12 @@ class BulkAvailabilitySerializer(ModelSerializer):
         # Handle updates if necessary
         pass
 
-class ChoiceSerializer(ModelSerializer):
+class ChoiceSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = Choice
         fields = "__all__"
 
-class ProfileSerializer(ModelSerializer):
+class ProfileSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = Profile
         fields = "__all__"
@@ -66,7 +101,7 @@ class ProfileSerializer(ModelSerializer):
             return request.build_absolute_uri(obj.profile_picture.url)
         return None
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'first_name', 'last_name', 'username', 'email', 'password']
@@ -76,32 +111,80 @@ class UserSerializer(ModelSerializer):
         user = User.objects.create_user(**validated_data)
         return user
 
-class ApplicationTokenSerializer(ModelSerializer):
+class ApplicationTokenSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = ApplicationToken
         fields = "__all__"
 
-class UserEventsSerializer(ModelSerializer):
+class UserEventsSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = UserEvents
         fields = "__all__"
 
-class SuggestionResultsSerializer(ModelSerializer):
+class SuggestionResultsSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = SuggestionResults
         fields = "__all__"
 
-class PanelEventSerializer(ModelSerializer):
+class PanelEventSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = PanelEvent
-        fields = "__all__"
+        exclude = ["packed_features"]
 
-class PanelUserPreferencesSerializer(ModelSerializer):
+class PanelUserPreferencesSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = PanelUserPreferences
-        fields = "__all__"
+        exclude = ["packed_features"]
 
-class PanelScenarioSerializer(ModelSerializer):
+class PanelScenarioSerializer(SparseFieldsMixin, ModelSerializer):
     class Meta:
         model = PanelScenario
-        fields = "__all__"
+        exclude = ["packed_features"]
+
+
+class ValuesSerializer:
+    """
+    A read-only version of a ModelSerializer for the rows of a .values()
+    queryset, for listings too long to build a serializer and a model instance
+    per row. The fields are looked up once, on first use; relations are
+    rendered as their primary keys and the other fields as the serializer
+    renders them.
+
+    Inputs:
+        serializer_class (class): the ModelSerializer to mirror
+        prefix (str): the lookup of the model from the queryset's model, i.e.
+            "event_id__" to serialize the events of UserEvents rows
+    """
+    # fields whose values are already what their serializer fields render
+    PLAIN_FIELDS = (BooleanField, CharField, IntegerField, RelatedField)
+
+    def __init__(self, serializer_class, prefix=""):
+        self.serializer_class = serializer_class
+        self.prefix = prefix
+        self._columns = None
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            self._columns = [
+                (
+                    name,
+                    self.prefix + field.source,
+                    None if isinstance(field, self.PLAIN_FIELDS) else field.to_representation,
+                )
+                for name, field in self.serializer_class().fields.items()
+                if not field.write_only
+            ]
+        return self._columns
+
+    def values(self):
+        """
+        Returns: the lookups to pass to .values()
+        """
+        return [lookup for _, lookup, _ in self.columns]
+
+    def __call__(self, row):
+        return {
+            name: row[lookup] if convert is None or row[lookup] is None else convert(row[lookup])
+            for name, lookup, convert in self.columns
+        }
@@ -1,9 +1,25 @@
 from django.core.files import File
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 import os
 import shutil
-from .db_models import Profile
+from .db_models import (
+    ApplicationToken,
+    EmailMessage,
+    Event,
+    Onboarding,
+    PanelEvent,
+    PanelScenario,
+    PanelUserPreferences,
+    Profile,
+    UserEvents,
+)
+from .utils.app_tokens import verifier
+from .utils.instrumentation import instrument
+from .utils.panelization import LAYOUTS, panels_saved, save_event_panels
+from .utils.training_rows import EVENT, SCENARIO, SOURCES, refresh_training_rows
 from django.conf import settings
 
 
@@ -29,3 +45,105 @@ def create_user_profile_folder(sender, instance, created, **kwargs):
         if not instance.profile_picture:
             with open(default_image_src, "rb") as f:
                 instance.profile_picture.save("default_profile.jpg", File(f), save=True)
+
+
+@receiver(pre_save, sender=PanelEvent)
+@receiver(pre_save, sender=PanelScenario)
+@receiver(pre_save, sender=PanelUserPreferences)
+def pack_panel_features(sender, instance, raw=False, update_fields=None, **kwargs):
+    # panel rows edited one at a time (i.e. through the panel API or the
+    # admin) would otherwise keep the bitmask of their previous columns
+    if raw:
+        return
+    instance.packed_features = LAYOUTS[sender].pack_instance(instance)
+    if update_fields is not None and "packed_features" not in update_fields:
+        # the save won't write it, so write it now
+        sender.objects.filter(pk=instance.pk).update(
+            packed_features=instance.packed_features
+        )
+
+
+@receiver(panels_saved)
+def refresh_bulk_saved_training_rows(sender, user_ids=None, event_ids=None, **kwargs):
+    sources = {PanelEvent: [EVENT], PanelScenario: [SCENARIO]}.get(sender, SOURCES)
+    refresh_training_rows(user_ids=user_ids, event_ids=event_ids, sources=sources)
+
+
+@receiver(post_save, sender=PanelUserPreferences)
+@receiver(post_delete, sender=PanelUserPreferences)
+def refresh_user_training_rows(sender, instance, raw=False, **kwargs):
+    # without a preferences panel, the user's rows are removed
+    if not raw:
+        refresh_training_rows(user_ids=[instance.user_id_id])
+
+
+@receiver(post_save, sender=Onboarding)
+def refresh_user_distance_training_rows(sender, instance, raw=False, **kwargs):
+    # the distance bins of the user's event rows come from their location
+    if not raw:
+        refresh_training_rows(user_ids=[instance.user_id_id], sources=[EVENT])
+
+
+@receiver(post_save, sender=PanelScenario)
+def refresh_scenario_training_rows(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_training_rows(user_ids=[instance.user_id_id], sources=[SCENARIO])
+
+
+@receiver(post_save, sender=PanelEvent)
+def refresh_event_training_rows(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_training_rows(event_ids=[instance.event_id_id], sources=[EVENT])
+
+
+@receiver(post_save, sender=UserEvents)
+def refresh_user_event_training_rows(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_training_rows(
+            user_ids=[instance.user_id_id],
+            event_ids=[instance.event_id_id],
+            sources=[EVENT],
+        )
+
+
+@receiver(post_save, sender=Event)
+def panelize_event(sender, instance, created, raw=False, **kwargs):
+    # the event's panel and training rows (event_date, distance bins) are
+    # built from its columns; saving the panel refreshes its training rows.
+    # New events are panelized by EventViewSet once their RSVP is saved
+    if not created and not raw:
+        save_event_panels(instance)
+
+
+@receiver(post_save, sender=Event)
+def detach_event_messages(sender, instance, created, raw=False, **kwargs):
+    # the event's pre-rendered confirmation may be out of date; queued emails
+    # keep it, and the next RSVP renders a new one
+    if not created and not raw:
+        EmailMessage.objects.filter(event_id=instance).update(event_id=None)
+
+
+@receiver(post_save, sender=ApplicationToken)
+@receiver(post_delete, sender=ApplicationToken)
+def invalidate_app_tokens(sender, **kwargs):
+    # once more on commit, in case another request reloaded the digests
+    # before the change was visible to it
+    verifier.invalidate()
+    transaction.on_commit(verifier.invalidate)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # every thread's connections count their queries in the metrics of the
+    # request running in the thread (see s2s.utils.instrumentation)
+    instrument(connection)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    # WAL lets readers and the writer work at the same time; NORMAL sync is
+    # durable in WAL mode except against power loss
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
@@ -1,7 +1,7 @@
 from django.urls import path
 from django.conf.urls import include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 
 router = DefaultRouter()
 router.register(r"hobbies", views.HobbyViewSet)
@@ -12,7 +12,6 @@ router.register(r"availability", views.AvailabilityViewSet)
 router.register(r"choices", views.ChoiceViewSet)
 router.register(r"scenarios", views.ScenariosiewSet)
 router.register(r"profiles", views.ProfilesViewSet, basename="profiles")
-router.register(r"zipcodes", views.ZipCodeViewSet, basename="zipcodes")
 router.register(r"applicationtokens", views.ApplicationTokenViewSet)
 router.register(r"hobbytypes", views.HobbyTypeViewSet)
 router.register(r"user", views.UserViewSet)
@@ -27,4 +26,7 @@ urlpatterns = [
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path('create/', views.CreateUserViewSet.as_view({'post': 'create'}), name='create_user'),
     path('login/', views.LoginViewSet.as_view({'post': 'login'}), name='login'),
+    path("zipcodes/", async_views.zipcodes, name="zipcodes"),
+    path("geocode/", async_views.geocode, name="geocode"),
+    path('metrics/', views.MetricsViewSet.as_view({'get': 'metrics'}), name='metrics'),
 ]
@@ -0,0 +1,141 @@
+"""
+Cached verification of application tokens (the X-App-Token header).
+
+The verifier keeps the SHA-256 digests of every valid ApplicationToken in
+memory for APP_TOKEN_CACHE_TTL seconds and compares the digest of a presented
+token against them with hmac.compare_digest, so verifying a token costs no
+database query once the digests are loaded, and invalid tokens can't be used
+to hammer the database. If APP_TOKEN_SHARED_CACHE names a Django cache, the
+digests are also shared between processes through it.
+
+The receivers in s2s.signals invalidate the digests whenever an
+ApplicationToken is saved or deleted. Other processes only see the change once
+their in-memory digests expire, so APP_TOKEN_CACHE_TTL bounds how long a
+deleted token keeps working elsewhere.
+
+ApplicationTokenMiddleware verifies the token once per request and stores the
+result on the request (request.app_token_valid), which HasAppToken reuses.
+"""
+
+import hashlib
+import hmac
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from s2s.db_models import ApplicationToken
+
+TOKEN_HEADER = "X-App-Token"
+SHARED_CACHE_KEY = "s2s:app_token_digests"
+
+
+def token_from_request(request):
+    """
+    Gets the application token of a request, without its "Bearer " prefix.
+
+    Returns: the token, or None if the request has no X-App-Token header
+    """
+    token = request.headers.get(TOKEN_HEADER)
+    if token:
+        token = token.split("Bearer ")[1] if "Bearer " in token else token
+    return token or None
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenVerifier:
+    """
+    Verifies application tokens against cached digests of the valid tokens.
+
+    Inputs:
+        ttl (float): seconds before the digests are reloaded
+        shared_cache (str): alias of a Django cache to share the digests
+            through, or None
+    """
+
+    def __init__(self, ttl, shared_cache=None):
+        self.ttl = ttl
+        self.shared_cache = shared_cache
+        self._digests = None
+        self._expires = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """
+        Returns the digests of every valid token, from the shared cache if
+        configured or else from the database.
+        """
+        cache = caches[self.shared_cache] if self.shared_cache else None
+        digests = cache.get(SHARED_CACHE_KEY) if cache else None
+        if digests is None:
+            digests = [
+                token_digest(token)
+                for token in ApplicationToken.objects.values_list("token", flat=True)
+            ]
+            if cache:
+                cache.set(SHARED_CACHE_KEY, digests, self.ttl)
+        return digests
+
+    def digests(self):
+        """
+        Returns the cached digests of every valid token, reloading them once
+        they expire.
+        """
+        with self._lock:
+            if self._digests is None or time.monotonic() >= self._expires:
+                self._digests = self._load()
+                self._expires = time.monotonic() + self.ttl
+            return self._digests
+
+    def verify(self, token):
+        """
+        Checks whether token is a valid application token.
+
+        Inputs:
+            token (str): the presented token
+
+        Returns: True if the token is valid
+        """
+        if not token:
+            return False
+
+        # compare against every digest, so the time taken doesn't depend on
+        # which (or whether any) token matched
+        presented = token_digest(token)
+        valid = False
+        for digest in self.digests():
+            valid |= hmac.compare_digest(presented, digest)
+        return valid
+
+    def invalidate(self):
+        """
+        Drops the cached digests, i.e. after a token was created or deleted.
+        """
+        with self._lock:
+            self._digests = None
+        if self.shared_cache:
+            caches[self.shared_cache].delete(SHARED_CACHE_KEY)
+
+
+verifier = TokenVerifier(
+    ttl=getattr(settings, "APP_TOKEN_CACHE_TTL", 60),
+    shared_cache=getattr(settings, "APP_TOKEN_SHARED_CACHE", None),
+)
+
+
+def request_has_valid_token(request):
+    """
+    Checks the application token of a request, reusing the result stored on
+    the request by ApplicationTokenMiddleware if there is one.
+
+    Returns: True if the request has a valid application token
+    """
+    valid = getattr(request, "app_token_valid", None)
+    if valid is None:
+        valid = verifier.verify(token_from_request(request))
+        request.app_token_valid = valid
+    return valid
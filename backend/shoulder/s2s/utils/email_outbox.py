@@ -0,0 +1,230 @@
+"""
+The email outbox: emails are queued as OutboxEmail rows, one per recipient,
+and sent through SES by send_pending, i.e. by the send_outbox_m worker.
+
+Every recipient gets their own SES call, so addresses aren't exposed to each
+other and SES's cap of 50 recipients per call doesn't apply. The calls run
+in a pool of EMAIL_SEND_WORKERS threads, throttled to EMAIL_SEND_RATE emails
+per second (the SES account's maximum send rate).
+
+send_pending claims up to EMAIL_BATCH_SIZE due emails at a time by moving
+their next_attempt_at EMAIL_CLAIM_TIMEOUT seconds forward (with SELECT ...
+FOR UPDATE SKIP LOCKED where the database supports it), so concurrent
+workers don't send the same email, and emails claimed by a worker that
+crashed are sent once the claim expires. Throttling and other transient
+errors are retried after EMAIL_RETRY_BACKOFF seconds, doubled every attempt,
+up to EMAIL_MAX_ATTEMPTS attempts; other errors fail the email at once.
+
+The results of a batch are written with one bulk update of the outbox, and
+one of Profile.last_email_sent.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from s2s.db_models import OutboxEmail, Profile
+from .instrumentation import timed
+
+# SES error codes worth retrying
+RETRYABLE_ERRORS = {
+    "Throttling",
+    "ThrottlingException",
+    "ServiceUnavailable",
+    "InternalFailure",
+    "RequestTimeout",
+}
+
+_ses_client = None
+_ses_client_lock = threading.Lock()
+
+
+def get_ses_client():
+    """
+    Returns: the process's SES client (boto3 clients are thread safe)
+    """
+    global _ses_client
+    with _ses_client_lock:
+        if _ses_client is None:
+            import boto3
+
+            _ses_client = boto3.client("ses", region_name=settings.AWS_REGION_NAME)
+    return _ses_client
+
+
+def send_email(subject, body, recipients):
+    """
+    Sends an email through SES.
+
+    Inputs:
+        subject (str): subject line
+        body (str): plain text body
+        recipients (list): email addresses, all visible to each other
+
+    Returns: the SES response
+    """
+    with timed("ses"):
+        return get_ses_client().send_email(
+            Source=settings.S2S_FROM_EMAIL,
+            Destination={"ToAddresses": recipients},
+            Message={
+                "Subject": {"Data": subject},
+                "Body": {"Text": {"Data": body}},
+            },
+        )
+
+
+class RateLimiter:
+    """
+    A thread-safe token bucket allowing rate calls per second on average.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a call is allowed.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def enqueue(message, recipients, batch_size=None):
+    """
+    Queues a message for recipients.
+
+    Inputs:
+        message (EmailMessage): the message
+        recipients (iterable): (user id, email address) pairs
+        batch_size (int): number of rows written per bulk query
+
+    Returns: the number of emails queued
+    """
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    queued = 0
+    batch = []
+    for user_id, recipient in recipients:
+        batch.append(OutboxEmail(message_id=message, user_id_id=user_id, recipient=recipient))
+        if len(batch) == batch_size:
+            OutboxEmail.objects.bulk_create(batch)
+            queued += len(batch)
+            batch = []
+    if batch:
+        OutboxEmail.objects.bulk_create(batch)
+        queued += len(batch)
+    return queued
+
+
+def _claim(limit, message=None):
+    """
+    Claims up to limit due emails (of a message, if given).
+
+    Returns: the claimed OutboxEmail rows, with their messages
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = OutboxEmail.objects.select_for_update(skip_locked=True).filter(
+            status=OutboxEmail.PENDING, next_attempt_at__lte=now
+        )
+        if message is not None:
+            due = due.filter(message_id=message)
+        ids = list(due.order_by("next_attempt_at", "id").values_list("id", flat=True)[:limit])
+        OutboxEmail.objects.filter(id__in=ids).update(
+            next_attempt_at=now + timedelta(seconds=settings.EMAIL_CLAIM_TIMEOUT)
+        )
+    return list(OutboxEmail.objects.filter(id__in=ids).select_related("message_id"))
+
+
+def _send(email, limiter):
+    """
+    Sends one queued email.
+
+    Returns: the error (None if the email was sent), and whether it's worth
+        retrying
+    """
+    limiter.acquire()
+    try:
+        send_email(email.message_id.subject, email.message_id.body, [email.recipient])
+    except ClientError as e:
+        return str(e), e.response.get("Error", {}).get("Code") in RETRYABLE_ERRORS
+    except BotoCoreError as e:
+        # i.e. the connection to SES failed
+        return str(e), True
+    return None, False
+
+
+def send_pending(limit=None, message=None, workers=None, batch_size=None):
+    """
+    Sends the due emails of the outbox.
+
+    Inputs:
+        limit (int): maximum number of emails sent, or None for all
+        message (EmailMessage): only send the emails of this message
+        workers (int): number of threads sending emails
+        batch_size (int): number of emails claimed at a time
+
+    Returns: a dictionary of the number of emails "sent", "retried" (failed
+        and due again later), and "failed"
+    """
+    workers = workers or settings.EMAIL_SEND_WORKERS
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    limiter = RateLimiter(settings.EMAIL_SEND_RATE)
+    counts = {"sent": 0, "retried": 0, "failed": 0}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while limit is None or sum(counts.values()) < limit:
+            size = batch_size if limit is None else min(batch_size, limit - sum(counts.values()))
+            batch = _claim(size, message)
+            if not batch:
+                break
+
+            results = pool.map(lambda email: _send(email, limiter), batch)
+            now = timezone.now()
+            sent_users = []
+            for email, (error, retryable) in zip(batch, results):
+                if error is None:
+                    email.status = OutboxEmail.SENT
+                    email.sent_at = now
+                    if email.user_id_id is not None:
+                        sent_users.append(email.user_id_id)
+                    counts["sent"] += 1
+                    continue
+
+                email.attempts += 1
+                email.last_error = error
+                if retryable and email.attempts < settings.EMAIL_MAX_ATTEMPTS:
+                    backoff = settings.EMAIL_RETRY_BACKOFF * 2 ** (email.attempts - 1)
+                    email.next_attempt_at = now + timedelta(seconds=backoff)
+                    counts["retried"] += 1
+                else:
+                    email.status = OutboxEmail.FAILED
+                    counts["failed"] += 1
+
+            OutboxEmail.objects.bulk_update(
+                batch,
+                ["status", "attempts", "next_attempt_at", "last_error", "sent_at"],
+            )
+            Profile.objects.filter(user_id__in=sent_users).update(last_email_sent=now)
+
+    return counts
@@ -0,0 +1,104 @@
+"""
+RSVP confirmation emails, queued in the email outbox (see
+s2s.utils.email_outbox) instead of sent while the RSVP request waits on SES;
+the send_outbox_m worker sends them.
+
+The confirmation of an event is the same for every attendee, so it is
+rendered once, on the first RSVP, into an EmailMessage of the event that
+every later RSVP reuses. When the event is saved again, its message is
+detached from it (see s2s.signals), so the next RSVP renders the new details.
+"""
+
+import pytz
+
+from s2s.db_models import EmailMessage
+from .email_outbox import enqueue
+
+EVENT_EMAIL = "event"
+
+
+def event_email_data(event):
+    '''
+    Collect and format event information.
+    '''
+    # Collect Event information
+    event_title = event.title
+    event_duration = event.duration_h
+    event_location = f"{event.address1} {(event.address2 or '') + ' '} {event.city}, {event.state} {event.zipcode}"
+    event_price = event.price
+    event_description = event.description
+
+    # Collect, format, and convert timezone of datetime
+    datetime = event.datetime
+    utc_datetime = datetime.fromisoformat(str(datetime))
+
+    utc_timezone = pytz.utc
+    et_timezone = pytz.timezone("US/Eastern")
+    utc_datetime = utc_datetime.astimezone(utc_timezone)
+    et_datetime = utc_datetime.astimezone(et_timezone)
+
+    event_date = et_datetime.strftime("%d %B %Y %I:%M %p %Z")
+
+    return {'title' : event_title,
+            'date': event_date,
+            'duration': event_duration,
+            'location': event_location,
+            'price': event_price,
+            'description': event_description}
+
+
+def event_email_body(data):
+    '''
+    Creates message body from event information
+    '''
+    s = "Thank you for your RSVP to join an event with Shoulder To Shoulder. Below are the details of your event. \n \n"
+    s += f"{data['title']} \n"
+    s += f"Time: {data['date']} for {data['duration']} hours \n"
+    s += f"Location: {data['location']}\n"
+    s += f"Estimated Price: {data['price']} \n"
+    s += f"Description: {data['description']}"
+    return s
+
+
+def event_email_subject(data):
+    '''
+    Creates emails subject line with event title
+    '''
+    return f"S2S Event Confirmation: {data['title']}"
+
+
+def event_message(event):
+    """
+    Gets the confirmation message of an event, rendering it if the event has
+    none yet.
+
+    Inputs:
+        event (Event): the event
+
+    Returns: the EmailMessage
+    """
+    message = EmailMessage.objects.filter(kind=EVENT_EMAIL, event_id=event).first()
+    if message is None:
+        data = event_email_data(event)
+        # get_or_create, in case another RSVP rendered it meanwhile (see the
+        # unique_event_message constraint)
+        message, _ = EmailMessage.objects.get_or_create(
+            kind=EVENT_EMAIL,
+            event_id=event,
+            defaults={
+                "subject": event_email_subject(data),
+                "body": event_email_body(data),
+            },
+        )
+    return message
+
+
+def queue_event_email(user, event):
+    """
+    Queues the confirmation of an event to a user who RSVPed yes.
+
+    Returns: the number of emails queued (0 if the user has no email address)
+    """
+    if not user.email:
+        return 0
+    return enqueue(event_message(event), [(user.id, user.email)])
@@ -0,0 +1,305 @@
+"""
+Per-request instrumentation: database queries, database time, ML inference
+time, and time spent calling external services.
+
+InstrumentationMiddleware wraps every request in collect(), which makes it the
+current request of its context. Every database connection is instrumented
+once, when it's opened (see s2s.signals), with an execute wrapper that
+counts the query and its time in the current request's metrics, so it works
+without DEBUG. The current request is a context variable, which
+sync_to_async carries into its thread, so the queries of async requests
+are counted too, although Django gives that thread its own connections. Code that calls out of
+the process marks the call with timed(category), i.e.
+
+    with timed("geocode"):
+        geo_response = geocode(full_address)
+
+and the elapsed time is added to the current request's metrics (if any) and to
+the s2s_external_call_seconds histogram. The categories are in CATEGORIES.
+
+After every request the middleware logs a JSON summary to the
+"s2s.instrumentation" logger, adds X-DB-Queries and Server-Timing headers to
+the response, and records the request in the process's histograms, which the
+admin-only metrics view renders in the Prometheus text format. A request with
+more than INSTRUMENTATION_QUERY_THRESHOLD queries (setting, 50 by default) is
+logged as a warning and counted in s2s_requests_over_query_threshold_total.
+
+The histograms are kept per process, so every worker of a multi-process
+server reports its own; Prometheus sums them up when it scrapes every worker.
+"""
+
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("s2s.instrumentation")
+
+CATEGORIES = ("ml", "geocode", "ses", "zipcode")
+QUERY_THRESHOLD = 50
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_current = contextvars.ContextVar("s2s_request_metrics", default=None)
+
+
+class RequestMetrics:
+    """
+    The measurements of one request.
+    """
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.seconds = {category: 0.0 for category in CATEGORIES}
+        self.calls = {category: 0 for category in CATEGORIES}
+
+    def summary(self):
+        return {
+            "db_queries": self.db_queries,
+            "db_ms": round(self.db_seconds * 1000, 3),
+            **{
+                f"{category}_ms": round(seconds * 1000, 3)
+                for category, seconds in self.seconds.items()
+                if self.calls[category]
+            },
+        }
+
+
+class Histogram:
+    """
+    A Prometheus histogram with labels.
+
+    Inputs:
+        name (str): metric name
+        description (str): metric help text
+        buckets (tuple): upper bounds of the buckets
+        labels (tuple): label names
+    """
+
+    def __init__(self, name, description, buckets, labels):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}
+
+    def observe(self, value, *label_values):
+        series = self.series.setdefault(label_values, [[0] * len(self.buckets), 0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self.series.items()):
+            labels = _labels(self.labels, label_values)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (bound,))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    """
+    A Prometheus counter with labels.
+    """
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, *label_values):
+        self.series[label_values] = self.series.get(label_values, 0) + 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for label_values, count in sorted(self.series.items()):
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+def _labels(names, values):
+    """
+    Formats the labels of a sample, i.e. {view="login",method="POST"}.
+    """
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in values
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class Registry:
+    """
+    The metrics of this process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        view = ("view", "method")
+        self.request_seconds = Histogram(
+            "s2s_request_duration_seconds", "Time to handle a request.", SECONDS_BUCKETS, view
+        )
+        self.db_queries = Histogram(
+            "s2s_request_db_queries", "Database queries per request.", QUERY_BUCKETS, view
+        )
+        self.db_seconds = Histogram(
+            "s2s_request_db_seconds", "Database time per request.", SECONDS_BUCKETS, view
+        )
+        self.external_seconds = Histogram(
+            "s2s_external_call_seconds",
+            "Time of ML inference and external service calls.",
+            SECONDS_BUCKETS,
+            ("category",),
+        )
+        self.over_threshold = Counter(
+            "s2s_requests_over_query_threshold_total",
+            "Requests with more database queries than INSTRUMENTATION_QUERY_THRESHOLD.",
+            view,
+        )
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for metric in (
+                self.request_seconds,
+                self.db_queries,
+                self.db_seconds,
+                self.external_seconds,
+                self.over_threshold,
+            ):
+                lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def current_metrics():
+    """
+    Returns the metrics of the request being handled, or None.
+    """
+    return _current.get()
+
+
+def _execute(execute, sql, params, many, context):
+    """
+    The execute wrapper of every connection: counts the query in the metrics
+    of the current request, if any.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_seconds += time.perf_counter() - start
+
+
+def instrument(connection):
+    """
+    Adds the execute wrapper to a database connection, once.
+    """
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+@contextmanager
+def collect():
+    """
+    Collects the metrics of the code run in the block, i.e. a request.
+
+    Returns: the RequestMetrics
+    """
+    # the connections of this thread may have been opened before the
+    # connection_created receiver was connected
+    for alias in connections:
+        instrument(connections[alias])
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(category):
+    """
+    Times the block as a call of a category in CATEGORIES (i.e. "ml" or
+    "geocode").
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.seconds[category] += elapsed
+            metrics.calls[category] += 1
+        with registry.lock:
+            registry.external_seconds.observe(elapsed, category)
+
+
+def query_threshold():
+    return getattr(settings, "INSTRUMENTATION_QUERY_THRESHOLD", QUERY_THRESHOLD)
+
+
+def record_request(request, response, metrics, seconds):
+    """
+    Logs and records the metrics of a finished request, and adds them to the
+    response headers.
+    """
+    match = getattr(request, "resolver_match", None)
+    view = match.view_name if match and match.view_name else "unmatched"
+    over_threshold = metrics.db_queries > query_threshold()
+
+    with registry.lock:
+        registry.request_seconds.observe(seconds, view, request.method)
+        registry.db_queries.observe(metrics.db_queries, view, request.method)
+        registry.db_seconds.observe(metrics.db_seconds, view, request.method)
+        if over_threshold:
+            registry.over_threshold.inc(view, request.method)
+
+    summary = {
+        "method": request.method,
+        "path": request.path,
+        "view": view,
+        "status": response.status_code,
+        "ms": round(seconds * 1000, 3),
+        **metrics.summary(),
+    }
+    if over_threshold:
+        summary["over_query_threshold"] = True
+        logger.warning(json.dumps(summary))
+    else:
+        logger.info(json.dumps(summary))
+
+    response["X-DB-Queries"] = str(metrics.db_queries)
+    response["Server-Timing"] = ", ".join(
+        [f"total;dur={seconds * 1000:.1f}", f"db;dur={metrics.db_seconds * 1000:.1f}"]
+        + [
+            f"{category};dur={metrics.seconds[category] * 1000:.1f}"
+            for category in CATEGORIES
+            if metrics.calls[category]
+        ]
+    )
@@ -0,0 +1,558 @@
+"""
+Load testing of the API with synthetic users and events.
+
+generate_load_test_data creates users with a profile, onboarding responses,
+availability, and scenarios, plus events, RSVPs, and suggestion results, and
+panelizes them the way onboarding does. The synthetic users have an email
+address at LOAD_TEST_DOMAIN, so clear_load_test_data can remove them (and
+their events) again. Addresses are placed with gis.gis_module.stub_geocode
+instead of being geocoded.
+
+run_load_test replays a seeded workload of the endpoints in ENDPOINTS for
+random synthetic users from a pool of worker threads, and reports the p50,
+p95, and p99 latency of every endpoint. By default the requests go through
+the Django test client in this process, which also counts the database
+queries of every request; with a base URL they are sent over HTTP to a
+running server instead (start it with GEOCODE_STUB=1 so submit_onboarding
+doesn't call Nominatim), and the queries are read from the X-DB-Queries
+header of the responses (see s2s.utils.instrumentation).
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from gis.gis_module import stub_geocode
+
+from s2s.db_models import (
+    ApplicationToken,
+    Availability,
+    Event,
+    Hobby,
+    HobbyType,
+    Onboarding,
+    Profile,
+    Scenarios,
+    SuggestionResults,
+    UserEvents,
+)
+from s2s.utils.calendar import calendar
+from s2s.utils.panelization import (
+    BATCH_SIZE,
+    DISTANCES,
+    HOBBY_CATEGORIES,
+    NUM_PARTICIPANTS,
+    SIMILARITY_METRICS,
+    SIMILARITY_TO_GROUP,
+    save_event_panels,
+    save_scenario_panels,
+    save_user_preference_panels,
+)
+
+LOAD_TEST_DOMAIN = "loadtest.shouldertoshoulder.me"
+LOAD_TEST_PASSWORD = "LoadTest1!"
+TOKEN_NAME = "loadtest"
+
+DAYS = [day for day, _ in Scenarios.ALLOWED_DAYS]
+TIMES_OF_DAY = [label for label, _ in Scenarios.ALLOWED_TOD]
+
+# the share of the workload that goes to each endpoint
+DEFAULT_MIX = {
+    "submit_onboarding": 1,
+    "get_suggestions": 4,
+    "upcoming_past_events": 4,
+    "availability_bulk_update": 1,
+}
+
+
+def _hobbies():
+    """
+    Gets the hobbies to generate responses with, creating one hobby of every
+    hobby category if the hobby tables are empty (i.e. hobbies_m hasn't run).
+
+    Returns: (hobby_type_ids, hobby_ids)
+    """
+    if not Hobby.objects.exists():
+        types = {
+            hobby_type.type: hobby_type
+            for hobby_type in HobbyType.objects.all()
+        }
+        for name in HOBBY_CATEGORIES:
+            if name not in types:
+                types[name] = HobbyType.objects.create(type=name)
+        Hobby.objects.bulk_create(
+            [
+                Hobby(name=f"Load test {name.lower()}", type=hobby_type)
+                for name, hobby_type in types.items()
+            ]
+        )
+
+    return (
+        list(HobbyType.objects.values_list("id", flat=True)),
+        list(Hobby.objects.values_list("id", flat=True)),
+    )
+
+
+def _scenario(rng, user_id, hobby_ids):
+    """
+    Builds the fields of a random scenario response.
+    """
+    prefers_event1 = rng.random() < 0.5
+    fields = {"user_id": user_id, "prefers_event1": prefers_event1, "prefers_event2": not prefers_event1}
+    for i in (1, 2):
+        fields.update(
+            {
+                f"hobby{i}": rng.choice(hobby_ids),
+                f"distance{i}": rng.choice(list(DISTANCES)),
+                f"num_participants{i}": rng.choice(list(NUM_PARTICIPANTS)),
+                f"day_of_week{i}": rng.choice(DAYS),
+                f"time_of_day{i}": rng.choice(TIMES_OF_DAY),
+                f"duration_h{i}": rng.randint(1, 8),
+            }
+        )
+    return fields
+
+
+def _onboarding(rng, hobby_type_ids, hobby_ids):
+    """
+    Builds the fields of random onboarding responses.
+    """
+    hobbies = rng.sample(hobby_ids, min(4, len(hobby_ids)))
+    return {
+        "onboarded": True,
+        "zip_code": "60637",
+        "city": "Chicago",
+        "state": "IL",
+        "address_line1": f"{rng.randint(1, 9999)} S Ellis Ave",
+        "event_frequency": "Once a week",
+        "event_notification": "Email Only",
+        "num_participants": rng.sample(list(NUM_PARTICIPANTS), 2),
+        "distance": rng.choice(list(DISTANCES)),
+        "similarity_to_group": rng.choice(list(SIMILARITY_TO_GROUP)),
+        "similarity_metrics": rng.sample(list(SIMILARITY_METRICS), 2),
+        "most_interested_hobby_types": rng.sample(hobby_type_ids, min(2, len(hobby_type_ids))),
+        "most_interested_hobbies": hobbies[:2],
+        "least_interested_hobbies": hobbies[2:],
+    }
+
+
+def generate_load_test_data(
+    num_users,
+    num_events,
+    num_scenarios=5,
+    num_rsvps=3,
+    num_suggestions=20,
+    seed=0,
+    batch_size=BATCH_SIZE,
+):
+    """
+    Creates synthetic users with onboarding responses, availability, and
+    scenarios, and synthetic events with RSVPs and suggestion results.
+
+    Inputs:
+        num_users (int): number of users to create
+        num_events (int): number of events to create; 80% are within the next
+            two weeks and the rest in the past two weeks
+        num_scenarios (int): number of scenario responses per user
+        num_rsvps (int): number of events every user has RSVPed to
+        num_suggestions (int): number of upcoming events every user has a
+            suggestion result for
+        seed (int): seed of the random responses
+        batch_size (int): number of rows per bulk insert
+
+    Returns: a dictionary with the number of created rows of every table
+    """
+    rng = random.Random(seed)
+    hobby_type_ids, hobby_ids = _hobbies()
+    now = timezone.now().replace(minute=0, second=0, microsecond=0)
+    start = User.objects.filter(email__endswith=LOAD_TEST_DOMAIN).count()
+    password = make_password(LOAD_TEST_PASSWORD)
+
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=f"user{i}@{LOAD_TEST_DOMAIN}",
+                    email=f"user{i}@{LOAD_TEST_DOMAIN}",
+                    first_name="Load",
+                    last_name=f"Test {i}",
+                    password=password,
+                )
+                for i in range(start, start + num_users)
+            ],
+            batch_size=batch_size,
+        )
+        # not every backend returns the primary keys of bulk inserts
+        users = list(
+            User.objects.filter(username__in=[user.username for user in users]).order_by("id")
+        )
+        Profile.objects.bulk_create([Profile(user_id=user) for user in users], batch_size=batch_size)
+
+        onboardings = []
+        interests = []
+        for user in users:
+            fields = _onboarding(rng, hobby_type_ids, hobby_ids)
+            coords = stub_geocode(f"{fields['address_line1']} Chicago, IL 60637")["coords"]
+            interests.append(
+                [fields.pop(key) for key in (
+                    "most_interested_hobby_types",
+                    "most_interested_hobbies",
+                    "least_interested_hobbies",
+                )]
+            )
+            onboardings.append(
+                Onboarding(user_id=user, latitude=coords[0], longitude=coords[1], **fields)
+            )
+        Onboarding.objects.bulk_create(onboardings, batch_size=batch_size)
+        onboardings = list(Onboarding.objects.filter(user_id__in=users).order_by("user_id"))
+
+        for field, i in [
+            ("most_interested_hobby_types", 0),
+            ("most_interested_hobbies", 1),
+            ("least_interested_hobbies", 2),
+        ]:
+            through = getattr(Onboarding, field).through
+            target = "hobbytype_id" if field == "most_interested_hobby_types" else "hobby_id"
+            through.objects.bulk_create(
+                [
+                    through(onboarding_id=onboarding.id, **{target: value})
+                    for onboarding, values in zip(onboardings, interests)
+                    for value in values[i]
+                ],
+                batch_size=batch_size,
+            )
+
+        Availability.objects.bulk_create(
+            [
+                Availability(
+                    user_id=user, day_of_week=day, hour=hour, available=rng.random() < 0.3
+                )
+                for user in users
+                for day, hour in calendar
+            ],
+            batch_size=batch_size,
+        )
+        scenarios = []
+        for user in users:
+            for _ in range(num_scenarios):
+                fields = _scenario(rng, user.id, hobby_ids)
+                scenarios.append(
+                    Scenarios(
+                        user_id_id=fields.pop("user_id"),
+                        hobby1_id=fields.pop("hobby1"),
+                        hobby2_id=fields.pop("hobby2"),
+                        **fields,
+                    )
+                )
+        Scenarios.objects.bulk_create(scenarios, batch_size=batch_size)
+
+        events = []
+        for i in range(num_events):
+            if rng.random() < 0.8:
+                when = now + timedelta(hours=rng.randint(1, 14 * 24))
+            else:
+                when = now - timedelta(hours=rng.randint(1, 14 * 24))
+            address = f"{rng.randint(1, 9999)} N Clark St"
+            coords = stub_geocode(f"{address} Chicago, IL 60610")["coords"]
+            events.append(
+                Event(
+                    title=f"Load test event {i}",
+                    description="A synthetic event for load testing",
+                    hobby_type_id=rng.choice(hobby_type_ids),
+                    created_by=rng.choice(users),
+                    datetime=when,
+                    duration_h=rng.randint(1, 4),
+                    price="Free",
+                    address1=address,
+                    city="Chicago",
+                    state="IL",
+                    zipcode="60610",
+                    latitude=round(coords[0], 10),
+                    longitude=round(coords[1], 11),
+                    max_attendees=rng.randint(5, 50),
+                )
+            )
+        Event.objects.bulk_create(events, batch_size=batch_size)
+        events = list(Event.objects.filter(created_by__in=users).order_by("id"))
+        upcoming = [event for event in events if event.datetime > now]
+
+        UserEvents.objects.bulk_create(
+            [
+                UserEvents(
+                    user_id=user,
+                    event_id=event,
+                    rsvp="Yes" if rng.random() < 0.8 else "No",
+                    attended=event.datetime < now and rng.random() < 0.7,
+                )
+                for user in users
+                for event in rng.sample(events, min(num_rsvps, len(events)))
+            ],
+            batch_size=batch_size,
+        )
+        SuggestionResults.objects.bulk_create(
+            [
+                SuggestionResults(
+                    user_id=user,
+                    event_id=event,
+                    event_date=event.datetime,
+                    probability_of_attendance=rng.random(),
+                )
+                for user in users
+                for event in rng.sample(upcoming, min(num_suggestions, len(upcoming)))
+            ],
+            batch_size=batch_size,
+        )
+
+    save_event_panels(Event.objects.filter(id__in=[event.id for event in events]), batch_size)
+    save_user_preference_panels(Onboarding.objects.filter(user_id__in=users), batch_size)
+    save_scenario_panels(Scenarios.objects.filter(user_id__in=users), batch_size)
+
+    return {
+        "users": len(users),
+        "events": len(events),
+        "availability": len(users) * len(calendar),
+        "scenarios": len(users) * num_scenarios,
+        "user_events": UserEvents.objects.filter(user_id__in=users).count(),
+        "suggestion_results": SuggestionResults.objects.filter(user_id__in=users).count(),
+    }
+
+
+def clear_load_test_data():
+    """
+    Deletes the synthetic users, and with them their events and responses.
+
+    Returns: the number of deleted users
+    """
+    users = User.objects.filter(email__endswith=LOAD_TEST_DOMAIN)
+    Event.objects.filter(created_by__in=users).delete()
+    num_users = users.count()
+    users.delete()
+    return num_users
+
+
+def load_test_token():
+    """
+    Gets the application token of the load test, creating it if needed.
+    """
+    token = ApplicationToken.objects.filter(name=TOKEN_NAME).first()
+    if token is None:
+        token = ApplicationToken.objects.create(name=TOKEN_NAME)
+    return token.token
+
+
+def _availability_items(rng, user_id, num_items=10):
+    return [
+        {"user_id": user_id, "day_of_week": day, "hour": hour, "available": rng.random() < 0.5}
+        for day, hour in rng.sample(calendar, num_items)
+    ]
+
+
+def _submit_onboarding(rng, user_id, context):
+    onboarding = _onboarding(rng, context["hobby_type_ids"], context["hobby_ids"])
+    return {
+        "user_data": {"user_id": user_id},
+        "availability": _availability_items(rng, user_id),
+        "onboarding": {**onboarding, "user_id": user_id},
+        "scenarios": [_scenario(rng, user_id, context["hobby_ids"]) for _ in range(2)],
+    }
+
+
+# name: (method, path, function building the request data of a user)
+ENDPOINTS = {
+    "submit_onboarding": ("post", "/api/submit_onboarding/", _submit_onboarding),
+    "get_suggestions": (
+        "get",
+        "/api/suggestionresults/get_suggestions/",
+        lambda rng, user_id, context: {"user_id": user_id},
+    ),
+    "upcoming_past_events": (
+        "get",
+        "/api/userevents/upcoming_past_events/",
+        lambda rng, user_id, context: {"user_id": user_id},
+    ),
+    "availability_bulk_update": (
+        "post",
+        "/api/availability/bulk_update/",
+        lambda rng, user_id, context: _availability_items(rng, user_id),
+    ),
+}
+
+
+def workload(num_requests, mix=None, seed=0):
+    """
+    Builds a seeded sequence of requests for random synthetic users.
+
+    Inputs:
+        num_requests (int): number of requests
+        mix (dict): relative weight of every endpoint name; defaults to
+            DEFAULT_MIX
+        seed (int): seed of the endpoints, users, and request data
+
+    Returns: a list of (endpoint, method, path, data) tuples
+    """
+    mix = mix or DEFAULT_MIX
+    unknown = set(mix) - set(ENDPOINTS)
+    if unknown:
+        raise ValueError(f"Unknown endpoints {sorted(unknown)}, expected some of {list(ENDPOINTS)}")
+
+    user_ids = list(
+        User.objects.filter(email__endswith=LOAD_TEST_DOMAIN).values_list("id", flat=True)
+    )
+    if not user_ids:
+        raise ValueError("No load test users; create them with load_test_data_m first.")
+    hobby_type_ids, hobby_ids = _hobbies()
+    context = {"hobby_type_ids": hobby_type_ids, "hobby_ids": hobby_ids}
+
+    rng = random.Random(seed)
+    names = rng.choices(list(mix), weights=list(mix.values()), k=num_requests)
+    requests = []
+    for name in names:
+        method, path, build = ENDPOINTS[name]
+        requests.append((name, method, path, build(rng, rng.choice(user_ids), context)))
+    return requests
+
+
+def _worker(requests, results, token, base_url):
+    """
+    Sends requests from a shared iterator until it runs out, appending
+    (endpoint, status, seconds, queries) tuples to results.
+    """
+    if base_url:
+        import requests as http
+
+        session = http.Session()
+        session.headers["X-App-Token"] = token
+    else:
+        client = Client(SERVER_NAME="localhost", HTTP_X_APP_TOKEN=token)
+
+    for name, method, path, data in requests:
+        queries = None
+        start = time.perf_counter()
+        try:
+            if base_url:
+                if method == "get":
+                    response = session.get(base_url.rstrip("/") + path, params=data)
+                else:
+                    response = session.post(base_url.rstrip("/") + path, json=data)
+                status = response.status_code
+                # set by InstrumentationMiddleware
+                if "X-DB-Queries" in response.headers:
+                    queries = int(response.headers["X-DB-Queries"])
+            else:
+                with CaptureQueriesContext(connection) as captured:
+                    if method == "get":
+                        response = client.get(path, data)
+                    else:
+                        response = client.post(
+                            path, json.dumps(data), content_type="application/json"
+                        )
+                status = response.status_code
+                queries = len(captured)
+        except Exception:
+            status = None
+        results.append((name, status, time.perf_counter() - start, queries))
+
+
+def _summary(samples, seconds=None):
+    """
+    Summarizes (endpoint, status, seconds, queries) samples.
+    """
+    latencies = np.array([sample[2] for sample in samples]) * 1000
+    queries = [sample[3] for sample in samples if sample[3] is not None]
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    summary = {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample[1] is None or sample[1] >= 400),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "mean_ms": float(latencies.mean()),
+        "max_ms": float(latencies.max()),
+        "queries_per_request": float(np.mean(queries)) if queries else None,
+        "max_queries": max(queries) if queries else None,
+    }
+    if seconds:
+        summary["requests_per_second"] = len(samples) / seconds
+    return summary
+
+
+def run_load_test(
+    num_requests=200, concurrency=4, mix=None, seed=0, base_url=None, token=None
+):
+    """
+    Replays a workload against the API and measures every request.
+
+    Inputs:
+        num_requests (int): number of requests
+        concurrency (int): number of worker threads sending requests
+        mix (dict): relative weight of every endpoint name; defaults to
+            DEFAULT_MIX
+        seed (int): seed of the workload
+        base_url (str): URL of a running server, i.e. "http://localhost:8000";
+            requests go through the Django test client in this process if
+            not given
+        token (str): application token; defaults to load_test_token()
+
+    Returns: a dictionary with the summary of all requests ("all") and of
+        every endpoint: the number of requests and errors, the p50, p95,
+        p99, mean, and max latency in milliseconds, and the mean and max
+        number of database queries per request
+    """
+    requests = workload(num_requests, mix, seed)
+    token = token or load_test_token()
+
+    results = []
+    shared = iter(requests)
+    lock = threading.Lock()
+
+    def next_request():
+        # the workers share one iterator of the requests
+        while True:
+            with lock:
+                request = next(shared, None)
+            if request is None:
+                return
+            yield request
+
+    def work():
+        try:
+            _worker(next_request(), results, token, base_url)
+        finally:
+            if not base_url:
+                connections.close_all()
+
+    # in process, submit_onboarding geocodes with stub_geocode
+    stub = not base_url and "GEOCODE_STUB" not in os.environ
+    if stub:
+        os.environ["GEOCODE_STUB"] = "1"
+
+    start = time.perf_counter()
+    try:
+        if concurrency <= 1:
+            # in the calling thread, so the requests see its database connection
+            _worker(next_request(), results, token, base_url)
+        else:
+            threads = [threading.Thread(target=work) for _ in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    finally:
+        if stub:
+            del os.environ["GEOCODE_STUB"]
+    seconds = time.perf_counter() - start
+
+    report = {"all": _summary(results, seconds)}
+    for name in sorted({sample[0] for sample in results}):
+        report[name] = _summary([sample for sample in results if sample[0] == name])
+    return report
@@ -0,0 +1,695 @@
+"""
+Vectorized panelization of events, scenarios, and onboarding responses.
+
+The panel tables (PanelEvent, PanelScenario, and PanelUserPreferences) hold
+one-hot boolean encodings of categorical data for the recommendation model.
+The column layout of each panel table and every category-to-column lookup is
+computed once at import time. Whole querysets are then encoded into boolean
+numpy arrays from a single ``values_list`` query per source table, and can be
+turned into DataFrames, dictionaries, or model instances and written back with
+bulk_create/bulk_update.
+
+Categorical values that have no matching column (an unknown hobby type,
+"No preference", a missing value, ...) leave every column of that group False.
+
+Every panel row also stores its boolean columns packed into a bitmask
+(``packed_features``), where bit i is column i of the row's PanelLayout. The
+layouts are therefore the schema registry for the packed column: reading the
+bitmasks back and assembling them in FEATURE_COLUMNS order gives the
+recommendation model's input without serializing any panel row to a dict.
+Each bitmask starts with a hash of the layout's columns, so rows packed
+before a column was added, removed, or reordered are read from their boolean
+columns instead, like rows that have no bitmask.
+
+Since bulk writes don't send post_save, the bulk writers send panels_saved
+once they are done. Panel rows saved one at a time (through the panel API or
+the admin) are repacked on save by a pre_save receiver (see s2s.signals);
+QuerySet.update() bypasses it, so updates of boolean columns must also set
+packed_features (or clear it, so the row is read from its boolean columns).
+"""
+
+import zlib
+
+import numpy as np
+from django.db import models, transaction
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.dispatch import Signal
+from gis.gis_module import distance_bin
+
+from s2s.db_models import (
+    Availability,
+    Event,
+    Onboarding,
+    PanelEvent,
+    PanelScenario,
+    PanelUserPreferences,
+    Scenarios,
+)
+
+BATCH_SIZE = 500
+
+HOBBY_CATEGORIES = {
+    "TRAVEL": "hobby_category_travel",
+    "ARTS AND CULTURE": "hobby_category_arts_and_culture",
+    "LITERATURE": "hobby_category_literature",
+    "FOOD AND DRINK": "hobby_category_food",
+    "COOKING/BAKING": "hobby_category_cooking_and_baking",
+    "SPORT/EXERCISE": "hobby_category_exercise",
+    "OUTDOORS": "hobby_category_outdoor_activities",
+    "CRAFTING": "hobby_category_crafting",
+    "HISTORY AND LEARNING": "hobby_category_history",
+    "COMMUNITY EVENTS": "hobby_category_community",
+    "GAMING": "hobby_category_gaming",
+}
+
+DISTANCES = {
+    "Within 1 mile": "dist_within_1mi",
+    "Within 5 miles": "dist_within_5mi",
+    "Within 10 miles": "dist_within_10mi",
+    "Within 15 miles": "dist_within_15mi",
+    "Within 20 miles": "dist_within_20mi",
+    "Within 30 miles": "dist_within_30mi",
+    "Within 40 miles": "dist_within_40mi",
+    "Within 50 miles": "dist_within_50mi",
+}
+
+NUM_PARTICIPANTS = {
+    "1-5": "num_particip_1to5",
+    "5-10": "num_particip_5to10",
+    "10-15": "num_particip_10to15",
+    "15+": "num_particip_15p",
+}
+
+# upper bounds (inclusive) of the event max_attendees bins, in the same order
+# as NUM_PARTICIPANTS; anything above the last bound falls in the last bin
+NUM_PARTICIPANT_BOUNDS = [5, 10, 15]
+
+SIMILARITY_TO_GROUP = {
+    "Completely dissimilar": "pref_similarity_to_group_1",
+    "Moderately dissimilar": "pref_similarity_to_group_2",
+    "Moderately similar": "pref_similarity_to_group_3",
+    "Completely similar": "pref_similarity_to_group_4",
+}
+
+SIMILARITY_METRICS = {
+    "Gender": "pref_gender_similar",
+    "Race or Ethnicity": "pref_race_similar",
+    "Age range": "pref_age_similar",
+    "Sexual Orientation": "pref_sexual_orientation_similar",
+    "Religious Affiliation": "pref_religion_similar",
+    "Political Leaning": "pref_political_leaning_similar",
+}
+
+DAYS_OF_WEEK = [
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
+
+TIME_PERIODS = {
+    "early_morning": [5, 6, 7, 8],
+    "morning": [9, 10, 11, 12],
+    "afternoon": [13, 14, 15, 16],
+    "evening": [17, 18, 19, 20],
+    "night": [21, 22, 23, 24],
+    "late_night": [1, 2, 3, 4],
+}
+
+HOUR_TO_TIME_PERIOD = {
+    hour: period for period, hours in TIME_PERIODS.items() for hour in hours
+}
+
+# i.e., "Late night (1-4a)" -> "late_night"
+TIME_OF_DAY_TO_TIME_PERIOD = {
+    label: "_".join(label.split("(")[0].strip().lower().split())
+    for label, _ in Scenarios.ALLOWED_TOD
+}
+
+DURATIONS = {i: f"duration_{i}hr" for i in range(1, 9)}
+
+# upper bounds (exclusive, in miles) of the distance bins, in the same order
+# as DISTANCES; anything at or above the last bound falls in no bin
+DISTANCE_BOUNDS = [1, 5, 10, 15, 20, 30, 40, 50]
+DISTANCE_COLUMNS = list(DISTANCES.values())
+
+# sent by the bulk writers after saving panel rows, with the user_ids or the
+# event_ids of the saved rows
+panels_saved = Signal()
+
+
+def pack_bits(array):
+    """
+    Packs every row of a boolean array into a bitmask.
+
+    Returns: a list of bytes objects, one per row
+    """
+    packed = np.packbits(array, axis=1)
+    return [row.tobytes() for row in packed]
+
+
+def unpack_bits(values, num_columns):
+    """
+    Unpacks bitmasks created by pack_bits() back into a boolean array.
+
+    Inputs:
+        values (list): bytes-like bitmasks, one per row
+        num_columns (int): the number of columns of the packed array
+
+    Returns: a boolean array with one row per bitmask
+    """
+    num_bytes = (num_columns + 7) // 8
+    buffer = b"".join(values)
+    if len(buffer) != len(values) * num_bytes:
+        raise ValueError(f"Packed rows are not {num_bytes} bytes wide.")
+    packed = np.frombuffer(buffer, dtype=np.uint8).reshape(len(values), num_bytes)
+    return np.unpackbits(packed, axis=1, count=num_columns).astype(bool)
+
+
+class PanelLayout:
+    """
+    The boolean feature columns of a panel model, in model field order.
+
+    Inputs:
+        model (Model): a panel model (PanelEvent, PanelScenario, ...)
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = [
+            field.name
+            for field in model._meta.concrete_fields
+            if isinstance(field, models.BooleanField)
+        ]
+        self.index = {column: i for i, column in enumerate(self.columns)}
+        # the header of every packed row
+        self.version = zlib.crc32(",".join(self.columns).encode()).to_bytes(4, "big")
+
+    @property
+    def num_bytes(self):
+        """
+        The width of a packed row in bytes, including its layout hash.
+        """
+        return len(self.version) + (len(self.columns) + 7) // 8
+
+    def is_current(self, value):
+        """
+        Returns whether a bitmask was packed with this layout.
+        """
+        return (
+            value is not None
+            and len(value) == self.num_bytes
+            and bytes(value[: len(self.version)]) == self.version
+        )
+
+    def empty(self, num_rows):
+        """
+        Returns an all-False array with one row per panel row.
+        """
+        return np.zeros((num_rows, len(self.columns)), dtype=bool)
+
+    def mark(self, array, columns, rows=None):
+        """
+        Sets array[rows[i], columns[i]] to True for every column name that
+        belongs to this layout; None and unknown column names are skipped.
+
+        Inputs:
+            array (np.ndarray): array created by empty()
+            columns (list): a column name (or None) per entry
+            rows (list): row index per entry; defaults to one entry per row
+        """
+        cols = np.fromiter(
+            (self.index.get(column, -1) for column in columns),
+            dtype=np.int64,
+            count=len(columns),
+        )
+        rows = np.arange(len(columns)) if rows is None else np.asarray(rows)
+        keep = cols >= 0
+        array[rows[keep], cols[keep]] = True
+
+    def pack(self, array):
+        """
+        Packs every row of an encoded array into a bitmask, after the
+        layout hash.
+
+        Returns: a list of bytes objects, one per row
+        """
+        return [self.version + row for row in pack_bits(array)]
+
+    def pack_instance(self, instance):
+        """
+        Packs the boolean columns of a panel model instance into a bitmask.
+        """
+        array = np.array([[getattr(instance, c) for c in self.columns]], dtype=bool)
+        return self.pack(array)[0]
+
+    def unpack(self, values):
+        """
+        Unpacks bitmasks created by pack() back into an encoded array.
+
+        Inputs:
+            values (list): bytes-like bitmasks, one per row
+
+        Returns: a boolean array laid out as this layout
+        """
+        if not all(self.is_current(value) for value in values):
+            raise ValueError(
+                f"Packed {self.model.__name__} rows do not match the current "
+                "panel layout; rebuild them with the panels_m command."
+            )
+        header = len(self.version)
+        return unpack_bits([value[header:] for value in values], len(self.columns))
+
+    def read(self, queryset, *fields):
+        """
+        Reads panel rows back into an encoded array, decoding the packed
+        bitmask of each row. Rows without a bitmask of the current layout
+        (saved before the packed column existed, or packed with other
+        columns) are read from their boolean columns instead.
+
+        Inputs:
+            queryset (QuerySet): panel rows to read
+            fields (str): other columns to return, i.e. "user_id"
+
+        Returns: (*values, array): one array per requested field and a
+            boolean array laid out as this layout
+        """
+        rows = list(queryset.values_list("id", *fields, "packed_features"))
+        array = self.empty(len(rows))
+
+        current = [self.is_current(row[-1]) for row in rows]
+        packed = [i for i, ok in enumerate(current) if ok]
+        if packed:
+            array[packed] = self.unpack([rows[i][-1] for i in packed])
+
+        unpacked = {
+            row[0]: i for i, (row, ok) in enumerate(zip(rows, current)) if not ok
+        }
+        if unpacked:
+            columns = self.model.objects.filter(id__in=list(unpacked)).values_list(
+                "id", *self.columns
+            )
+            for pk, *values in columns:
+                array[unpacked[pk]] = values
+
+        values = _columns(rows, len(fields) + 2)[1:-1]
+        return (*(np.array(value, dtype=np.int64) for value in values), array)
+
+    def to_frame(self, array, index=None):
+        """
+        Converts an encoded array into a DataFrame with one column per field.
+        """
+        import pandas as pd
+
+        return pd.DataFrame(array, columns=self.columns, index=index)
+
+    def to_dicts(self, array):
+        """
+        Converts an encoded array into a list of {column: bool} dictionaries.
+        """
+        return [dict(zip(self.columns, row)) for row in array.tolist()]
+
+    def to_instances(self, array, **fields):
+        """
+        Builds unsaved model instances from an encoded array.
+
+        Inputs:
+            array (np.ndarray): encoded panel rows
+            fields: non-boolean model attributes, each a sequence with one
+                value per row (i.e., event_id_id=[1, 2, 3])
+        """
+        names = list(fields)
+        values = list(zip(*fields.values())) if names else [()] * len(array)
+        return [
+            self.model(
+                **dict(zip(self.columns, row)),
+                **dict(zip(names, extra)),
+                packed_features=packed,
+            )
+            for row, extra, packed in zip(array.tolist(), values, self.pack(array))
+        ]
+
+
+EVENT_LAYOUT = PanelLayout(PanelEvent)
+SCENARIO_LAYOUT = PanelLayout(PanelScenario)
+USER_PREFERENCES_LAYOUT = PanelLayout(PanelUserPreferences)
+LAYOUTS = {
+    layout.model: layout
+    for layout in (EVENT_LAYOUT, SCENARIO_LAYOUT, USER_PREFERENCES_LAYOUT)
+}
+
+# the recommendation model's features in token order: the model sorts the
+# combined user preference, event, and distance columns by name
+FEATURE_COLUMNS = sorted(
+    USER_PREFERENCES_LAYOUT.columns + EVENT_LAYOUT.columns + DISTANCE_COLUMNS
+)
+
+
+def _queryset(model, objects):
+    """
+    Returns objects as a queryset of model, accepting a queryset, a single
+    instance, or an iterable of instances.
+    """
+    if isinstance(objects, models.QuerySet):
+        return objects
+    if isinstance(objects, model):
+        objects = [objects]
+    return model.objects.filter(pk__in=[obj.pk for obj in objects])
+
+
+def _columns(rows, num_columns):
+    """
+    Transposes values_list rows into one tuple per column.
+    """
+    return list(zip(*rows)) if rows else [()] * num_columns
+
+
+def _day_period(day, period):
+    if day is None or period is None:
+        return None
+    return f"{day}_{period}"
+
+
+def encode_distances(distances):
+    """
+    Encodes distances into the one-hot distance bins.
+
+    Inputs:
+        distances (list): distances in miles; None for an unknown distance
+
+    Returns: a boolean array with one row per distance, laid out as
+        DISTANCE_COLUMNS
+    """
+    distances = np.array(distances, dtype=float).reshape(-1)
+    bins = np.searchsorted(DISTANCE_BOUNDS, distances, side="right")
+    array = np.zeros((len(distances), len(DISTANCE_COLUMNS)), dtype=bool)
+    keep = (bins < len(DISTANCE_BOUNDS)) & ~np.isnan(distances)
+    array[np.flatnonzero(keep), bins[keep]] = True
+    return array
+
+
+def measure_distances(origins, destinations):
+    """
+    Measures the distance between pairs of coordinates.
+
+    Inputs:
+        origins (list): (latitude, longitude) tuples
+        destinations (list): (latitude, longitude) tuples
+
+    Returns: a list of distances in miles, None where a coordinate is missing
+    """
+    return [
+        (
+            distance_bin(origin, destination)[0]
+            if None not in (*origin, *destination)
+            else None
+        )
+        for origin, destination in zip(origins, destinations)
+    ]
+
+
+def model_features(*parts):
+    """
+    Assembles the recommendation model's feature array from encoded panel
+    arrays; columns that are not model features (i.e. attended_event) are
+    dropped.
+
+    Inputs:
+        parts: (columns, array) pairs with the same number of rows, which
+            together cover FEATURE_COLUMNS
+
+    Returns: a boolean array laid out as FEATURE_COLUMNS
+    """
+    index = {}
+    for columns, _ in parts:
+        index.update((column, len(index)) for column in columns)
+    order = [index[column] for column in FEATURE_COLUMNS]
+    return np.hstack([array for _, array in parts])[:, order]
+
+
+def encode_events(events):
+    """
+    Encodes events into PanelEvent rows.
+
+    Inputs:
+        events: a queryset or iterable of Event objects
+
+    Returns: (event_ids, array): an array of event IDs and a boolean array
+        laid out as EVENT_LAYOUT, one row per event
+    """
+    rows = list(
+        _queryset(Event, events)
+        .annotate(
+            panel_weekday=ExtractIsoWeekDay("datetime"),
+            panel_hour=ExtractHour("datetime"),
+        )
+        .values_list(
+            "id",
+            "hobby_type__type",
+            "max_attendees",
+            "panel_weekday",
+            "panel_hour",
+            "duration_h",
+        )
+    )
+    ids, hobby_types, max_attendees, weekdays, hours, durations = _columns(rows, 6)
+
+    layout = EVENT_LAYOUT
+    array = layout.empty(len(rows))
+    layout.mark(array, [HOBBY_CATEGORIES.get(t) for t in hobby_types])
+
+    participant_columns = list(NUM_PARTICIPANTS.values())
+    bins = np.digitize(max_attendees, NUM_PARTICIPANT_BOUNDS, right=True)
+    layout.mark(array, [participant_columns[i] for i in bins.tolist()])
+
+    layout.mark(
+        array,
+        [
+            _day_period(DAYS_OF_WEEK[weekday - 1], HOUR_TO_TIME_PERIOD.get(hour))
+            for weekday, hour in zip(weekdays, hours)
+        ],
+    )
+    layout.mark(array, [DURATIONS.get(d) for d in durations])
+
+    return np.array(ids, dtype=np.int64), array
+
+
+def encode_scenarios(scenarios):
+    """
+    Encodes scenarios into PanelScenario rows. Each scenario yields two rows,
+    one for each of its events, with attended_event set to whether the user
+    preferred that event.
+
+    Inputs:
+        scenarios: a queryset or iterable of Scenarios objects
+
+    Returns: (scenario_ids, user_ids, array): per-row scenario and user IDs
+        and a boolean array laid out as SCENARIO_LAYOUT
+    """
+    rows = list(
+        _queryset(Scenarios, scenarios)
+        .exclude(prefers_event1__isnull=True, prefers_event2__isnull=True)
+        .values_list(
+            "id",
+            "user_id",
+            "hobby1__type__type",
+            "distance1",
+            "num_participants1",
+            "day_of_week1",
+            "time_of_day1",
+            "duration_h1",
+            "prefers_event1",
+            "hobby2__type__type",
+            "distance2",
+            "num_participants2",
+            "day_of_week2",
+            "time_of_day2",
+            "duration_h2",
+            "prefers_event2",
+        )
+    )
+
+    # interleave the two events of every scenario: event 1 rows are even and
+    # event 2 rows are odd
+    events = [event for row in rows for event in (row[2:9], row[9:16])]
+    hobby_types, distances, participants, days, times, durations, prefers = (
+        _columns(events, 7)
+    )
+
+    layout = SCENARIO_LAYOUT
+    array = layout.empty(len(events))
+    layout.mark(array, [HOBBY_CATEGORIES.get(t) for t in hobby_types])
+    layout.mark(array, [DISTANCES.get(d) for d in distances])
+    layout.mark(array, [NUM_PARTICIPANTS.get(p) for p in participants])
+    layout.mark(
+        array,
+        [
+            _day_period(day and day.lower(), TIME_OF_DAY_TO_TIME_PERIOD.get(time))
+            for day, time in zip(days, times)
+        ],
+    )
+    layout.mark(array, [DURATIONS.get(d) for d in durations])
+    layout.mark(array, ["attended_event" if p else None for p in prefers])
+
+    scenario_ids = np.repeat(np.array([row[0] for row in rows], dtype=np.int64), 2)
+    user_ids = np.repeat(np.array([row[1] for row in rows], dtype=np.int64), 2)
+    return scenario_ids, user_ids, array
+
+
+def encode_user_preferences(onboardings):
+    """
+    Encodes users' onboarding responses and availability into
+    PanelUserPreferences rows.
+
+    Inputs:
+        onboardings: a queryset or iterable of Onboarding objects
+
+    Returns: (user_ids, array): an array of user IDs and a boolean array laid
+        out as USER_PREFERENCES_LAYOUT, one row per onboarding row
+    """
+    rows = list(
+        _queryset(Onboarding, onboardings).values_list(
+            "id",
+            "user_id",
+            "num_participants",
+            "distance",
+            "similarity_to_group",
+            "similarity_metrics",
+        )
+    )
+    onboarding_ids, user_ids, participants, distances, similarity, metrics = (
+        _columns(rows, 6)
+    )
+
+    layout = USER_PREFERENCES_LAYOUT
+    array = layout.empty(len(rows))
+
+    distance_columns = {k: f"pref_{v}" for k, v in DISTANCES.items()}
+    layout.mark(array, [distance_columns.get(d) for d in distances])
+    layout.mark(array, [SIMILARITY_TO_GROUP.get(s) for s in similarity])
+
+    # multi-valued responses are marked as (row, column) pairs
+    row_of_onboarding = {pk: i for i, pk in enumerate(onboarding_ids)}
+    row_of_user = {pk: i for i, pk in enumerate(user_ids)}
+    participant_columns = {k: f"pref_{v}" for k, v in NUM_PARTICIPANTS.items()}
+    pairs = []
+    for i, (choices, chosen_metrics) in enumerate(zip(participants, metrics)):
+        pairs.extend((i, participant_columns.get(p)) for p in choices or [])
+        pairs.extend((i, SIMILARITY_METRICS.get(m)) for m in chosen_metrics or [])
+
+    hobby_types = Onboarding.most_interested_hobby_types.through.objects.filter(
+        onboarding_id__in=onboarding_ids
+    ).values_list("onboarding_id", "hobbytype__type")
+    for onboarding_id, hobby_type in hobby_types:
+        column = HOBBY_CATEGORIES.get(hobby_type)
+        pairs.append((row_of_onboarding[onboarding_id], column and f"pref_{column}"))
+
+    # a time period is preferred if the user is available for any of its hours
+    availability = Availability.objects.filter(
+        user_id__in=user_ids, available=True
+    ).values_list("user_id", "day_of_week", "hour")
+    for user_id, day, hour in availability:
+        period = _day_period(day.lower(), HOUR_TO_TIME_PERIOD.get(int(hour)))
+        pairs.append((row_of_user[user_id], period and f"pref_{period}"))
+
+    if pairs:
+        pair_rows, pair_columns = zip(*pairs)
+        layout.mark(array, pair_columns, rows=pair_rows)
+
+    return np.array(user_ids, dtype=np.int64), array
+
+
+def _upsert(layout, key, keys, array, batch_size):
+    """
+    Writes one panel row per key, updating the existing row for a key (and
+    deleting any duplicates of it) or creating a new one.
+
+    Returns: (created, updated): the number of created and updated rows
+    """
+    existing, duplicates = {}, []
+    rows = (
+        layout.model.objects.filter(**{f"{key}__in": keys.tolist()})
+        .order_by("id")
+        .values_list(key, "id")
+    )
+    for value, pk in rows:
+        if value in existing:
+            duplicates.append(pk)
+        else:
+            existing[value] = pk
+
+    instances = layout.to_instances(array, **{f"{key}_id": keys.tolist()})
+    to_update, to_create = [], []
+    for instance, value in zip(instances, keys.tolist()):
+        if value in existing:
+            instance.pk = existing[value]
+            to_update.append(instance)
+        else:
+            to_create.append(instance)
+
+    with transaction.atomic():
+        if duplicates:
+            layout.model.objects.filter(id__in=duplicates).delete()
+        layout.model.objects.bulk_update(
+            to_update, layout.columns + ["packed_features"], batch_size
+        )
+        layout.model.objects.bulk_create(to_create, batch_size)
+
+    panels_saved.send(sender=layout.model, **{f"{key}s": keys.tolist()})
+    return len(to_create), len(to_update)
+
+
+def save_event_panels(events, batch_size=BATCH_SIZE):
+    """
+    Creates or updates the PanelEvent row of every event.
+
+    Inputs:
+        events: a queryset or iterable of Event objects
+        batch_size (int): number of rows per bulk query
+
+    Returns: (created, updated): the number of created and updated rows
+    """
+    event_ids, array = encode_events(events)
+    return _upsert(EVENT_LAYOUT, "event_id", event_ids, array, batch_size)
+
+
+def save_user_preference_panels(onboardings, batch_size=BATCH_SIZE):
+    """
+    Creates or updates the PanelUserPreferences row of every onboarded user.
+
+    Inputs:
+        onboardings: a queryset or iterable of Onboarding objects
+        batch_size (int): number of rows per bulk query
+
+    Returns: (created, updated): the number of created and updated rows
+    """
+    user_ids, array = encode_user_preferences(onboardings)
+    return _upsert(USER_PREFERENCES_LAYOUT, "user_id", user_ids, array, batch_size)
+
+
+def save_scenario_panels(scenarios, batch_size=BATCH_SIZE):
+    """
+    Replaces the PanelScenario rows of every scenario.
+
+    Inputs:
+        scenarios: a queryset or iterable of Scenarios objects
+        batch_size (int): number of rows per bulk query
+
+    Returns: (created, deleted): the number of created and replaced rows
+    """
+    scenario_ids, user_ids, array = encode_scenarios(scenarios)
+    instances = SCENARIO_LAYOUT.to_instances(
+        array, scenario_id_id=scenario_ids.tolist(), user_id_id=user_ids.tolist()
+    )
+
+    with transaction.atomic():
+        deleted, _ = PanelScenario.objects.filter(
+            scenario_id__in=np.unique(scenario_ids).tolist()
+        ).delete()
+        PanelScenario.objects.bulk_create(instances, batch_size)
+
+    panels_saved.send(sender=PanelScenario, user_ids=np.unique(user_ids).tolist())
+    return len(instances), deleted
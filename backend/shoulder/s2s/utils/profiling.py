@@ -0,0 +1,297 @@
+"""
+Opt-in profiling of requests and management commands.
+
+profile(name, mode) profiles the code run in the block and writes the results
+to the PROFILING_DIR setting, named <name>-<timestamp>:
+
+    "sampling": a thread samples the stack of the profiled thread every
+        SAMPLE_INTERVAL seconds and writes the counts of the stacks in the
+        collapsed format (<name>.folded), which flamegraph.pl, speedscope, and
+        inferno render as flame graphs
+    "cprofile": cProfile records every function call (<name>.prof); view it
+        with snakeviz or render a flame graph with flameprof. A text report of
+        the slowest functions is written next to it (<name>.txt). Only one
+        cProfile profiler can run at a time, so while one runs (i.e. in
+        another thread of the worker), other blocks are sampled instead
+
+Both modes write a JSON summary (<name>.json) with the wall time, the database
+queries and time, the time of the calls marked with
+s2s.utils.instrumentation.timed, and the JAX compilation events and their
+durations. JAX doesn't report execution times, so ml_execute_seconds is the ML
+time minus the compilation time.
+
+Staff users profile a request by sending an X-Profile header or a profile
+query parameter (ProfilingMiddleware), with the mode as the value ("1" uses
+PROFILING_MODE); the response's X-Profile header holds the output name. The
+update_suggestions_m, finetune_model_m, and recurring_events_m commands take
+--profile [mode].
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+
+from django.conf import settings
+
+from .instrumentation import CATEGORIES, collect, current_metrics
+
+MODES = ("sampling", "cprofile")
+SAMPLE_INTERVAL = 0.005
+
+# held by the running cProfile profiler
+_cprofile_lock = threading.Lock()
+_jax_lock = threading.Lock()
+_jax_recorders = []
+_jax_registered = False
+
+
+def profiling_dir():
+    return getattr(settings, "PROFILING_DIR", os.path.join(settings.BASE_DIR, "profiles"))
+
+
+def default_mode():
+    return getattr(settings, "PROFILING_MODE", "sampling")
+
+
+class Sampler(threading.Thread):
+    """
+    Samples the stack of a thread every interval seconds.
+
+    Inputs:
+        thread_id (int): the ident of the thread to sample
+        interval (float): seconds between samples
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_fold(frame)] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def folded(self):
+        """
+        Returns: the stacks in the collapsed format, one "a;b;c count" line
+            per stack
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in sorted(self.stacks.items())
+        )
+
+
+def _fold(frame):
+    """
+    Formats a stack as "module:function;..." from the outermost frame.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{code.co_qualname}".replace(";", ":").replace(" ", "_"))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _record_jax_event(event, duration, **kwargs):
+    with _jax_lock:
+        for recorder in _jax_recorders:
+            count, seconds = recorder.get(event, (0, 0.0))
+            recorder[event] = (count + 1, seconds + duration)
+
+
+def _listen_to_jax():
+    """
+    Registers the JAX duration listener once per process, if JAX is
+    installed; JAX has no way to unregister it, so it forwards the events to
+    the active profiles instead.
+    """
+    global _jax_registered
+    with _jax_lock:
+        if _jax_registered:
+            return True
+        try:
+            import jax.monitoring
+        except ImportError:
+            return False
+        jax.monitoring.register_event_duration_secs_listener(_record_jax_event)
+        _jax_registered = True
+        return True
+
+
+class Profile:
+    """
+    The results of a profile: the paths of the output files (paths) and the
+    summary.
+    """
+
+    def __init__(self, name, mode, directory):
+        self.name = name
+        self.mode = mode
+        self.directory = directory
+        self.stem = f"{name}-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+        self.paths = []
+        self.summary = {}
+
+    def write(self, suffix, text):
+        path = os.path.join(self.directory, self.stem + suffix)
+        with open(path, "w") as file:
+            file.write(text)
+        self.paths.append(path)
+        return path
+
+
+@contextmanager
+def profile(name, mode=None, directory=None, interval=SAMPLE_INTERVAL):
+    """
+    Profiles the code run in the block.
+
+    Inputs:
+        name (str): the prefix of the output files
+        mode (str): "sampling" or "cprofile"; None profiles nothing and
+            yields None
+        directory (str): where to write the output; defaults to the
+            PROFILING_DIR setting
+        interval (float): seconds between samples of "sampling"
+
+    Returns: the Profile, whose paths and summary are filled in on exit
+    """
+    if mode is None:
+        yield None
+        return
+    if mode not in MODES:
+        raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {MODES}")
+
+    directory = directory or profiling_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    # Python refuses to enable a second cProfile profiler
+    profiling_calls = mode == "cprofile" and _cprofile_lock.acquire(blocking=False)
+    if mode == "cprofile" and not profiling_calls:
+        mode = "sampling"
+    result = Profile(name, mode, directory)
+
+    jax_events = {}
+    listening = _listen_to_jax()
+    with _jax_lock:
+        _jax_recorders.append(jax_events)
+
+    with ExitStack() as stack:
+        if profiling_calls:
+            stack.callback(_cprofile_lock.release)
+        # inside a request the middleware is already collecting
+        metrics = current_metrics() or stack.enter_context(collect())
+        before = (metrics.db_queries, metrics.db_seconds, dict(metrics.seconds))
+
+        if mode == "sampling":
+            profiler = Sampler(threading.get_ident(), interval)
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            seconds = time.perf_counter() - start
+            if mode == "sampling":
+                profiler.stop()
+            else:
+                profiler.disable()
+            with _jax_lock:
+                _jax_recorders.remove(jax_events)
+
+            if mode == "sampling":
+                result.write(".folded", profiler.folded())
+            else:
+                path = os.path.join(directory, result.stem + ".prof")
+                profiler.dump_stats(path)
+                result.paths.append(path)
+                report = io.StringIO()
+                pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(50)
+                result.write(".txt", report.getvalue())
+
+            compile_seconds = sum(
+                duration for event, (_, duration) in jax_events.items()
+                if event.startswith("/jax/core/compile/")
+            )
+            ml_seconds = metrics.seconds["ml"] - before[2]["ml"]
+            result.summary = {
+                "name": name,
+                "mode": mode,
+                "seconds": seconds,
+                "db_queries": metrics.db_queries - before[0],
+                "db_seconds": metrics.db_seconds - before[1],
+                **{
+                    f"{category}_seconds": metrics.seconds[category] - before[2][category]
+                    for category in CATEGORIES
+                },
+                "jax": {
+                    "listening": listening,
+                    "compile_seconds": compile_seconds,
+                    "compilations": jax_events.get(
+                        "/jax/core/compile/backend_compile_duration", (0, 0.0)
+                    )[0],
+                    "events": {
+                        event: {"count": count, "seconds": duration}
+                        for event, (count, duration) in sorted(jax_events.items())
+                    },
+                },
+                "ml_execute_seconds": max(ml_seconds - compile_seconds, 0.0),
+            }
+            result.write(".json", json.dumps(result.summary, indent=2, sort_keys=True))
+
+
+def add_profile_argument(parser):
+    """
+    Adds --profile [mode] and --profile-dir to a management command.
+    """
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="default",
+        choices=MODES + ("default",),
+        help="Profile the command (sampling or cprofile, defaults to the PROFILING_MODE setting)",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help="Directory to write the profile to, defaults to the PROFILING_DIR setting",
+    )
+
+
+def command_profile(name, kwargs):
+    """
+    Returns: the profile context of a command run with add_profile_argument's
+        options
+    """
+    mode = kwargs.get("profile")
+    if mode == "default":
+        mode = default_mode()
+    return profile(name, mode, kwargs.get("profile_dir"))
+
+
+def requested_mode(request):
+    """
+    Returns: the profiling mode a request asks for, or None
+    """
+    value = request.headers.get("X-Profile") or request.GET.get("profile")
+    if not value or value in ("0", "false"):
+        return None
+    return value if value in MODES else default_mode()
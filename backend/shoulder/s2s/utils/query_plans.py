@@ -0,0 +1,97 @@
+"""
+Query plans and timings of the hottest lookups, to check the indexes and
+unique constraints of migration 0008 (unique_constraints_and_indexes).
+
+measure_queries runs every query in HOT_QUERIES against the current database
+(seed it first, i.e. with load_test_data_m) and returns its plan (EXPLAIN) and
+median time. query_plans_m measures the schema before and after the migration
+by migrating s2s back to 0007 and forward again, to the latest migration of
+s2s (leaf_migration); since that drops the tables of every later migration,
+it refuses to unless 0008 is the latest, or it's forced.
+"""
+
+import random
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from s2s.db_models import Availability, Event, SuggestionResults, UserEvents
+
+BEFORE_MIGRATION = "0007_delete_duplicates"
+AFTER_MIGRATION = "0008_unique_constraints_and_indexes"
+
+# the hot lookups, by name: a function of a user id and an event id that
+# returns the queryset
+HOT_QUERIES = {
+    "availability_slot": lambda user_id, event_id: Availability.objects.filter(
+        user_id=user_id, day_of_week="Monday", hour=9
+    ),
+    "suggestion_for_event": lambda user_id, event_id: SuggestionResults.objects.filter(
+        user_id=user_id, event_id=event_id
+    ),
+    "top_suggestions": lambda user_id, event_id: SuggestionResults.objects.filter(
+        user_id=user_id
+    ).order_by("-probability_of_attendance")[:10],
+    "user_event": lambda user_id, event_id: UserEvents.objects.filter(
+        user_id=user_id, event_id=event_id
+    ),
+    "upcoming_events": lambda user_id, event_id: Event.objects.filter(
+        datetime__gte=timezone.now(), datetime__lt=timezone.now() + timedelta(days=14)
+    ),
+}
+
+
+def leaf_migration():
+    """
+    Returns: the name of the latest migration of s2s
+    """
+    loader = MigrationLoader(connection)
+    (leaf,) = loader.graph.leaf_nodes("s2s")
+    return leaf[1]
+
+
+def _sample_ids(model, size, rng):
+    """
+    Samples ids between the smallest and largest id of a table.
+    """
+    bounds = model.objects.aggregate(low=Min("id"), high=Max("id"))
+    if bounds["low"] is None:
+        return [0] * size
+    return [rng.randint(bounds["low"], bounds["high"]) for _ in range(size)]
+
+
+def measure_queries(repeat=50, seed=0):
+    """
+    Explains and times every query in HOT_QUERIES.
+
+    Inputs:
+        repeat (int): number of times to run every query, each for a
+            different random user and event
+        seed (int): seed of the users and events
+
+    Returns: a dictionary of the query names to their plan (a string) and the
+        median and p95 time in milliseconds
+    """
+    rng = random.Random(seed)
+    from django.contrib.auth.models import User
+
+    user_ids = _sample_ids(User, repeat, rng)
+    event_ids = _sample_ids(Event, repeat, rng)
+
+    results = {}
+    for name, query in HOT_QUERIES.items():
+        plan = query(user_ids[0], event_ids[0]).explain()
+        seconds = []
+        for user_id, event_id in zip(user_ids, event_ids):
+            queryset = query(user_id, event_id)
+            start = time.perf_counter()
+            list(queryset)
+            seconds.append(time.perf_counter() - start)
+        p50, p95 = np.percentile(np.array(seconds) * 1000, [50, 95])
+        results[name] = {"plan": plan, "p50_ms": float(p50), "p95_ms": float(p95)}
+    return results
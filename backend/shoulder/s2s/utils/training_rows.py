@@ -0,0 +1,388 @@
+"""
+Materialized training data for the recommendation model.
+
+TrainingRow holds one fully featurized row per PanelScenario row (pretraining
+data) and per UserEvents row (finetuning data), with the model features packed
+into a bitmask in FEATURE_COLUMNS order. The receivers in s2s.signals refresh
+the rows of a user or an event whenever its panel or UserEvents rows are
+saved, a user's preferences panel is deleted, or a user's onboarding (whose
+location gives the distance bins) is saved (and re-panelize an event whenever
+it is saved), and the training_rows_m command rebuilds the whole table. Training then
+reads the table with a single sequential scan instead of re-joining the panel
+tables.
+
+Rows are only built when both sides of the join exist: a scenario or UserEvents
+row of a user without a PanelUserPreferences row, or of an event without a
+PanelEvent row, is skipped until that panel is saved.
+"""
+
+import json
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from s2s.db_models import (
+    Onboarding,
+    PanelEvent,
+    PanelScenario,
+    PanelUserPreferences,
+    TrainingRow,
+    UserEvents,
+)
+from s2s.utils.panelization import (
+    BATCH_SIZE,
+    DISTANCE_COLUMNS,
+    EVENT_LAYOUT,
+    FEATURE_COLUMNS,
+    SCENARIO_LAYOUT,
+    USER_PREFERENCES_LAYOUT,
+    encode_distances,
+    measure_distances,
+    model_features,
+    pack_bits,
+    unpack_bits,
+)
+
+SCENARIO = "scenario"
+EVENT = "event"
+SOURCES = [SCENARIO, EVENT]
+
+
+def _filter(queryset, **values):
+    """
+    Filters a queryset with a field__in lookup for every field whose values
+    are not None.
+    """
+    lookups = {
+        f"{field}__in": list(value)
+        for field, value in values.items()
+        if value is not None
+    }
+    return queryset.filter(**lookups)
+
+
+def _first_panels(layout, queryset, key):
+    """
+    Reads panel rows, keeping the oldest row of every key.
+
+    Returns: (row_of_key, array): the array row of every key and the boolean
+        array laid out as layout
+    """
+    keys, array = layout.read(queryset.order_by("-id"), key)
+
+    # later rows win in the dict, so descending IDs keep the oldest panel
+    return dict(zip(keys.tolist(), range(len(keys)))), array
+
+
+def scenario_rows(user_ids=None):
+    """
+    Builds the pretraining rows of the PanelScenario rows of users.
+
+    Inputs:
+        user_ids (list): users to build rows for; defaults to all users
+
+    Returns: a list of unsaved TrainingRow objects
+    """
+    panels = _filter(PanelScenario.objects.all(), user_id=user_ids).order_by("id")
+    panel_ids, panel_user_ids, scenarios = SCENARIO_LAYOUT.read(
+        panels, "id", "user_id"
+    )
+    row_of_user, preferences = _first_panels(
+        USER_PREFERENCES_LAYOUT,
+        PanelUserPreferences.objects.filter(
+            user_id__in=np.unique(panel_user_ids).tolist()
+        ),
+        "user_id",
+    )
+
+    rows = np.array(
+        [row_of_user.get(pk, -1) for pk in panel_user_ids.tolist()], dtype=np.int64
+    )
+    keep = rows >= 0
+    features = model_features(
+        (USER_PREFERENCES_LAYOUT.columns, preferences[rows[keep]]),
+        (SCENARIO_LAYOUT.columns, scenarios[keep]),
+    )
+    attended = scenarios[keep, SCENARIO_LAYOUT.index["attended_event"]]
+
+    return [
+        TrainingRow(
+            user_id_id=user_id,
+            source=SCENARIO,
+            scenario_panel_id_id=panel_id,
+            features=packed,
+            attended_event=attended_event,
+        )
+        for panel_id, user_id, packed, attended_event in zip(
+            panel_ids[keep].tolist(),
+            panel_user_ids[keep].tolist(),
+            pack_bits(features),
+            attended.tolist(),
+        )
+    ]
+
+
+def event_rows(user_ids=None, event_ids=None):
+    """
+    Builds the finetuning rows of the UserEvents rows of users and events.
+
+    Inputs:
+        user_ids (list): users to build rows for; defaults to all users
+        event_ids (list): events to build rows for; defaults to all events
+
+    Returns: a list of unsaved TrainingRow objects
+    """
+    user_events = list(
+        _filter(UserEvents.objects.all(), user_id=user_ids, event_id=event_ids)
+        .order_by("id")
+        .values_list(
+            "id",
+            "user_id",
+            "event_id",
+            "attended",
+            "event_id__datetime",
+            "event_id__latitude",
+            "event_id__longitude",
+        )
+    )
+
+    users = {row[1] for row in user_events}
+    row_of_user, preferences = _first_panels(
+        USER_PREFERENCES_LAYOUT,
+        PanelUserPreferences.objects.filter(user_id__in=users),
+        "user_id",
+    )
+    row_of_event, events = _first_panels(
+        EVENT_LAYOUT,
+        PanelEvent.objects.filter(event_id__in={row[2] for row in user_events}),
+        "event_id",
+    )
+    user_locations = {
+        user_id: (latitude, longitude)
+        for user_id, latitude, longitude in Onboarding.objects.filter(
+            user_id__in=users
+        ).values_list("user_id", "latitude", "longitude")
+    }
+
+    user_events = [
+        row
+        for row in user_events
+        if row[1] in row_of_user and row[2] in row_of_event
+    ]
+    distances = measure_distances(
+        [user_locations.get(row[1], (None, None)) for row in user_events],
+        [row[5:7] for row in user_events],
+    )
+    features = model_features(
+        (
+            USER_PREFERENCES_LAYOUT.columns,
+            preferences[[row_of_user[row[1]] for row in user_events]],
+        ),
+        (EVENT_LAYOUT.columns, events[[row_of_event[row[2]] for row in user_events]]),
+        (DISTANCE_COLUMNS, encode_distances(distances)),
+    )
+
+    return [
+        TrainingRow(
+            user_id_id=user_id,
+            source=EVENT,
+            user_event_id_id=user_event_id,
+            event_id_id=event_id,
+            event_date=event_date,
+            features=packed,
+            attended_event=attended,
+        )
+        for (user_event_id, user_id, event_id, attended, event_date, *_), packed in zip(
+            user_events, pack_bits(features)
+        )
+    ]
+
+
+def refresh_training_rows(
+    user_ids=None, event_ids=None, sources=SOURCES, batch_size=BATCH_SIZE
+):
+    """
+    Replaces the training rows of users and events.
+
+    Inputs:
+        user_ids (list): users to refresh; defaults to all users
+        event_ids (list): events to refresh; defaults to all events. Scenario
+            rows don't depend on events, so they are only refreshed when
+            event_ids is None
+        sources (list): which rows to refresh, "scenario" and/or "event"
+        batch_size (int): number of rows per bulk query
+
+    Returns: the number of rows created
+    """
+    rows = []
+    with transaction.atomic():
+        if SCENARIO in sources and event_ids is None:
+            _filter(TrainingRow.objects.filter(source=SCENARIO), user_id=user_ids).delete()
+            rows += TrainingRow.objects.bulk_create(scenario_rows(user_ids), batch_size)
+
+        if EVENT in sources:
+            _filter(
+                TrainingRow.objects.filter(source=EVENT),
+                user_id=user_ids,
+                event_id=event_ids,
+            ).delete()
+            rows += TrainingRow.objects.bulk_create(
+                event_rows(user_ids, event_ids), batch_size
+            )
+
+    return len(rows)
+
+
+def rebuild_training_rows(batch_size=BATCH_SIZE):
+    """
+    Rebuilds the training rows of every user, batch_size users at a time.
+
+    Returns: the number of rows created
+    """
+    user_ids = list(User.objects.order_by("id").values_list("id", flat=True))
+    created = 0
+    for start in range(0, len(user_ids), batch_size):
+        created += refresh_training_rows(
+            user_ids=user_ids[start : start + batch_size], batch_size=batch_size
+        )
+    return created
+
+
+def iter_training_rows(source, since=None, batch_size=BATCH_SIZE):
+    """
+    Streams the packed training rows of a source, in ID order, with a single
+    sequential scan.
+
+    Inputs:
+        source (str): "scenario" for pretraining rows, "event" for finetuning
+            rows
+        since (datetime): only read rows of events on or after this time
+        batch_size (int): number of rows per chunk
+
+    Yields: (packed, user_ids, targets): lists with the packed features, the
+        user ID, and the attended_event of up to batch_size rows
+    """
+    rows = TrainingRow.objects.filter(source=source)
+    if since is not None:
+        rows = rows.filter(event_date__gte=since)
+
+    packed, user_ids, targets = [], [], []
+    for features, user_id, attended in (
+        rows.order_by("id")
+        .values_list("features", "user_id", "attended_event")
+        .iterator(chunk_size=batch_size)
+    ):
+        packed.append(bytes(features))
+        user_ids.append(user_id)
+        targets.append(attended)
+
+        if len(packed) == batch_size:
+            yield packed, user_ids, targets
+            packed, user_ids, targets = [], [], []
+
+    if packed:
+        yield packed, user_ids, targets
+
+
+def read_training_rows(source, since=None):
+    """
+    Reads the training rows of a source with a single sequential scan.
+
+    Inputs:
+        source (str): "scenario" for pretraining rows, "event" for finetuning
+            rows
+        since (datetime): only read rows of events on or after this time
+
+    Returns: (features, user_ids, targets): a boolean array laid out as
+        FEATURE_COLUMNS, and the user ID and attended_event of every row
+    """
+    packed, user_ids, targets = [], [], []
+    for chunk in iter_training_rows(source, since):
+        packed += chunk[0]
+        user_ids += chunk[1]
+        targets += chunk[2]
+
+    return (
+        unpack_bits(packed, len(FEATURE_COLUMNS)),
+        np.array(user_ids, dtype=np.int64),
+        np.array(targets, dtype=bool),
+    )
+
+
+def training_row_dicts(features, user_ids, targets):
+    """
+    Lays out training rows as dictionaries of their FEATURE_COLUMNS, user_id,
+    and attended_event, like the rows training used to be given.
+
+    Inputs:
+        features, user_ids, targets: arrays as returned by read_training_rows
+
+    Returns: a list with a dictionary per row
+    """
+    return [
+        {**dict(zip(FEATURE_COLUMNS, row)), "user_id": user_id, "attended_event": target}
+        for row, user_id, target in zip(
+            np.asarray(features, dtype=bool).tolist(),
+            np.asarray(user_ids).tolist(),
+            np.asarray(targets, dtype=bool).tolist(),
+        )
+    ]
+
+
+def export_training_rows(path, source, since=None, batch_size=BATCH_SIZE):
+    """
+    Streams the training rows of a source into an Arrow IPC (.arrow) or
+    Parquet (.parquet) file, one record batch / row group per batch_size rows.
+    The files are read back by ml.recommendation.read_training_file.
+
+    Every row has the packed features (a fixed-size binary column), user_id,
+    and attended_event; the feature names are stored in the schema metadata
+    under "feature_columns".
+
+    Inputs:
+        path (str): the file to write; the suffix picks the format
+        source (str): "scenario" for pretraining rows, "event" for finetuning
+            rows
+        since (datetime): only export rows of events on or after this time
+        batch_size (int): number of rows per record batch / row group
+
+    Returns: the number of rows written
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Exporting training data requires pyarrow (pip install pyarrow)"
+        ) from e
+
+    num_bytes = (len(FEATURE_COLUMNS) + 7) // 8
+    schema = pa.schema(
+        [
+            ("features", pa.binary(num_bytes)),
+            ("user_id", pa.int64()),
+            ("attended_event", pa.bool_()),
+        ],
+        metadata={"feature_columns": json.dumps(FEATURE_COLUMNS)},
+    )
+
+    if str(path).endswith(".parquet"):
+        writer = pq.ParquetWriter(str(path), schema)
+    else:
+        writer = pa.ipc.new_file(str(path), schema)
+
+    written = 0
+    with writer:
+        for packed, user_ids, targets in iter_training_rows(source, since, batch_size):
+            batch = pa.record_batch(
+                [
+                    pa.array(packed, type=schema.field("features").type),
+                    pa.array(user_ids, type=pa.int64()),
+                    pa.array(targets, type=pa.bool_()),
+                ],
+                schema=schema,
+            )
+            writer.write_batch(batch)
+            written += len(packed)
+
+    return written
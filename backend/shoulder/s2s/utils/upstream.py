@@ -0,0 +1,135 @@
+"""
+Async clients of the external services: the zipcodestack API, Nominatim
+geocoding, and SES.
+
+The HTTP calls share one pooled httpx.AsyncClient per event loop, so
+connections (and their TLS sessions) are reused across requests instead of
+opened per call; under an ASGI server every worker runs one loop, so it keeps
+one pool. Under WSGI, Django runs every request of an async view in a new
+event loop, so the views are decorated with upstream_view, which closes the
+request's client when it returns instead of leaving it open with its loop
+gone. Every call is marked with s2s.utils.instrumentation.timed.
+
+boto3 has no async API, so send_email_async runs the SES call in a thread
+pool; the event loop keeps serving other requests while it waits.
+
+The URLs of the services are the ZIPCODE_API_URL and GEOCODE_API_URL
+settings, which the tests point at a stub server.
+"""
+
+import asyncio
+import functools
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+
+from .instrumentation import timed
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """
+    Returns: the pooled httpx.AsyncClient of the running event loop
+    """
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=settings.UPSTREAM_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            ),
+            headers={"User-Agent": settings.S2S_FROM_EMAIL},
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_clients():
+    """
+    Closes the pooled client of the running event loop, i.e. on shutdown.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def upstream_view(view):
+    """
+    Decorates an async view that calls the external services, closing the
+    client of a WSGI request's event loop once the view returns.
+    """
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        finally:
+            if isinstance(request, WSGIRequest):
+                await close_clients()
+
+    return wrapper
+
+
+async def fetch_zipcodes(zip_code):
+    """
+    Looks up a zip code with the zipcodestack API.
+
+    Inputs:
+        zip_code (str): a zip code, or several separated by commas
+
+    Returns: the status code and JSON body of the API's response
+    """
+    with timed("zipcode"):
+        response = await get_client().get(
+            settings.ZIPCODE_API_URL,
+            params={"country": "us", "codes": zip_code, "apikey": settings.ZIPCODE_API_KEY},
+        )
+    return response.status_code, response.json()
+
+
+async def geocode_async(address):
+    """
+    Geocodes an address with Nominatim, like gis.gis_module.geocode (and
+    with the same GEOCODE_STUB switch).
+
+    Returns: a dictionary with the standardized address and its coordinates
+        ("coords", a (latitude, longitude) tuple), or None if the address
+        wasn't found
+    """
+    from gis.gis_module import geocode_stubbed, stub_geocode
+
+    if geocode_stubbed():
+        return stub_geocode(address)
+
+    with timed("geocode"):
+        response = await get_client().get(
+            settings.GEOCODE_API_URL, params={"q": address, "format": "json", "limit": 1}
+        )
+    response.raise_for_status()
+    locations = response.json()
+    if not locations:
+        return None
+    return {
+        "address": locations[0]["display_name"],
+        "coords": (float(locations[0]["lat"]), float(locations[0]["lon"])),
+    }
+
+
+async def send_email_async(subject, message, recipient_list):
+    """
+    Sends an email through SES without blocking the event loop.
+
+    Returns: the SES response
+    """
+    from .email_outbox import send_email
+
+    return await sync_to_async(send_email, thread_sensitive=False)(
+        subject, message, recipient_list
+    )
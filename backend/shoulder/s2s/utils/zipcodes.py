@@ -0,0 +1,163 @@
+"""
+Cached lookup of zip codes (the /api/zipcodes/ endpoint).
+
+The city and state of a zip code never change, so lookups read through three
+levels: an in-memory LRU of ZIPCODE_CACHE_SIZE codes per process, the ZipCode
+table, and, for codes in neither, the zipcodestack API, whose results are
+written to both. Codes the API doesn't know are stored in the table too,
+with no results, so repeated lookups of a mistyped code don't spend the API's
+quota either; they are looked up again once they are ZIPCODE_NEGATIVE_TTL
+days old, in case the code has been created since, and are kept out of the
+LRU so every process sees them expire.
+
+lookup_zipcodes looks up many codes at once: one query for the codes missing
+from the LRU, and one API call for the codes missing from the table. The
+table can also be filled ahead of time from a GeoNames postal code file with
+the load_zipcodes_m command.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from s2s.db_models import ZipCode
+from .upstream import fetch_zipcodes
+
+ZIP_CODE = re.compile(r"^\d{5}$")
+
+
+class UpstreamError(Exception):
+    """
+    Raised when the zipcodestack API fails, with its status code and body.
+    """
+
+    def __init__(self, status, data):
+        super().__init__(f"zipcodestack API returned {status}")
+        self.status = status
+        self.data = data
+
+
+class LRUCache:
+    """
+    A thread-safe least recently used cache of up to maxsize items.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """
+        Returns: a dictionary of the keys in the cache to their values
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._items:
+                    self._items.move_to_end(key)
+                    found[key] = self._items[key]
+        return found
+
+    def set_many(self, items):
+        with self._lock:
+            for key, value in items.items():
+                self._items[key] = value
+                self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+cache = LRUCache(settings.ZIPCODE_CACHE_SIZE)
+
+
+def parse_zip_codes(value):
+    """
+    Splits the zip_code parameter of a request into its distinct codes.
+
+    Inputs:
+        value (str): zip codes separated by commas
+
+    Returns: the codes, in order
+    """
+    codes = [code.strip() for code in value.split(",")]
+    return list(dict.fromkeys(code for code in codes if code))
+
+
+def _read(codes):
+    """
+    Returns: the stored results of codes, except unknown codes stored more
+        than ZIPCODE_NEGATIVE_TTL days ago
+    """
+    expired = timezone.now() - timedelta(days=settings.ZIPCODE_NEGATIVE_TTL)
+    rows = ZipCode.objects.filter(zip_code__in=codes).values_list(
+        "zip_code", "results", "created_at"
+    )
+    return {
+        code: results
+        for code, results, created_at in rows
+        if results or created_at > expired
+    }
+
+
+def _write(results):
+    # expired unknown codes are overwritten, with a new created_at
+    ZipCode.objects.bulk_create(
+        [ZipCode(zip_code=code, results=rows) for code, rows in results.items()],
+        update_conflicts=True,
+        unique_fields=["zip_code"],
+        update_fields=["results", "created_at"],
+    )
+
+
+def _known(results):
+    return {code: rows for code, rows in results.items() if rows}
+
+
+async def lookup_zipcodes(codes):
+    """
+    Looks up zip codes through the LRU, the ZipCode table, and the API.
+
+    Inputs:
+        codes (list): zip codes; codes that aren't 5 digits have no results
+
+    Returns: a dictionary of every code to its list of results (empty if the
+        code doesn't exist)
+    """
+    valid = [code for code in codes if ZIP_CODE.match(code)]
+    results = {code: [] for code in codes}
+    cached = cache.get_many(valid)
+    results.update(cached)
+
+    missing = [code for code in valid if code not in cached]
+    if missing:
+        stored = await sync_to_async(_read)(missing)
+        cache.set_many(_known(stored))
+        results.update(stored)
+        missing = [code for code in missing if code not in stored]
+
+    if missing:
+        status, data = await fetch_zipcodes(",".join(missing))
+        if status != 200:
+            raise UpstreamError(status, data)
+        # the API returns an empty list instead of a dictionary when none of
+        # the codes exist
+        found = data.get("results") or {}
+        fetched = {code: found.get(code, []) for code in missing}
+        await sync_to_async(_write)(fetched)
+        cache.set_many(_known(fetched))
+        results.update(fetched)
+
+    return results
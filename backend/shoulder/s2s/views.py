@@ -6,31 +6,44 @@ from rest_framework import viewsets, permissions, status
 from s2s.permissions import HasAppToken
 from django.test.client import RequestFactory
 from rest_framework.test import APIRequestFactory
-import environ
-import requests
+import json
+import logging
+import math
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from rest_framework.decorators import action
 from django.db import transaction
 from django.db.models import Exists, OuterRef, Count, Subquery, Q, F
-import boto3
 from django.core.exceptions import ObjectDoesNotExist
 from django.conf import settings
 from gis.gis_module import geocode
 from gis.gis_module import distance_bin
 import os
 from .utils.calendar import calendar
+from .utils.panelization import (
+    DISTANCE_COLUMNS,
+    EVENT_LAYOUT,
+    USER_PREFERENCES_LAYOUT,
+    encode_distances,
+    measure_distances,
+    model_features,
+    save_event_panels,
+    save_scenario_panels,
+    save_user_preference_panels,
+)
+from .utils.training_rows import EVENT, SCENARIO, read_training_rows, training_row_dicts
+from .utils.event_emails import queue_event_email
+from .utils.instrumentation import registry, timed
+from .pagination import EventCursorPagination, IdCursorPagination
 from datetime import datetime, timedelta
 from django.utils import timezone
-import pandas as pd
-from django.core.management import call_command
 from django.http import QueryDict
 
 
 from .serializers import *
 from .db_models import *
 
-from ml.ml.recommendation import recommend, finetune, pretrain
+logger = logging.getLogger(__name__)
 
 
 # functions
@@ -38,6 +51,21 @@ def index(request):
     return HttpResponse("Hello, world. You're at the ShoulderToShoulder index.")
 
 
+class SparseFieldsViewSetMixin:
+    """
+    Loads only the columns of the fields a GET request asks for with ?fields=
+    (see SparseFieldsMixin), for the tables with wide rows.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        requested = requested_fields(self.request)
+        if requested is None:
+            return queryset
+        columns = {field.name for field in queryset.model._meta.concrete_fields}
+        return queryset.only(*(requested & columns) or ["pk"])
+
+
 # viewsets
 class HobbyTypeViewSet(viewsets.ModelViewSet):
     queryset = HobbyType.objects.all()
@@ -168,7 +196,8 @@ class EventViewSet(viewsets.ModelViewSet):
 
         # get the latitute and longitude from the address
         full_address = f"{request_data['address1']} {request_data['city']}, {request_data['state']}"
-        addr_resp = geocode(full_address)
+        with timed("geocode"):
+            addr_resp = geocode(full_address)
         if not addr_resp:
             return {"error": "Invalid address"}
         latitude, longitude = addr_resp["coords"]
@@ -204,7 +233,7 @@ class EventViewSet(viewsets.ModelViewSet):
                     user_id=user, event_id=event, rsvp="Yes", attended=False
                 )
                 user_event.save()
-                call_command("send_event_email_m", user=user, event_info=event)
+                queue_event_email(user, event)
 
             # trigger event suggestion panel data
             self.trigger_panel_event(serializer.data["id"])
@@ -245,7 +274,8 @@ class OnboardingViewSet(viewsets.ModelViewSet):
         address_fields = ["address_line1", "city", "state", "zip_code"]
         if all(field in request.data for field in address_fields):
             full_address = f"{request.data['address_line1']} {request.data['city']}, {request.data['state']} {request.data['zip_code']}"
-            geo_response = geocode(full_address)
+            with timed("geocode"):
+                geo_response = geocode(full_address)
             if geo_response:
                 request.data["latitude"] = geo_response["coords"][0]
                 request.data["longitude"] = geo_response["coords"][1]
@@ -293,15 +323,13 @@ class AvailabilityViewSet(viewsets.ModelViewSet):
     serializer_class = AvailabilitySerializer
     permission_classes = [HasAppToken]
 
-    def update_availability_obj(self, item, user):
+    def update_availability_obj(self, item, slots):
         # validate the item
         if not all([item.get("user_id"), item.get("day_of_week"), item.get("hour")]):
             return
 
         # get the availability object
-        availability = Availability.objects.get(
-            user_id=user, day_of_week=item["day_of_week"], hour=item["hour"]
-        )
+        availability = slots[(item["day_of_week"], int(item["hour"]))]
 
         # set the availability
         availability.available = item["available"]
@@ -332,9 +360,13 @@ class AvailabilityViewSet(viewsets.ModelViewSet):
         if not user:
             return Response({"error": "User not found"}, status=404)
 
-        # Update availability
+        # Update availability, reading the user's week in one query
+        slots = {
+            (availability.day_of_week, availability.hour): availability
+            for availability in Availability.objects.filter(user_id=user)
+        }
         avail_objs = list(
-            map(lambda item: self.update_availability_obj(item, user), data)
+            map(lambda item: self.update_availability_obj(item, slots), data)
         )
 
         # bulk update
@@ -523,20 +555,6 @@ class ProfilesViewSet(viewsets.ModelViewSet):
         )
 
 
-class ZipCodeViewSet(viewsets.ModelViewSet):
-    endpoint = "https://api.zipcodestack.com/v1/search?country=us"
-    api_key = environ.Env().str("ZIPCODE_API_KEY")
-
-    def list(self, request, *args, **kwargs):
-        zip_code = request.query_params.get("zip_code")
-        if zip_code:
-            response = requests.get(
-                f"{self.endpoint}&codes={zip_code}&apikey={self.api_key}"
-            )
-            return Response(response.json())
-        return Response({"error": "Zip code not provided"}, status=400)
-
-
 class CreateUserViewSet(viewsets.ModelViewSet):
     permission_classes = [HasAppToken]
 
@@ -688,6 +706,19 @@ class LoginViewSet(viewsets.ViewSet):
             return Response({"error": "Method not allowed"}, status=405)
 
 
+class MetricsViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.IsAdminUser]
+
+    def metrics(self, request):
+        """
+        Returns the request histograms of this process in the Prometheus text
+        format (see s2s.utils.instrumentation).
+        """
+        return HttpResponse(
+            registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+
 class ApplicationTokenViewSet(viewsets.ModelViewSet):
     queryset = ApplicationToken.objects.all()
     serializer_class = ApplicationTokenSerializer
@@ -713,65 +744,95 @@ class ApplicationTokenViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class UserEventsViewSet(viewsets.ModelViewSet):
+class UserEventsViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = UserEvents.objects.all()
     serializer_class = UserEventsSerializer
     permission_classes = [HasAppToken]
+    pagination_class = IdCursorPagination
+
+    # the events of a user's listing, with the UserEvents fields it adds
+    event_row = ValuesSerializer(EventSerializer, prefix="event_id__")
 
     def get_queryset(self):
         queryset = self.queryset
         user_id = self.request.query_params.get("user_id")
 
         if user_id:
-            user = User.objects.get(id=user_id)
-            queryset = queryset.filter(user_id=user)
-
-        response = {"past_events": [], "upcoming_events": []}
-        event_serializer_class = EventSerializer
-        for user_event in queryset:
-            if user_event.rsvp == "No":
-                continue
-            event = user_event.event_id
-            serialized_event = event_serializer_class(event).data
-            if event.datetime < timezone.now():
-                response["past_events"].append(serialized_event)
-            else:
-                response["upcoming_events"].append(serialized_event)
+            queryset = queryset.filter(user_id=user_id)
 
         return queryset
 
+    def user_event_rows(self, user_id):
+        """
+        Gets a user's events, except those they declined, in one query.
+
+        Returns: a .values() queryset of the event_row fields, the user's
+            rating and attendance, and the event's datetime as event_datetime
+            (cursor pagination can't order by a lookup across the relation)
+        """
+        return (
+            UserEvents.objects.filter(user_id=user_id)
+            .exclude(rsvp="No")
+            .annotate(event_datetime=F("event_id__datetime"))
+            .values(*self.event_row.values(), "user_rating", "attended", "event_datetime")
+        )
+
+    def serialize_user_event(self, row):
+        serialized_event = self.event_row(row)
+        serialized_event["rating"] = row["user_rating"]
+        serialized_event["attended"] = row["attended"]
+        return serialized_event
+
     @action(detail=False, methods=["get"], url_path="upcoming_past_events")
     def get_upcoming_past_events(self, request, *args, **kwargs):
+        """
+        Gets a user's past and upcoming events.
+
+        With section=past or section=upcoming, returns one cursor page of that
+        section instead (see EventCursorPagination), latest first for past
+        events and soonest first for upcoming ones.
+        """
         user_id = self.request.query_params.get("user_id")
         if not user_id:
             return Response({"error": "User ID not provided"}, status=400)
 
         # get the user
-        user = User.objects.get(id=user_id)
+        if not User.objects.filter(id=user_id).exists():
+            return Response({"error": "User not found"}, status=404)
+
+        now = timezone.now()
+        rows = self.user_event_rows(user_id)
+
+        section = self.request.query_params.get("section")
+        if section:
+            if section == "past":
+                rows = rows.filter(event_datetime__lt=now)
+                ordering = "-event_datetime"
+            elif section == "upcoming":
+                rows = rows.filter(event_datetime__gte=now)
+                ordering = "event_datetime"
+            else:
+                return Response({"error": "Invalid section"}, status=400)
+
+            paginator = EventCursorPagination()
+            paginator.ordering = ordering
+            page = paginator.paginate_queryset(rows, request, view=self)
+            return paginator.get_paginated_response(
+                [self.serialize_user_event(row) for row in page]
+            )
 
-        # get the user events
-        user_events = UserEvents.objects.filter(user_id=user)
+        # get the past and upcoming events in one pass
+        past, upcoming = [], []
+        for row in rows.order_by("event_datetime"):
+            (past if row["event_datetime"] < now else upcoming).append(
+                self.serialize_user_event(row)
+            )
+        past.reverse()
 
-        # get the past and upcoming events
         response = {
-            "past_events": {"count": 0, "events": []},
-            "upcoming_events": {"count": 0, "events": []},
+            "past_events": {"count": len(past), "events": past},
+            "upcoming_events": {"count": len(upcoming), "events": upcoming},
         }
-        event_serializer_class = EventSerializer
-        for user_event in user_events:
-            if user_event.rsvp == "No":
-                continue
-            event = user_event.event_id
-            serialized_event = event_serializer_class(event).data
-            serialized_event["rating"] = user_event.user_rating
-            serialized_event["attended"] = user_event.attended
-            if event.datetime < timezone.now():
-                response["past_events"]["events"].append(serialized_event)
-                response["past_events"]["count"] += 1
-            else:
-                response["upcoming_events"]["events"].append(serialized_event)
-                response["upcoming_events"]["count"] += 1
-
         return Response(response, status=200)
 
     @action(detail=False, methods=["post"], url_path="review_event")
@@ -824,19 +885,21 @@ class UserEventsViewSet(viewsets.ModelViewSet):
         except Event.DoesNotExist:
             return Response({"error": "Event not found"}, status=404)
 
-        # Notify user of event via email
-        if rsvp == "Yes":
-            call_command("send_event_email_m", user=user, event_info=event)
+        # Create the user event object, or update the RSVP of an existing one
+        # (see the unique_user_event constraint)
+        user_event, _ = UserEvents.objects.update_or_create(
+            user_id=user, event_id=event, defaults={"rsvp": rsvp}
+        )
 
-        # Create the user event object
-        user_event = UserEvents(user_id=user, event_id=event, rsvp=rsvp, attended=False)
-        user_event.save()
+        # Notify user of event via email, sent by the send_outbox_m worker
+        if rsvp == "Yes":
+            queue_event_email(user, event)
 
         serializer = self.get_serializer(user_event)
         return Response(serializer.data, status=201)
 
 
-class PanelUserPreferencesViewSet(viewsets.ModelViewSet):
+class PanelUserPreferencesViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = PanelUserPreferences.objects.all()
     serializer_class = PanelUserPreferencesSerializer
     permission_classes = [HasAppToken]
@@ -867,26 +930,13 @@ class PanelUserPreferencesViewSet(viewsets.ModelViewSet):
             )
 
         # Attempt to retrieve the user object
-        try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
+        if not User.objects.filter(id=user_id).exists():
             return Response({"error": "User not found"}, status=404)
 
-        # delete existing panel preferences row if it exists
-        try:
-            existing_panel_preferences = PanelUserPreferences.objects.get(user_id=user)
-            existing_panel_preferences.delete()
-        except PanelUserPreferences.DoesNotExist:
-            pass
-
-        # Prepare panel preferences data based on the user and their onboarding data
+        # Create or replace the user's panel preferences from their onboarding
+        # data and availability
         try:
-            panel_preferences_data = self.prepare_panel_preferences_data(
-                user, onboarding_data
-            )
-            panel_preferences = PanelUserPreferences.objects.create(
-                **panel_preferences_data
-            )
+            save_user_preference_panels(onboarding_data)
         except Exception as e:
             return Response(
                 {"error": f"Failed to create panel user preferences: {str(e)}"},
@@ -896,256 +946,12 @@ class PanelUserPreferencesViewSet(viewsets.ModelViewSet):
         # Return a success response
         return Response({"detail": "Successfully updated"}, status=201)
 
-    def prepare_panel_preferences_data(self, user, onboarding_data):
-        """
-        Creates the a dictionary and parses and fills out the user's
-        onboarding data
-
-        Inputs:
-            user: the User object
-            onboarding_data (Onboarding): User's rows on Onboarding data from the model
-
-        Returns: event_suggestions_data (dict): dictionary containing user's
-        onboarding information as necessary for the PanelUserPreferences row
-        """
-        event_suggestions_data = {"user_id": user}
-        event_suggestions_data.update(
-            self.parse_num_participants_pref(onboarding_data.num_participants)
-        )
-
-        event_suggestions_data.update(
-            self.parse_distance_preferences(onboarding_data.distance)
-        )
-
-        event_suggestions_data.update(
-            self.parse_similarity_preferences(onboarding_data.similarity_to_group)
-        )
-
-        event_suggestions_data.update(
-            self.parse_similarity_metrics(onboarding_data.similarity_metrics)
-        )
-
-        event_suggestions_data.update(
-            self.parse_hobby_type_onboarding(
-                onboarding_data.most_interested_hobby_types.all()
-            )
-        )
-
-        event_suggestions_data.update(self.parse_user_availability(user.id))
-
-        return event_suggestions_data
-
-    def parse_user_availability(self, user_id):
-        """
-        Helper function to parse user availability data, formatting and standardizing
-        it into the PanelUserPreferencess row
-
-        Inputs:
-            user_id: User's ID
-
-        Returns: availability_data (dict): dictionary of user's availability data
-        """
-        user_availability = Availability.objects.filter(user_id=user_id)
-        time_period_mapping = {
-            "early_morning": [5, 6, 7, 8],
-            "morning": [9, 10, 11, 12],
-            "afternoon": [13, 14, 15, 16],
-            "evening": [17, 18, 19, 20],
-            "night": [21, 22, 23, 24],
-            "late_night": [1, 2, 3, 4],
-        }
-        availability_data_lst = {}
-        for availability in user_availability:
-            day_of_week = availability.day_of_week
-            hour = availability.hour
-            for period, hours in time_period_mapping.items():
-                preference_field = f"pref_{day_of_week.lower()}_{period}"
-                if int(hour) in hours:
-                    availability_data_lst[preference_field] = availability_data_lst.get(
-                        preference_field, []
-                    )
-                    availability_data_lst[preference_field].append(
-                        availability.available
-                    )
-
-        availability_data = {
-            key: any(value) for key, value in availability_data_lst.items()
-        }
-        return availability_data
-
-    def parse_distance_preferences(self, distance):
-        """
-        Helper function to parse user distance preferences data, formatting and standardizing
-        it into the PanelUserPreferencess row
-
-        Inputs:
-            distance (string): The user's distance preferences
-
-        Returns: distance_data (dict): dictionary of user's distance preferences data
-        """
-        distance_preference_mapping = {
-            "Within 1 mile": "pref_dist_within_1mi",
-            "Within 5 miles": "pref_dist_within_5mi",
-            "Within 10 miles": "pref_dist_within_10mi",
-            "Within 15 miles": "pref_dist_within_15mi",
-            "Within 20 miles": "pref_dist_within_20mi",
-            "Within 30 miles": "pref_dist_within_30mi",
-            "Within 40 miles": "pref_dist_within_40mi",
-            "Within 50 miles": "pref_dist_within_50mi",
-        }
-        distance_data = {}
-        if distance != "No preference":
-            distance_data[distance_preference_mapping[distance]] = True
-
-        for pref, field in distance_preference_mapping.items():
-            if pref != distance:
-                distance_data[field] = False
-
-        return distance_data
-
-    def parse_similarity_preferences(self, similarity_value):
-        """
-        Helper function to parse user similarity preference data, formatting and standardizing
-        it into the PanelUserPreferencess row
-
-        Inputs:
-            similarity_values (str): a user's similarity preferences data
-
-        Returns: similarity_data (dict): dictionary of user's similarity data
-        """
-
-        similarity_mapping = {
-            "Completely dissimilar": "pref_similarity_to_group_1",
-            "Moderately dissimilar": "pref_similarity_to_group_2",
-            "Moderately similar": "pref_similarity_to_group_3",
-            "Completely similar": "pref_similarity_to_group_4",
-        }
-        similarity_data = {}
-        if similarity_value in similarity_mapping:
-            similarity_data[similarity_mapping[similarity_value]] = True
-
-        for pref, field in similarity_mapping.items():
-            if pref != similarity_value:
-                similarity_data[field] = False
-
-        return similarity_data
-
-    def parse_similarity_metrics(self, metrics):
-        """
-        Helper function to parse user similarity metrics data, formatting and standardizing
-        it into the PanelUserPreferencess row
-
-        Inputs:
-            metrics (lst): List of user's similarity metrics data
-
-        Returns: parsed_metrics (dict): dictionary of user's similarity metrics data
-        """
-        similarity_metrics_mapping = {
-            "Gender": "pref_gender_similar",
-            "Race or Ethnicity": "pref_race_similar",
-            "Age range": "pref_age_similar",
-            "Sexual Orientation": "pref_sexual_orientation_similar",
-            "Religious Affiliation": "pref_religion_similar",
-            "Political Leaning": "pref_political_leaning_similar",
-        }
-
-        if not metrics:
-            return {metric: False for metric in similarity_metrics_mapping.values()}
-        else:
-            # If metrics list is not empty, set corresponding values to True
-            parsed_metrics = {}
-            for preference, field in similarity_metrics_mapping.items():
-                parsed_metrics[field] = preference in metrics
-
-            return parsed_metrics
-
-    def num_participant_mapping(self, value):
-        """
-         Helper function to standardize participant data into necessary format
-         for EventSugestions Row
-
-         Inputs:
-             value (str): string of user's preferred number of event participants, if empty returns Null
-
-        Return: string: String of the value parsed into the necessary format
-        """
-
-        if "1-5" in value:
-            return "1to5"
-        elif "5-10" in value:
-            return "5to10"
-        elif "10-15" in value:
-            return "10to15"
-        elif "15+" in value:
-            return "15p"
-        else:
-            return None
-
-    def parse_hobby_type_onboarding(self, hobby_types):
-        """
-        Helper function to parse user's scenario hobby type data formatting and standardizing
-        it into the PanelUserPreferencess row
-
-        Inputs:
-            hobby_types (list): list of HobbyType objects
-
-        Returns:
-            hobby_data (dict): dictionary of user's scenario hobby type
-        """
-        hobby_data = {}
-        hobby_type_str = [hobby_type.type for hobby_type in hobby_types]
-
-        category_mapping = {
-            "TRAVEL": "pref_hobby_category_travel",
-            "ARTS AND CULTURE": "pref_hobby_category_arts_and_culture",
-            "LITERATURE": "pref_hobby_category_literature",
-            "FOOD AND DRINK": "pref_hobby_category_food",
-            "COOKING/BAKING": "pref_hobby_category_cooking_and_baking",
-            "SPORT/EXERCISE": "pref_hobby_category_exercise",
-            "OUTDOORS": "pref_hobby_category_outdoor_activities",
-            "CRAFTING": "pref_hobby_category_crafting",
-            "HISTORY AND LEARNING": "pref_hobby_category_history",
-            "COMMUNITY EVENTS": "pref_hobby_category_community",
-            "GAMING": "pref_hobby_category_gaming",
-        }
 
-        for hobby_type, pref_col in category_mapping.items():
-            hobby_data[pref_col] = hobby_type in hobby_type_str
-
-        return hobby_data
-
-    def parse_num_participants_pref(self, num_participants):
-        """
-        Helper function to parse user's preferred number of participants data formatting and standardizing
-        it into the PanelUserPreferencess row
-
-        Inputs:
-            num_participants (list): The user's preferred number of participants
-
-        Returns:
-            num_participants_data (dict): dictionary of user's preferred number of participants data
-        """
-        assert type(num_participants) == list, "num_participants must be a list"
-
-        num_participants_map = {
-            "1-5": "pref_num_particip_1to5",
-            "5-10": "pref_num_particip_5to10",
-            "10-15": "pref_num_particip_10to15",
-            "15+": "pref_num_particip_15p",
-        }
-        num_participants_data = {}
-        for num_participant in num_participants_map:
-            num_participants_data[num_participants_map[num_participant]] = (
-                num_participant in num_participants
-            )
-
-        return num_participants_data
-
-
-class PanelEventViewSet(viewsets.ModelViewSet):
+class PanelEventViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = PanelEvent.objects.all()
     serializer_class = PanelEventSerializer
     permission_classes = [HasAppToken]
+    pagination_class = IdCursorPagination
 
     def get_queryset(self):
         queryset = self.queryset
@@ -1170,10 +976,8 @@ class PanelEventViewSet(viewsets.ModelViewSet):
         except Event.DoesNotExist:
             return Response({"error": "Event not found"}, status=404)
 
-        event_data = {"event_id": event}
         try:
-            paneled_event = self.prepare_panel_events(event_data)
-            panel_event = PanelEvent.objects.create(**paneled_event)
+            save_event_panels(event)
         except Exception as e:
             return Response(
                 {"error": f"Failed to create event suggestions: {str(e)}"}, status=400
@@ -1182,190 +986,12 @@ class PanelEventViewSet(viewsets.ModelViewSet):
         # Return a success response
         return Response({"detail": "Successfully updated"}, status=201)
 
-    def num_participant_mapping(self, value):
-        """
-        Helper function to standardize participant data into necessary format
-        for EventSugestions Row
-
-        Inputs:
-            value (int): number of participants in the event
-
-        Return: string: String of the value parsed into the necessary format
-        """
-
-        if value is None:
-            return None
-
-        if value <= 5:
-            return "1to5"
-
-        if value <= 10:
-            return "5to10"
-
-        if value <= 15:
-            return "10to15"
-
-        return "15p"
-
-    def prepare_panel_events(self, template_event_data):
-        """
-        Helper function to prepare events data formatting and standardizing
-        it into a PanelEvent object.
-
-        Inputs:
-            template_event_data (dict): Tempalate containing event id
-
-        Returns: event_data (dict): A dictionary containing the panelized event
-                 data.
-        """
-        event = template_event_data["event_id"]
-
-        event_data_template = template_event_data.copy()
-        event_data = self.parse_event_data(event, event_data_template)
-
-        return event_data
-
-    def parse_event_data(self, event, data_template):
-        """
-        Helper function to parse user events data formatting and standardizing
-        it into the PanelEvent row
-
-        Inputs:
-            event (event): Rows of the user's events from the event Model
-            data_template (dict): Dictionary of user's event suggestions data
-
-        Returns:
-            event_data: Event 1 with preferences and onboarding information
-        """
-        event_data = data_template.copy()
-        event_data.update(self.parse_hobby_type(event.hobby_type))
 
-        num_part = f"num_particip_{self.num_participant_mapping(event.max_attendees)}"
-        event_data.update({num_part: True})
-
-        event_data.update(self.parse_event_datetime(event.datetime))
-
-        event_data.update(self.parse_duration(event.duration_h))
-
-        return event_data
-
-    def parse_hobby_type(self, hobby_type):
-        """
-        Helper function to parse user's event hobby type data formatting and standardizing
-        it into the PanelEvent row
-
-        Inputs:
-            hobby_type (Hobby): Hobby Type of user's event
-
-        Returns:
-            hobby_data (dict): dictionary of user's event hobby type
-        """
-        hobby_data = {}
-
-        category_mapping = {
-            "TRAVEL": "hobby_category_travel",
-            "ARTS AND CULTURE": "hobby_category_arts_and_culture",
-            "LITERATURE": "hobby_category_literature",
-            "FOOD AND DRINK": "hobby_category_food",
-            "COOKING/BAKING": "hobby_category_cooking_and_baking",
-            "SPORT/EXERCISE": "hobby_category_exercise",
-            "OUTDOORS": "hobby_category_outdoor_activities",
-            "CRAFTING": "hobby_category_crafting",
-            "HISTORY AND LEARNING": "hobby_category_history",
-            "COMMUNITY EVENTS": "hobby_category_community",
-            "GAMING": "hobby_category_gaming",
-        }
-
-        for hobby_key in category_mapping.values():
-            hobby_data[hobby_key] = False
-
-        hobby_data[category_mapping[hobby_type.type]] = True
-
-        return hobby_data
-
-    def parse_event_datetime(self, datetime):
-        """
-        Helper function to parse user's event date and time data formatting and standardizing
-        it into the PanelEvent row
-
-        Inputs:
-            datetime (datetime): datetime of user's event
-
-        Returns:
-            event_datetime_mapping (dict): dictionary of user's event day and time data
-        """
-        event_datetime_mapping = {}
-        days_of_week = [
-            "monday",
-            "tuesday",
-            "wednesday",
-            "thursday",
-            "friday",
-            "saturday",
-            "sunday",
-        ]
-        time_periods = [
-            "early_morning",
-            "morning",
-            "afternoon",
-            "evening",
-            "night",
-            "late_night",
-        ]
-
-        # convert datetime to day of week and time of day
-        day_of_week = datetime.strftime("%A").lower()
-        tod_string = self.get_time_of_day(datetime.hour)
-        if tod_string is None:
-            return event_datetime_mapping
-        tod_standardized = "_".join(tod_string.lower().split())
-
-        # create a dictionary with all the days of the week and time periods
-        for day in days_of_week:
-            for period in time_periods:
-                field_name = f"{day}_{period}"
-                if field_name == f"{day_of_week}_{tod_standardized}":
-                    event_datetime_mapping[field_name] = True
-                else:
-                    event_datetime_mapping[field_name] = False
-
-        return event_datetime_mapping
-
-    def get_time_of_day(self, hour):
-        time_period_mapping = {
-            "early_morning": [5, 6, 7, 8],
-            "morning": [9, 10, 11, 12],
-            "afternoon": [13, 14, 15, 16],
-            "evening": [17, 18, 19, 20],
-            "night": [21, 22, 23, 24],
-            "late_night": [1, 2, 3, 4],
-        }
-
-        for time_period, hours in time_period_mapping.items():
-            if hour in hours:
-                return time_period
-
-        return None
-
-    def parse_duration(self, duration):
-        """
-        Helper function to parse user's event duration data formatting and standardizing
-        it into the PanelEvent row
-
-        Inputs:
-            duration (event): duration of user's event
-
-        Returns:
-            duration_data (dict): dictionary of user's event duration data
-        """
-        duration_data = {f"duration_{i}hr": i == duration for i in range(1, 9)}
-        return duration_data
-
-
-class PanelScenarioViewSet(viewsets.ModelViewSet):
+class PanelScenarioViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = PanelScenario.objects.all()
     serializer_class = PanelScenarioSerializer
     permission_classes = [HasAppToken]
+    pagination_class = IdCursorPagination
 
     def get_queryset(self):
         queryset = self.queryset
@@ -1390,18 +1016,9 @@ class PanelScenarioViewSet(viewsets.ModelViewSet):
         except User.DoesNotExist:
             return Response({"error": "User not found"}, status=404)
 
-        onboarding_data = {"user_id": user}
-
-        # Prepare panel scenario data data based on the user and their onboarding data
+        # Panelize all of the user's scenarios, replacing any existing rows
         try:
-            paneled_scenarios_lst = self.prepare_user_scenarios(
-                user_id, onboarding_data
-            )
-            panel_scenarios_objs = [
-                PanelScenario(**panel_scenario)
-                for panel_scenario in paneled_scenarios_lst
-            ]
-            PanelScenario.objects.bulk_create(panel_scenarios_objs)
+            save_scenario_panels(Scenarios.objects.filter(user_id=user))
         except Exception as e:
             return Response(
                 {"error": f"Failed to create event suggestions: {str(e)}"}, status=400
@@ -1410,250 +1027,11 @@ class PanelScenarioViewSet(viewsets.ModelViewSet):
         # Return a success response
         return Response({"detail": "Successfully updated"}, status=201)
 
-    def num_participant_mapping(self, value):
-        """
-         Helper function to standardize participant data into necessary format
-         for EventSugestions Row
-
-         Inputs:
-             value (str): string of user's preferred number of event participants, if empty returns Null
 
-        Return: string: String of the value parsed into the necessary format
-        """
-
-        if "1-5" in value:
-            return "1to5"
-        elif "5-10" in value:
-            return "5to10"
-        elif "10-15" in value:
-            return "10to15"
-        elif "15+" in value:
-            return "15p"
-        else:
-            return None
-
-    def prepare_user_scenarios(self, user_id, onboarding_data):
-        """
-        Helper function to prepare user scenarios data formatting and standardizing
-        it into the PanelScenario row
-
-        Inputs:
-            user_id: User's ID
-            onboarding_data (dict): Dictionary including user ID
-
-        Returns: scenario_lst (lst): List of dictionaries containing all of a
-        user's unique scenarios and answers as well as onboarding information
-        """
-        # parse both scenario 1 and scenario 2 to a list of dictionaries that can be turned into rows in PanelScenario
-        user_scenarios = Scenarios.objects.filter(user_id=user_id)
-
-        scenario_lst = []
-
-        for scenario in user_scenarios:
-            # copy the onboarding data into a new dictionary for the separate scenearios
-            user_onboarding_data_template = onboarding_data.copy()
-            if (
-                scenario.prefers_event1 is not None
-                or scenario.prefers_event2 is not None
-            ):
-                scenario_1_data, scenario_2_data = self.parse_scenario_data(
-                    scenario, user_onboarding_data_template
-                )
-
-                scenario_lst.extend([scenario_1_data, scenario_2_data])
-
-        return scenario_lst
-
-    def parse_scenario_data(self, scenario, data_template):
-        """
-        Helper function to parse user scenarios data formatting and standardizing
-        it into the PanelScenario row
-
-        Inputs:
-            scenario (Scenario): Rows of the user's scenarios from the Scenario Model
-            data_template (dict): Dictionary of user's event suggestions data
-
-        Returns:
-            user_event_suggestions_scenario_1: User's scenario 1 with preferences and onboarding information
-            user_event_suggestions_scenario_2: User's scenario 1 with preferences and onboarding information
-        """
-        user_event_suggestions_scenario_1 = data_template.copy()
-        user_event_suggestions_scenario_2 = data_template.copy()
-
-        user_event_suggestions_scenario_1.update({"scenario_id": scenario})
-        user_event_suggestions_scenario_2.update({"scenario_id": scenario})
-
-        user_event_suggestions_scenario_1.update(
-            self.parse_hobby_type(scenario.hobby1.type)
-        )
-        user_event_suggestions_scenario_2.update(
-            self.parse_hobby_type(scenario.hobby2.type)
-        )
-
-        user_event_suggestions_scenario_1.update(
-            self.parse_distance_mapping(scenario.distance1)
-        )
-        user_event_suggestions_scenario_2.update(
-            self.parse_distance_mapping(scenario.distance2)
-        )
-
-        num_part_1 = (
-            f"num_particip_{self.num_participant_mapping(scenario.num_participants1)}"
-        )
-        num_part_2 = (
-            f"num_particip_{self.num_participant_mapping(scenario.num_participants2)}"
-        )
-        user_event_suggestions_scenario_1.update({num_part_1: True})
-        user_event_suggestions_scenario_2.update({num_part_2: True})
-
-        user_event_suggestions_scenario_1.update(
-            self.parse_scenario_datetime(scenario.day_of_week1, scenario.time_of_day1)
-        )
-        user_event_suggestions_scenario_2.update(
-            self.parse_scenario_datetime(scenario.day_of_week2, scenario.time_of_day2)
-        )
-
-        user_event_suggestions_scenario_1.update(
-            self.parse_duration(scenario.duration_h1)
-        )
-        user_event_suggestions_scenario_2.update(
-            self.parse_duration(scenario.duration_h2)
-        )
-
-        user_event_suggestions_scenario_1["attended_event"] = scenario.prefers_event1
-        user_event_suggestions_scenario_2["attended_event"] = scenario.prefers_event2
-
-        return user_event_suggestions_scenario_1, user_event_suggestions_scenario_2
-
-    def parse_hobby_type(self, hobby_type):
-        """
-        Helper function to parse user's scenario hobby type data formatting and standardizing
-        it into the PanelScenario row
-
-        Inputs:
-            hobby_type (Hobby): Hobby Type of user's scenario
-
-        Returns:
-            hobby_data (dict): dictionary of user's scenario hobby type
-        """
-        hobby_data = {}
-
-        category_mapping = {
-            "TRAVEL": "hobby_category_travel",
-            "ARTS AND CULTURE": "hobby_category_arts_and_culture",
-            "LITERATURE": "hobby_category_literature",
-            "FOOD AND DRINK": "hobby_category_food",
-            "COOKING/BAKING": "hobby_category_cooking_and_baking",
-            "SPORT/EXERCISE": "hobby_category_exercise",
-            "OUTDOORS": "hobby_category_outdoor_activities",
-            "CRAFTING": "hobby_category_crafting",
-            "HISTORY AND LEARNING": "hobby_category_history",
-            "COMMUNITY EVENTS": "hobby_category_community",
-            "GAMING": "hobby_category_gaming",
-        }
-
-        for hobby_key in category_mapping.values():
-            hobby_data[hobby_key] = False
-
-        hobby_data[category_mapping[hobby_type.type]] = True
-
-        return hobby_data
-
-    def parse_distance_mapping(self, distance):
-        """
-        Helper function to parse user's scenario distance data formatting and standardizing
-        it into the PanelScenario row
-
-        Inputs:
-            distance (Scenario): Distance of user's scenario
-
-        Returns:
-            distance_data (dict): dictionary of user's scenario distance data
-        """
-        distance_data = {}
-
-        distance_preference_mapping = {
-            "Within 1 mile": "dist_within_1mi",
-            "Within 5 miles": "dist_within_5mi",
-            "Within 10 miles": "dist_within_10mi",
-            "Within 15 miles": "dist_within_15mi",
-            "Within 20 miles": "dist_within_20mi",
-            "Within 30 miles": "dist_within_30mi",
-            "Within 40 miles": "dist_within_40mi",
-            "Within 50 miles": "dist_within_50mi",
-        }
-        distance_data.update(
-            {
-                value: (distance == key)
-                for key, value in distance_preference_mapping.items()
-            }
-        )
-
-        return distance_data
-
-    def parse_scenario_datetime(self, day_of_week, time_of_day):
-        """
-        Helper function to parse user's scenario date and time data formatting and standardizing
-        it into the PanelScenario row
-
-        Inputs:
-            day_of_week (Scenario): Day of week of user's scenario
-            time_of_day (Scenario): Time of day of user's scenario
-
-        Returns:
-            scenario_datetime_mapping (dict): dictionary of user's scenario day and time data
-        """
-        scenario_datetime_mapping = {}
-        day_of_week = day_of_week.lower()
-        tod_string = time_of_day.split("(")[0].strip()
-        tod_standardized = "_".join(tod_string.lower().split())
-
-        days_of_week = [
-            "monday",
-            "tuesday",
-            "wednesday",
-            "thursday",
-            "friday",
-            "saturday",
-            "sunday",
-        ]
-        time_periods = [
-            "early_morning",
-            "morning",
-            "afternoon",
-            "evening",
-            "night",
-            "late_night",
-        ]
-
-        for day in days_of_week:
-            for period in time_periods:
-                field_name = f"{day}_{period}"
-                if field_name == f"{day_of_week}_{tod_standardized}":
-                    scenario_datetime_mapping[field_name] = True
-                else:
-                    scenario_datetime_mapping[field_name] = False
-
-        return scenario_datetime_mapping
-
-    def parse_duration(self, duration):
-        """
-        Helper function to parse user's scenario duration data formatting and standardizing
-        it into the PanelScenario row
-
-        Inputs:
-            duration (Scenario): duration of user's scenario
-
-        Returns:
-            duration_data (dict): dictionary of user's scenario duration data
-        """
-        duration_data = {f"duration_{i}hr": i == duration for i in range(1, 9)}
-        return duration_data
-
-
-class SuggestionResultsViewSet(viewsets.ModelViewSet):
+class SuggestionResultsViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     serializer_class = SuggestionResultsSerializer
     permission_classes = [HasAppToken]
+    pagination_class = IdCursorPagination
     queryset = SuggestionResults.objects.all()
 
     @action(detail=False, methods=["get"], url_path="finetune_model")
@@ -1666,32 +1044,77 @@ class SuggestionResultsViewSet(viewsets.ModelViewSet):
             return Response(result, status=400)
         return Response(result, status=200)
 
-    def perform_finetune(self):
+    def perform_finetune(self, num_devices=1, resume=False):
         """
         Core logic to finetune the ML model.
+
+        Both stages hold out 10% of their rows, stop once the validation loss
+        hasn't improved for 5 epochs, and checkpoint every epoch next to the
+        weights. Once pretraining finishes, its results are recorded next to
+        the weights until finetuning finishes too, so resuming an interrupted
+        finetuning doesn't pretrain again.
+
+        Inputs:
+            num_devices (int): number of devices to split training minibatches
+                across (see ml.train.train)
+            resume (bool): whether to continue an interrupted run from its
+                checkpoints
         """
         # get finetuning data
         finetuning_data = self.get_finetuning_data()
 
-        if not finetuning_data or len(finetuning_data) == 0:
+        if len(finetuning_data[0]) == 0:
             return {"error": "No data provided for finetuning."}
 
         # get pretraining data
         print("Getting pretraining data...")
-        pretraining_data = self.collect_training_data()
-        if not pretraining_data:
+        pretraining_data = read_training_rows(SCENARIO)
+        if len(pretraining_data[0]) == 0:
             return {"error": "Failed to fetch pretraining data"}
 
-        # pretrain the model
-        print("Pretraining the model...")
-        epochs_pt, loss_list_pt, acc_list_pt = pretrain(pretraining_data, num_epochs=30)
+        # the ML stack is only loaded by the suggestion and training endpoints
+        from ml.ml.recommendation import PARAMETERS_PATH, finetune, pretrain
+
+        # pretrain the model, unless an interrupted run already did
+        pretrained_path = PARAMETERS_PATH + ".pretrained.json"
+        if resume and os.path.isfile(pretrained_path):
+            print("Resuming after pretraining...")
+            with open(pretrained_path) as file:
+                epochs_pt, loss_list_pt, acc_list_pt = json.load(file)
+        else:
+            print("Pretraining the model...")
+            with timed("ml"):
+                epochs_pt, loss_list_pt, acc_list_pt = pretrain(
+                    pretraining_data,
+                    num_epochs=30,
+                    num_devices=num_devices,
+                    validation=0.1,
+                    patience=5,
+                    checkpoint_path=PARAMETERS_PATH + ".pretrain.ckpt",
+                    resume=resume,
+                )
+            with open(pretrained_path + ".tmp", "w") as file:
+                json.dump([epochs_pt, loss_list_pt, acc_list_pt], file)
+            os.replace(pretrained_path + ".tmp", pretrained_path)
 
         # finetune the model
         print("Finetuning the model...")
-        epochs, loss_list, acc_list = finetune(finetuning_data, num_epochs=30)
+        with timed("ml"):
+            epochs, loss_list, acc_list = finetune(
+                finetuning_data,
+                num_epochs=30,
+                num_devices=num_devices,
+                validation=0.1,
+                patience=5,
+                checkpoint_path=PARAMETERS_PATH + ".finetune.ckpt",
+                resume=resume,
+            )
+        os.remove(pretrained_path)
 
         return {
-            "data": finetuning_data,
+            "data": training_row_dicts(*finetuning_data),
+            "pretraining_rows": len(pretraining_data[0]),
+            "finetuning_rows": len(finetuning_data[0]),
             "pretraining_epochs": epochs_pt,
             "pretraining_loss_list": loss_list_pt,
             "pretraining_acc_list": acc_list_pt,
@@ -1702,47 +1125,14 @@ class SuggestionResultsViewSet(viewsets.ModelViewSet):
 
     def get_finetuning_data(self):
         """
-        Gets the finetuning data for the ML model.
+        Gets the finetuning data for the ML model from the TrainingRow table:
+        one row per UserEvents row of an upcoming event.
 
         Returns:
-            finetuning_data (list): List of dictionaries containing the finetuning data
+            finetuning_data (tuple): (features, user_ids, targets) arrays
         """
-        user_events_data = UserEvents.objects.all()
-        user_events_data_serializer = UserEventsSerializer(user_events_data, many=True)
-        finetuning_data = []
-
-        # grab data for finetuning
         print("Getting the finetuning data...")
-        for user_events_dict in user_events_data_serializer.data:
-            finetuning_dict = {}
-            user_id = user_events_dict["user_id"]
-            user_panel = PanelUserPreferences.objects.filter(user_id=user_id)
-
-            event_id = user_events_dict["event_id"]
-            # check if the event has passed and if not, don't add it to finetuning data
-            event = Event.objects.get(id=event_id)
-            if event.datetime < timezone.now():
-                continue
-            event_panel = PanelEvent.objects.filter(event_id=event_id)
-
-            if user_panel.exists() and event_panel.exists():
-
-                user_panel = user_panel[0]
-                user_panel_serialized = PanelUserPreferencesSerializer(user_panel)
-                finetuning_dict.update(user_panel_serialized.data)
-
-                event_panel = event_panel[0]
-                event_panel_serialized = PanelEventSerializer(event_panel)
-                finetuning_dict.update(event_panel_serialized.data)
-
-                # add distance from user
-                distance_bin = self.distance_calc(event_id, user_id)
-                finetuning_dict.update(distance_bin[0])
-
-                finetuning_dict["attended_event"] = user_events_dict["attended"]
-                finetuning_data.append(finetuning_dict)
-
-        return finetuning_data
+        return read_training_rows(EVENT, since=timezone.now())
 
     @action(detail=False, methods=["get"], url_path="get_training_data")
     def get_training_data(self, request):
@@ -1809,55 +1199,75 @@ class SuggestionResultsViewSet(viewsets.ModelViewSet):
 
             # Retrieve and process user and event data
             user_panel = PanelUserPreferences.objects.get(user_id=user)
-            event_panel = PanelEvent.objects.all()
+            onboarding = Onboarding.objects.get(user_id=user)
 
         except Exception as e:
             return {"error": f"Failed to find user or event panel data: {str(e)}"}
 
-        user_panel_dict = PanelUserPreferencesSerializer(user_panel).data
+        # decode the packed panels straight into the model's feature rows
+        _, user_features = USER_PREFERENCES_LAYOUT.read(
+            PanelUserPreferences.objects.filter(pk=user_panel.pk), "user_id"
+        )
+        event_ids, event_features = EVENT_LAYOUT.read(
+            PanelEvent.objects.all(), "event_id"
+        )
 
-        # convert events to list of dictionaries and constructs the distance portion of the dictionary
-        event_panel_dict_lst = [
-            PanelEventSerializer(event).data for event in event_panel
-        ]
-        distance_panel_list = []  # Set up list to hold panel distance data
-        event_ids = []  # Set up list to hold event IDs
-        attendance = []
-
-        # get distance and attendance
-        for event in event_panel_dict_lst:
-            # Construct a distance dictionary for each event-user pair
-            distance_panel_list.append(
-                self.distance_calc(event["event_id"], user_id)[0]
-            )
-            user_event = UserEvents.objects.filter(
-                user_id=user_id, event_id=event["event_id"]
-            )
-            if user_event.exists():
-                attendance.append(user_event[0].attended)
+        # distance from the user to every event
+        user_location = (onboarding.latitude, onboarding.longitude)
+        event_locations = {
+            pk: (latitude, longitude)
+            for pk, latitude, longitude in Event.objects.filter(
+                id__in=event_ids.tolist()
+            ).values_list("id", "latitude", "longitude")
+        }
+        distances = measure_distances(
+            [user_location] * len(event_ids),
+            [event_locations[event_id] for event_id in event_ids.tolist()],
+        )
 
-        # Combine the three dictionaries to form rows
-        model_list = [
-            {**user_panel_dict, **event, **distance_panel}
-            for event, distance_panel in zip(event_panel_dict_lst, distance_panel_list)
-        ]
+        features = model_features(
+            (USER_PREFERENCES_LAYOUT.columns, user_features.repeat(len(event_ids), 0)),
+            (EVENT_LAYOUT.columns, event_features),
+            (DISTANCE_COLUMNS, encode_distances(distances)),
+        )
 
         # Get recommendations
-        prediction_probs = recommend(model_list)
-        event_ids = [event["event_id"] for event in event_panel_dict_lst]
+        prediction_probs = []
+        if len(event_ids):
+            from ml.ml.inference import recommend_features
 
-        results = []
-        for pred, event_id in zip(prediction_probs, event_ids):
-            event = Event.objects.get(id=event_id)
-            result = SuggestionResults.objects.update_or_create(
-                user_id=user,
-                event_id=event,
-                defaults={
-                    "probability_of_attendance": pred[0],
-                    "event_date": event.datetime,
-                },
+            with timed("ml"):
+                prediction_probs = recommend_features(
+                    features, [user.id] * len(event_ids)
+                )
+
+        # upsert the suggestions in one statement (see the unique_suggestion
+        # constraint)
+        event_dates = dict(
+            Event.objects.filter(id__in=event_ids.tolist()).values_list("id", "datetime")
+        )
+        SuggestionResults.objects.bulk_create(
+            [
+                SuggestionResults(
+                    user_id=user,
+                    event_id_id=event_id,
+                    probability_of_attendance=pred[0],
+                    event_date=event_dates[event_id],
+                )
+                for pred, event_id in zip(prediction_probs, event_ids.tolist())
+            ],
+            update_conflicts=True,
+            unique_fields=["user_id", "event_id"],
+            update_fields=["probability_of_attendance", "event_date"],
+        )
+        # not every database returns the ids of upserted rows
+        upserted = {
+            result.event_id_id: result
+            for result in SuggestionResults.objects.filter(
+                user_id=user, event_id__in=event_ids.tolist()
             )
-            results.append(result[0])
+        }
+        results = [upserted[event_id] for event_id in event_ids.tolist()]
 
         # serialize the results for the response
         serializer = SuggestionResultsSerializer(results, many=True)
@@ -1904,7 +1314,8 @@ class SuggestionResultsViewSet(viewsets.ModelViewSet):
             .order_by("-probability_of_attendance")
             .values("event_id", "probability_of_attendance", "user_id")
         )
-        print("Top events: ", top_events)
+        # logged lazily, printing the queryset ran it an extra time
+        logger.debug("Top events: %s", top_events)
 
         # filter top events by distance
         top_events = [
@@ -1973,7 +1384,8 @@ class SuggestionResultsViewSet(viewsets.ModelViewSet):
 
         # convert nan probabilities to 0
         for event_suggestion in top_event_data:
-            if pd.isna(event_suggestion["probability_of_attendance"]):
+            probability = event_suggestion["probability_of_attendance"]
+            if probability is None or math.isnan(probability):
                 event_suggestion["probability_of_attendance"] = 0
 
         return Response({"top_events": top_event_data})
@@ -0,0 +1,140 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+# the zip codes and addresses known to the stub upstream server
+STUB_ZIPCODES = {
+    "90210": {"postal_code": "90210", "country_code": "US", "city": "Beverly Hills",
+              "state": "California", "province": "Los Angeles"},
+    "60637": {"postal_code": "60637", "country_code": "US", "city": "Chicago",
+              "state": "Illinois", "province": "Cook"},
+}
+STUB_ADDRESSES = {
+    "5801 S Ellis Ave, Chicago, IL 60637": {
+        "display_name": "5801, South Ellis Avenue, Hyde Park, Chicago, Cook County, Illinois, 60637, United States",
+        "lat": "41.7886079",
+        "lon": "-87.5987133",
+    },
+}
+
+
+class StubUpstreamHandler(BaseHTTPRequestHandler):
+    """
+    Answers like the zipcodestack API (/v1/search) and Nominatim (/search),
+    and keeps the paths it was requested.
+    """
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/v1/search":
+            codes = params.get("codes", "").split(",")
+            results = {
+                code: [STUB_ZIPCODES[code]] for code in codes if code in STUB_ZIPCODES
+            }
+            # like the API, an empty list if none of the codes exist
+            body = {
+                "query": {"codes": codes, "country": params.get("country")},
+                "results": results or [],
+            }
+        elif url.path == "/search":
+            location = STUB_ADDRESSES.get(params.get("q"))
+            body = [location] if location else []
+        else:
+            self.send_error(404)
+            return
+
+        content = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="session")
+def stub_upstream_server():
+    """
+    Runs the stub upstream server in a thread for the whole session.
+
+    Returns: the server's base URL
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubUpstreamHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub_upstream(stub_upstream_server, settings, monkeypatch):
+    """
+    Points the external services of s2s.utils.upstream at the stub server,
+    with geocoding not stubbed and the zip code cache empty.
+    """
+    pytest.importorskip("httpx")
+    from s2s.utils.zipcodes import cache
+
+    cache.clear()
+    StubUpstreamHandler.requests.clear()
+    settings.ZIPCODE_API_URL = f"{stub_upstream_server}/v1/search"
+    settings.GEOCODE_API_URL = f"{stub_upstream_server}/search"
+    monkeypatch.setenv("GEOCODE_STUB", "0")
+    return stub_upstream_server
+
+
+class StubSES:
+    """
+    Stands in for the SES client: records the emails sent, and fails the
+    sends to the addresses in failures with their error codes, in order.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def send_email(self, Source, Destination, Message):
+        # the ML tests run without the Django stack and its dependencies
+        from botocore.exceptions import ClientError
+
+        with self._lock:
+            for address in Destination["ToAddresses"]:
+                codes = self.failures.get(address)
+                if codes:
+                    code = codes.pop(0)
+                    raise ClientError(
+                        {"Error": {"Code": code, "Message": f"stub {code}"}}, "SendEmail"
+                    )
+            self.sent.append({
+                "to": Destination["ToAddresses"],
+                "subject": Message["Subject"]["Data"],
+                "body": Message["Body"]["Text"]["Data"],
+            })
+            return {"MessageId": f"stub-{len(self.sent)}"}
+
+
+@pytest.fixture(autouse=True)
+def ses_stub(monkeypatch):
+    """
+    Sends the emails of every test to a StubSES instead of SES (in the tests
+    that run with Django; the ML tests run without it).
+    """
+    from django.conf import settings
+
+    if not settings.configured:
+        return None
+    from s2s.utils import email_outbox
+
+    stub = StubSES()
+    monkeypatch.setattr(email_outbox, "get_ses_client", lambda: stub)
+    return stub
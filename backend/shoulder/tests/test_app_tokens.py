@@ -0,0 +1,94 @@
+import pytest
+from django.test import RequestFactory, override_settings
+from rest_framework.test import APIClient
+from s2s.db_models import ApplicationToken
+from s2s.middleware import ApplicationTokenMiddleware
+from s2s.permissions import HasAppToken
+from s2s.utils.app_tokens import TokenVerifier, verifier
+
+
+@pytest.fixture(autouse=True)
+def fresh_verifier():
+    '''
+    Drop digests cached by other tests, whose tokens were rolled back.
+    '''
+    verifier.invalidate()
+    yield
+    verifier.invalidate()
+
+
+@pytest.mark.django_db
+def test_verify_caches_digests(django_assert_num_queries):
+    token = ApplicationToken.objects.create(name="s2s").token
+
+    with django_assert_num_queries(1):
+        assert verifier.verify(token)
+        assert not verifier.verify(token + "x")
+        assert not verifier.verify("not-a-token")
+        assert not verifier.verify(None)
+        assert verifier.verify(token)
+
+
+@pytest.mark.django_db
+def test_token_changes_invalidate_cache():
+    token = ApplicationToken.objects.create(name="s2s")
+    assert verifier.verify(token.token)
+
+    other = ApplicationToken.objects.create(name="other")
+    assert verifier.verify(other.token)
+
+    token.delete()
+    assert not verifier.verify(token.token)
+    assert verifier.verify(other.token)
+
+
+@pytest.mark.django_db
+def test_ttl_expires_digests(django_assert_num_queries):
+    token = ApplicationToken.objects.create(name="s2s").token
+    short_lived = TokenVerifier(ttl=0)
+
+    with django_assert_num_queries(2):
+        assert short_lived.verify(token)
+        assert short_lived.verify(token)
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={"tokens": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_shared_cache(django_assert_num_queries):
+    token = ApplicationToken.objects.create(name="s2s").token
+    first, second = TokenVerifier(60, "tokens"), TokenVerifier(60, "tokens")
+
+    with django_assert_num_queries(1):
+        assert first.verify(token)
+        assert second.verify(token)
+
+    first.invalidate()
+    with django_assert_num_queries(1):
+        assert TokenVerifier(60, "tokens").verify(token)
+
+
+@pytest.mark.django_db
+def test_middleware_result_is_reused(django_assert_num_queries):
+    token = ApplicationToken.objects.create(name="s2s").token
+    request = RequestFactory().get("/", HTTP_X_APP_TOKEN=f"Bearer {token}")
+    middleware = ApplicationTokenMiddleware(lambda request: "response")
+
+    with django_assert_num_queries(1):
+        assert middleware(request) == "response"
+        assert request.app_token_valid
+        assert HasAppToken().has_permission(request, None)
+
+    bad_request = RequestFactory().get("/", HTTP_X_APP_TOKEN="not-a-token")
+    assert middleware(bad_request).status_code == 401
+
+
+@pytest.mark.django_db
+def test_api_request_checks_token_once(django_assert_max_num_queries):
+    token = ApplicationToken.objects.create(name="s2s").token
+    client = APIClient()
+    client.credentials(HTTP_X_APP_TOKEN=token)
+    client.get("/api/hobbytypes/")
+
+    with django_assert_max_num_queries(2):
+        response = client.get("/api/hobbytypes/")
+    assert response.status_code == 200
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from s2s.utils import upstream
+from s2s.utils.upstream import close_clients, get_client
+from tests.test_views import generate_app_token
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.mark.django_db
+def test_geocode_stubbed(api_client, monkeypatch):
+    """
+    Test the geocode endpoint requires the app token and an address.
+    """
+    monkeypatch.setenv("GEOCODE_STUB", "1")
+    url = "/api/geocode/"
+    assert api_client.get(url, {"address": "Chicago"}).status_code == status.HTTP_403_FORBIDDEN
+
+    app_token = generate_app_token()
+    response = api_client.get(url, HTTP_X_APP_TOKEN=app_token)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = api_client.get(url, {"address": "Chicago"}, HTTP_X_APP_TOKEN=app_token)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["address"] == "Chicago"
+    assert len(response.json()["coords"]) == 2
+
+
+@pytest.mark.django_db
+def test_geocode_upstream(api_client, stub_upstream):
+    """
+    Test the geocode endpoint calls Nominatim (the stub server).
+    """
+    app_token = generate_app_token()
+    url = "/api/geocode/"
+    response = api_client.get(
+        url, {"address": "5801 S Ellis Ave, Chicago, IL 60637"}, HTTP_X_APP_TOKEN=app_token
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["coords"] == [41.7886079, -87.5987133]
+
+    response = api_client.get(url, {"address": "nowhere"}, HTTP_X_APP_TOKEN=app_token)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_middleware(monkeypatch):
+    """
+    Test the middleware runs in the async chain of the ASGI handler.
+    """
+    monkeypatch.setenv("GEOCODE_STUB", "1")
+    app_token = generate_app_token()
+    client = AsyncClient()
+
+    response = async_to_sync(client.get)(
+        "/api/geocode/", {"address": "Chicago"}, headers={"X-App-Token": app_token}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    # the token is verified in sync_to_async's thread, with its connection
+    assert int(response["X-DB-Queries"]) > 0
+
+    response = async_to_sync(client.get)(
+        "/api/geocode/", {"address": "Chicago"}, headers={"X-App-Token": "invalid"}
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_pooled_client(settings):
+    """
+    Test the event loop reuses its client until it's closed.
+    """
+    pytest.importorskip("httpx")
+
+    async def clients():
+        first, second = get_client(), get_client()
+        await close_clients()
+        third = get_client()
+        await close_clients()
+        return first, second, third
+
+    first, second, third = asyncio.run(clients())
+    assert first is second
+    assert first.is_closed
+    assert third is not first
+
+
+@pytest.mark.django_db
+def test_wsgi_request_closes_client(api_client, stub_upstream, monkeypatch):
+    """
+    Test the client of a WSGI request's event loop is closed with the request.
+    """
+    clients = []
+
+    def recording_get_client():
+        clients.append(get_client())
+        return clients[-1]
+
+    monkeypatch.setattr(upstream, "get_client", recording_get_client)
+    response = api_client.get("/api/zipcodes/", {"zip_code": "90210"})
+    assert response.status_code == status.HTTP_200_OK
+    assert clients and all(client.is_closed for client in clients)
@@ -0,0 +1,74 @@
+import json
+import numpy as np
+import pytest
+from shoulder.ml.ml.benchmark import (
+    auc,
+    compare,
+    feature_groups,
+    precision_at_k,
+    run_benchmark,
+    synthetic_rows,
+)
+
+COLUMNS = sorted(
+    [f"hobby_category_{c}" for c in ["food", "gaming", "travel"]]
+    + [f"num_particip_{n}" for n in ["1to5", "5to10"]]
+    + [f"duration_{i}hr" for i in range(1, 4)]
+    + [f"dist_within_{d}mi" for d in [1, 5, 10]]
+    + [f"{day}_{period}" for day in ["monday", "friday"] for period in ["morning", "evening"]]
+)
+COLUMNS = sorted(COLUMNS + ["pref_" + column for column in COLUMNS])
+
+
+def test_synthetic_rows_follow_schema():
+    features, user_ids, targets = synthetic_rows(COLUMNS, 1000, num_users=50, seed=1)
+    assert features.shape == (1000, len(COLUMNS)) and features.dtype == bool
+    assert user_ids.shape == (1000,) and len(np.unique(user_ids)) <= 50
+    assert 0.1 < targets.mean() < 0.9
+
+    groups = feature_groups(COLUMNS)
+    assert set(groups) == {"hobby_category_", "num_particip_", "duration_", "dist_within_", "time"}
+    for columns in groups.values():
+        assert (features[:, columns].sum(axis=1) == 1).all(), "Ensure one-hot groups"
+
+    # every user's preferences are the same in all of their rows
+    prefs = [i for i, column in enumerate(COLUMNS) if column.startswith("pref_")]
+    first = {}
+    for user_id, row in zip(user_ids, features[:, prefs]):
+        assert (first.setdefault(user_id, row) == row).all()
+
+
+def test_ranking_metrics():
+    assert auc([0, 0, 1, 1], [0.1, 0.2, 0.3, 0.4]) == 1.0
+    assert auc([0, 0, 1, 1], [0.4, 0.3, 0.2, 0.1]) == 0.0
+    assert auc([0, 1], [0.5, 0.5]) == 0.5
+    assert auc([1, 1], [0.1, 0.2]) is None
+
+    y = [1, 0, 0, 1, 1, 0]
+    scores = [0.9, 0.8, 0.1, 0.2, 0.7, 0.6]
+    users = [1, 1, 1, 2, 2, 2]
+    # user 1's top 2 are rows 0 and 1, user 2's are rows 4 and 5
+    assert precision_at_k(y, scores, users, k=2) == pytest.approx(0.5)
+    assert precision_at_k(y, scores, users, k=1) == pytest.approx(1.0)
+    assert precision_at_k(y, scores, users, k=10) == pytest.approx(0.5)
+
+
+def test_run_benchmark(tmp_path):
+    output = tmp_path / "benchmark.json"
+    results = run_benchmark(
+        COLUMNS, num_rows=2000, num_users=40, num_events=30, num_epochs=2,
+        batch_sizes=(1, 64), num_buckets=64, output=str(output),
+    )
+    assert json.loads(output.read_text()) == results
+
+    assert results["preprocess"]["numpy_rows_per_second"] > 0
+    assert results["training"]["steps_per_second"] > 0
+    assert set(results["inference"]) == {"1", "64"}
+    for entry in results["inference"].values():
+        assert set(entry) == {"numpy_float32", "numpy_float16", "numpy_int8", "jax_float32"}
+        assert all(measurement["rows_per_second"] > 0 for measurement in entry.values())
+    assert 0 <= results["quality"]["float32"]["auc"] <= 1
+    assert results["memory"]["max_rss_mb"] > 0
+
+    changes = compare(results, results)
+    assert changes and all(change in (0, None) for _, _, _, change in changes)
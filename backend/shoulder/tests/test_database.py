@@ -0,0 +1,72 @@
+import django
+import environ
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from ShoulderToShoulder.database import database_settings
+
+DB_VARIABLES = [
+    "DATABASE_URL", "DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT",
+    "DB_POOL", "DB_CONN_MAX_AGE", "DB_SQLITE_TIMEOUT",
+]
+
+
+@pytest.fixture
+def env(monkeypatch):
+    for name in DB_VARIABLES:
+        monkeypatch.delenv(name, raising=False)
+    return environ.Env()
+
+
+def test_sqlite_by_default(env, tmp_path, monkeypatch):
+    database = database_settings(env, tmp_path)["default"]
+    assert database["ENGINE"] == "django.db.backends.sqlite3"
+    assert database["NAME"] == str(tmp_path / "s2s.sqlite")
+    assert database["OPTIONS"] == {"timeout": 20.0}
+
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path}/other.sqlite")
+    monkeypatch.setenv("DB_SQLITE_TIMEOUT", "5")
+    database = database_settings(env, tmp_path)["default"]
+    assert database["NAME"] == f"{tmp_path}/other.sqlite"
+    assert database["OPTIONS"] == {"timeout": 5.0}
+
+
+def test_postgres(env, tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgres://s2s:secret@db:5432/s2s")
+    database = database_settings(env, tmp_path)["default"]
+    assert database["ENGINE"] == "django.db.backends.postgresql"
+    assert (database["HOST"], database["NAME"], database["USER"]) == ("db", "s2s", "s2s")
+    assert database["CONN_MAX_AGE"] == 60
+    assert database["CONN_HEALTH_CHECKS"]
+
+    monkeypatch.delenv("DATABASE_URL")
+    for name, value in [("DB_HOST", "db"), ("DB_NAME", "s2s"), ("DB_USER", "s2s"),
+                        ("DB_PASSWORD", "secret"), ("DB_CONN_MAX_AGE", "0")]:
+        monkeypatch.setenv(name, value)
+    database = database_settings(env, tmp_path)["default"]
+    assert database["ENGINE"] == "django.db.backends.postgresql"
+    assert database["PORT"] == "5432" and database["CONN_MAX_AGE"] == 0
+
+    monkeypatch.setenv("DB_POOL", "1")
+    if django.VERSION < (5, 1):
+        with pytest.raises(ImproperlyConfigured):
+            database_settings(env, tmp_path)
+    else:
+        database = database_settings(env, tmp_path)["default"]
+        assert database["OPTIONS"]["pool"] == {"min_size": 2, "max_size": 10}
+        assert database["CONN_MAX_AGE"] == 0
+
+
+def test_sqlite_wal(env, tmp_path, django_db_blocker):
+    connection = DatabaseWrapper(
+        {**database_settings(env, tmp_path)["default"], "TIME_ZONE": None,
+         "CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "AUTOCOMMIT": True, "ATOMIC_REQUESTS": False}
+    )
+    try:
+        with django_db_blocker.unblock(), connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            assert cursor.fetchone()[0] == "wal"
+            cursor.execute("PRAGMA busy_timeout")
+            assert cursor.fetchone()[0] == 20000
+    finally:
+        connection.close()
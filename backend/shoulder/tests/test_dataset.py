@@ -1,6 +1,7 @@
 import jaxlib
+import numpy as np
 import jax.numpy as jnp
-from shoulder.ml.ml.dataset import Dataset
+from shoulder.ml.ml.dataset import Dataset, MemmapDataset
 
 
 def test_dataset_init():
@@ -23,3 +24,29 @@ def test_dataset_iteration():
         assert type(x_batch) == jaxlib.xla_extension.ArrayImpl, "Ensure x_batch is a jax array"
         assert type(y_batch) == jaxlib.xla_extension.ArrayImpl, "Ensure y_batch is a jax array"
 
+
+
+def test_memmap_dataset_iteration(tmp_path):
+    x = np.lib.format.open_memmap(tmp_path / "x.npy", mode="w+", dtype=np.float32, shape=(23, 2))
+    x[:] = np.arange(46).reshape(23, 2)
+    np.save(tmp_path / "y.npy", np.arange(23, dtype=np.float32))
+    x.flush()
+
+    test_data = MemmapDataset(tmp_path / "x.npy", tmp_path / "y.npy", 4, 9, block_size=8)
+    assert test_data.num_batches == 6, "Ensure correct number of batches"
+
+    epochs = []
+    for _ in range(2):
+        batches = list(test_data)
+        assert len(batches) == 6, "Ensure every epoch yields num_batches batches"
+        assert [len(y_batch) for _, y_batch in batches] == [4, 4, 4, 4, 4, 3], "Ensure full batches"
+
+        for x_batch, y_batch in batches:
+            assert type(x_batch) == jaxlib.xla_extension.ArrayImpl, "Ensure x_batch is a jax array"
+            assert jnp.array_equal(x_batch[:, 0], 2 * y_batch), "Ensure rows stay paired with targets"
+
+        ys = jnp.concatenate([y_batch for _, y_batch in batches])
+        assert sorted(ys.tolist()) == list(range(23)), "Ensure every row is visited once per epoch"
+        epochs.append(ys.tolist())
+
+    assert epochs[0] != epochs[1], "Ensure every epoch is reshuffled"
@@ -0,0 +1,118 @@
+import time
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+
+from s2s.db_models import EmailMessage, OutboxEmail, Profile
+from s2s.utils.email_outbox import RateLimiter, enqueue, send_pending
+
+
+@pytest.fixture
+def users():
+    users = [
+        User.objects.create(username=f"user{i}", email=f"user{i}@example.com")
+        for i in range(3)
+    ]
+    users.append(User.objects.create(username="noemail", email=""))
+    for user in users:
+        Profile.objects.create(user_id=user)
+    return users
+
+
+@pytest.mark.django_db
+def test_weekly_email(users, ses_stub):
+    """
+    Test the weekly email is sent to every user with an email address, one
+    recipient per SES call, and their last_email_sent is updated.
+    """
+    out = StringIO()
+    call_command("send_weekly_email_m", stdout=out)
+
+    assert "Emails sent to 3 users" in out.getvalue()
+    assert sorted(email["to"] for email in ses_stub.sent) == [
+        ["user0@example.com"], ["user1@example.com"], ["user2@example.com"]
+    ]
+    assert ses_stub.sent[0]["subject"] == "New S2S Events for You"
+    assert EmailMessage.objects.count() == 1
+    assert OutboxEmail.objects.filter(status=OutboxEmail.SENT).count() == 3
+    assert Profile.objects.filter(last_email_sent__isnull=False).count() == 3
+    assert Profile.objects.get(user_id=users[3]).last_email_sent is None
+
+
+@pytest.mark.django_db
+def test_enqueue_only(users, ses_stub):
+    """
+    Test --enqueue-only leaves the emails to the send_outbox_m worker.
+    """
+    call_command("send_weekly_email_m", enqueue_only=True, stdout=StringIO())
+    assert OutboxEmail.objects.filter(status=OutboxEmail.PENDING).count() == 3
+    assert ses_stub.sent == []
+
+    out = StringIO()
+    call_command("send_outbox_m", stdout=out)
+    assert "3 sent" in out.getvalue()
+    assert len(ses_stub.sent) == 3
+
+
+@pytest.mark.django_db
+def test_retry_and_failure(users, ses_stub, settings):
+    """
+    Test transient errors are retried with backoff, and other errors and
+    too many attempts fail the email.
+    """
+    settings.EMAIL_MAX_ATTEMPTS = 2
+    ses_stub.failures = {
+        "user0@example.com": ["Throttling"],
+        "user1@example.com": ["MessageRejected"],
+        "user2@example.com": ["Throttling", "Throttling"],
+    }
+    message = EmailMessage.objects.create(kind="weekly", subject="Subject", body="Body")
+    enqueue(message, [(user.id, user.email) for user in users[:3]])
+
+    assert send_pending() == {"sent": 0, "retried": 2, "failed": 1}
+    retried = OutboxEmail.objects.get(recipient="user0@example.com")
+    assert retried.status == OutboxEmail.PENDING
+    assert retried.attempts == 1
+    assert retried.next_attempt_at > timezone.now() + timedelta(seconds=50)
+    rejected = OutboxEmail.objects.get(recipient="user1@example.com")
+    assert rejected.status == OutboxEmail.FAILED
+    assert "MessageRejected" in rejected.last_error
+
+    # nothing is due until the backoff expires
+    assert send_pending() == {"sent": 0, "retried": 0, "failed": 0}
+    OutboxEmail.objects.update(next_attempt_at=timezone.now())
+    assert send_pending() == {"sent": 1, "retried": 0, "failed": 1}
+    assert OutboxEmail.objects.get(recipient="user0@example.com").status == OutboxEmail.SENT
+    assert OutboxEmail.objects.get(recipient="user2@example.com").attempts == 2
+
+
+@pytest.mark.django_db
+def test_claimed_emails(users, ses_stub):
+    """
+    Test emails claimed by a worker aren't sent by another until the claim
+    expires.
+    """
+    message = EmailMessage.objects.create(kind="weekly", subject="Subject", body="Body")
+    enqueue(message, [(user.id, user.email) for user in users[:3]])
+    OutboxEmail.objects.update(next_attempt_at=timezone.now() + timedelta(minutes=10))
+
+    assert send_pending(limit=2) == {"sent": 0, "retried": 0, "failed": 0}
+    OutboxEmail.objects.update(next_attempt_at=timezone.now())
+    assert send_pending(limit=2, batch_size=1)["sent"] == 2
+    assert send_pending()["sent"] == 1
+
+
+def test_rate_limiter():
+    """
+    Test the rate limiter allows a burst of rate calls, then rate calls per
+    second.
+    """
+    limiter = RateLimiter(50)
+    start = time.monotonic()
+    for _ in range(55):
+        limiter.acquire()
+    assert 0.08 <= time.monotonic() - start < 1
@@ -0,0 +1,68 @@
+import pytest
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from s2s.db_models import EmailMessage, Event, HobbyType, OutboxEmail, UserEvents
+from s2s.utils.event_emails import event_message
+from tests.test_views import generate_app_token
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def event():
+    hobby_type = HobbyType.objects.create(type="OUTDOOR")
+    return Event.objects.create(
+        title="Hike", hobby_type=hobby_type, datetime=timezone.now(), duration_h=2,
+        address1="5801 S Ellis Ave", city="Chicago", state="IL", zipcode="60637",
+        latitude=41.78, longitude=-87.6, price="Free", max_attendees=6,
+    )
+
+
+@pytest.mark.django_db
+def test_rsvp_queues_email(api_client, event, ses_stub):
+    """
+    Test RSVPs queue their confirmation without calling SES, reusing the
+    event's message, and the worker sends them.
+    """
+    app_token = generate_app_token()
+    users = [User.objects.create(username=f"user{i}", email=f"user{i}@example.com") for i in range(2)]
+    for user in users:
+        response = api_client.post(
+            "/api/userevents/", {"user_id": user.id, "event_id": event.id, "rsvp": "Yes"},
+            format="json", HTTP_X_APP_TOKEN=app_token,
+        )
+        assert response.status_code == 201
+
+    assert ses_stub.sent == []
+    assert UserEvents.objects.filter(rsvp="Yes").count() == 2
+    assert EmailMessage.objects.count() == 1
+    assert OutboxEmail.objects.filter(status=OutboxEmail.PENDING).count() == 2
+
+    call_command("send_outbox_m", stdout=StringIO())
+    assert sorted(email["to"] for email in ses_stub.sent) == [["user0@example.com"], ["user1@example.com"]]
+    assert ses_stub.sent[0]["subject"] == "S2S Event Confirmation: Hike"
+    assert "5801 S Ellis Ave" in ses_stub.sent[0]["body"]
+
+
+@pytest.mark.django_db
+def test_event_message_rerendered(event):
+    """
+    Test the event's message is rendered once, and again after the event
+    changes.
+    """
+    message = event_message(event)
+    assert event_message(event) == message
+
+    event.title = "Bike ride"
+    event.save()
+    message.refresh_from_db()
+    assert message.event_id is None
+    assert event_message(event).subject == "S2S Event Confirmation: Bike ride"
+    assert EmailMessage.objects.count() == 2
@@ -0,0 +1,84 @@
+import os
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+# modules the web tier and the cron commands must not load at startup; the ML
+# and plotting stacks are imported by the suggestion and training entry points
+HEAVY_MODULES = ["jax", "optax", "matplotlib", "pandas", "tqdm"]
+
+# cumulative import time budget for Django startup plus the imports below, in
+# seconds; loading the ML stack alone takes about 2 seconds, so the budget has
+# headroom for slow machines and still catches it
+IMPORT_BUDGET = 1.5
+
+STARTUP = """
+import django
+django.setup()
+import ShoulderToShoulder.urls
+import s2s.views
+import s2s.management.commands.send_weekly_email_m
+import s2s.management.commands.choices_m
+"""
+
+
+def import_times(code):
+    '''
+    Runs code in a fresh interpreter with -X importtime.
+
+    Returns: a dict of the cumulative import time (in seconds) of every
+        imported module
+    '''
+    env = {**os.environ}
+    env.setdefault("DJANGO_SETTINGS_MODULE", "ShoulderToShoulder.settings")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=pathlib.Path(__file__).parent.parent,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        indent = len(name) - len(name.lstrip())
+        times[name.strip()] = (int(cumulative) / 1e6, indent)
+    return times
+
+
+@pytest.fixture(scope="module")
+def startup_times():
+    return import_times(STARTUP)
+
+
+@pytest.mark.parametrize("module", HEAVY_MODULES)
+def test_startup_skips_heavy_modules(startup_times, module):
+    assert module not in startup_times
+
+
+def test_startup_import_budget(startup_times):
+    # only top-level imports, so nested modules aren't counted twice
+    total = sum(seconds for seconds, indent in startup_times.values() if indent == 1)
+    assert total < IMPORT_BUDGET, f"startup imports took {total:.2f}s"
+
+
+def test_training_entry_points_load_ml_stack():
+    times = import_times("import ml.ml.recommendation")
+    assert "jax" in times
+    assert "matplotlib" not in times
+
+
+def test_numpy_inference_skips_jax():
+    times = import_times(
+        "import numpy as np\n"
+        "from ml.ml.inference import recommend_features\n"
+        "recommend_features(np.zeros((2, 148), dtype=bool), [1, 2])\n"
+    )
+    assert "ml.ml.inference" in times
+    assert "jax" not in times
@@ -0,0 +1,206 @@
+import os
+import numpy as np
+import jax.numpy as jnp
+from jax import random
+from shoulder.ml.ml import inference
+from shoulder.ml.ml.model import foward_deep_fm, foward_embedding, foward_fm, foward_mlp
+from shoulder.ml.ml.model import init_deep_fm
+from shoulder.ml.ml.train import predict, save_outputs
+
+
+def jax_forward(params, X):
+    '''
+    The serving forward pass of foward_deep_fm in JAX: MLP dropout is off and
+    the FM and MLP scores are added row by row.
+    '''
+    embedding_params, fm_params, mlp_params = params
+    embeddings = jnp.nan_to_num(foward_embedding(embedding_params, X))
+    fm_out = foward_fm(fm_params, embeddings)
+    mlp_out = foward_mlp(mlp_params, embeddings, train=False)
+    return jnp.asarray(1 / (1 + jnp.exp(-(fm_out + mlp_out))))
+
+
+def test_numpy_forward_matches_jax(tmp_path):
+    params = init_deep_fm(51, 5, 5)
+    X = random.randint(random.PRNGKey(3), (64, 5), minval=0, maxval=52).astype(float)
+
+    path = tmp_path / "params.npz"
+    inference.export_weights(params, path)
+    numpy_params = inference.load_weights(path)
+
+    embedding_params, fm_params, mlp_params = numpy_params
+    embeddings = inference.foward_embedding(embedding_params, np.asarray(X))
+    assert np.allclose(
+        embeddings, np.nan_to_num(foward_embedding(params[0], X)), atol=1e-6
+    )
+
+    expected = np.asarray(jax_forward(params, X))
+    scores = inference.foward_fm(fm_params, embeddings) + inference.foward_mlp(
+        mlp_params, embeddings
+    )
+    assert np.allclose(1 / (1 + np.exp(-scores)), expected, atol=1e-5)
+
+    deep_fm = np.asarray(foward_deep_fm(params, X, dropout=0.0))
+    assert np.allclose(deep_fm, expected, atol=1e-5)
+
+
+def test_predict_matches_jax_backend():
+    features = np.asarray(random.bernoulli(random.PRNGKey(5), 0.5, (32, 148)))
+    user_ids = np.arange(32) * 7
+    user_ids[-1] = 1000000  # a user that isn't in the training data
+
+    numpy_out = inference.recommend_features(features, user_ids, backend="numpy")
+    jax_out = inference.recommend_features(features, user_ids, backend="jax")
+    assert numpy_out.shape == (32, 1)
+    assert not np.isnan(numpy_out).any()
+    assert np.allclose(numpy_out, jax_out, atol=1e-5)
+
+    tokens = inference.tokens(features, user_ids)
+    assert np.allclose(inference.predict(tokens), np.asarray(predict(tokens)), atol=1e-5)
+
+
+def test_save_outputs_exports_weights(tmp_path):
+    params = init_deep_fm(51, 5, 5)
+    path = tmp_path / "params.pkl"
+    save_outputs([1], [0.5], [0.5], params, str(path))
+    assert os.path.isfile(inference.exported_path(path))
+
+    X = random.randint(random.PRNGKey(4), (8, 5), minval=0, maxval=52).astype(float)
+    assert np.allclose(
+        inference.predict(np.asarray(X), str(path)),
+        np.asarray(jax_forward(params, X)),
+        atol=1e-5,
+    )
+
+    # retraining replaces the cached weights
+    params = init_deep_fm(51, 5, 5, seeds=(2, 3, 4))
+    save_outputs([1], [0.5], [0.5], params, str(path))
+    assert np.allclose(
+        inference.predict(np.asarray(X), str(path)),
+        np.asarray(jax_forward(params, X)),
+        atol=1e-5,
+    )
+
+
+def test_stale_weights_are_found_by_hash(tmp_path):
+    import pickle
+
+    path = tmp_path / "params.pkl"
+    save_outputs([1], [0.5], [0.5], init_deep_fm(51, 5, 5), str(path))
+
+    # a checkout can leave the npz newer than a pickle it wasn't exported from
+    params = init_deep_fm(51, 5, 5, seeds=(2, 3, 4))
+    with open(path, "wb") as file:
+        pickle.dump(params, file)
+    npz_path = inference.exported_path(path)
+    os.utime(path, (0, 0))
+
+    X = random.randint(random.PRNGKey(4), (8, 5), minval=0, maxval=52).astype(float)
+    assert np.allclose(
+        inference.predict(np.asarray(X), str(path)),
+        np.asarray(jax_forward(params, X)),
+        atol=1e-5,
+    )
+    with np.load(npz_path) as arrays:
+        assert str(arrays["source_hash"]) == inference.file_hash(path)
+
+
+def test_quantize_int8():
+    array = np.array(random.normal(random.PRNGKey(6), (10, 4)))
+    array[3] = 0
+    values, scales = inference.quantize_int8(array, axis=1)
+    assert values.dtype == np.int8 and scales.shape == (10, 1)
+    assert np.abs(values * scales - array).max() <= scales.max() / 2 + 1e-7
+    assert (values[3] == 0).all()
+
+
+def test_quantized_weights(tmp_path):
+    params = init_deep_fm(51, 5, 5)
+    path = tmp_path / "params.pkl"
+    save_outputs([1], [0.5], [0.5], params, str(path))
+
+    X = random.randint(random.PRNGKey(8), (256, 5), minval=0, maxval=60).astype(float)
+    y = np.asarray(random.bernoulli(random.PRNGKey(9), 0.35, (256,)))
+    report = inference.quantization_report(np.asarray(X), y, str(path))
+
+    assert report["float32"]["max_abs_error"] == 0
+    assert report["float16"]["bytes"] < report["float32"]["bytes"]
+    assert report["int8"]["bytes"] < report["float16"]["bytes"]
+    for precision in ["float16", "int8"]:
+        assert os.path.isfile(inference.exported_path(path, precision))
+        assert report[precision]["max_abs_error"] < 0.01
+        assert report[precision]["agreement"] > 0.95
+
+    embedding_params, _, mlp_params = inference.weights(str(path), "int8")
+    assert embedding_params[0]["embedding_weights"].dtype == np.int8
+    assert all(layer["weights"].dtype == np.int8 for layer in mlp_params)
+
+
+def test_holdout(tmp_path):
+    from shoulder.ml.ml.recommendation import save_holdout
+
+    path = str(tmp_path / "params.pkl")
+    X, y = np.arange(12.0).reshape(4, 3), np.array([0.0, 1.0, 1.0, 0.0])
+    save_holdout(path, (X, y))
+    held_X, held_y = inference.load_holdout(path)
+    assert (held_X == X).all() and (held_y == y).all()
+
+    # weights trained on every row have no held-out rows
+    save_holdout(path, None)
+    assert not os.path.isfile(inference.holdout_path(path))
+
+
+def test_user_buckets():
+    buckets = inference.user_buckets(np.arange(10000), 64)
+    assert buckets.min() >= 0 and buckets.max() < 64
+    assert (buckets == inference.user_buckets(np.arange(10000), 64)).all()
+    assert np.bincount(buckets, minlength=64).min() > 100, "Ensure users are spread over the buckets"
+
+    # the vocabulary doesn't depend on the user IDs
+    features = np.zeros((2, 5), dtype=bool)
+    tokens = inference.tokens(features, [1, 10**9], num_buckets=64)
+    assert tokens.max() < inference.vocab_size(5, 64)
+
+
+def test_unseen_users_share_trained_buckets(tmp_path):
+    params = init_deep_fm(inference.vocab_size(5, 16), 6, 5)
+    assert inference.model_buckets(params) == 16
+
+    path = tmp_path / "params.pkl"
+    save_outputs([1], [0.5], [0.5], params, str(path))
+    embedding_params = inference.weights(str(path))[0]
+
+    features = np.zeros((1, 5), dtype=bool)
+    user_id = 10**9
+    X = inference.tokens(features, [user_id], dtype=np.int64, num_buckets=16)
+    embedding = inference.foward_embedding(embedding_params, X)[0, -5:]
+    bucket = inference.user_buckets([user_id], 16)[0]
+    assert np.allclose(embedding, embedding_params[0]["embedding_weights"][10 + bucket])
+    assert np.abs(embedding).sum() > 0
+
+
+def test_legacy_user_tokens(tmp_path):
+    import pickle
+
+    # weights trained before the hashing trick are pickled without a format
+    params = init_deep_fm(inference.vocab_size(5, 16), 6, 5)
+    path = tmp_path / "params.pkl"
+    with open(path, "wb") as file:
+        pickle.dump(params, file)
+    assert inference.load_parameters(str(path))[1] == inference.LEGACY_FORMAT
+    assert inference.weights_format(str(path)) == inference.LEGACY_FORMAT
+    assert not inference.hashes_users(inference.weights_format(str(path), "int8"))
+    numpy_params = inference.weights(str(path))
+
+    # finetuning keeps the format
+    save_outputs([1], [0.5], [0.5], params, str(path), inference.LEGACY_FORMAT)
+    assert inference.load_parameters(str(path))[1] == inference.LEGACY_FORMAT
+    save_outputs([1], [0.5], [0.5], params, str(path))
+    assert inference.weights_format(str(path)) == inference.MODEL_FORMAT
+
+    # users keep the row trained for their ID, and IDs past the table get
+    # its last row, like the JAX backend's clamping did
+    features = np.zeros((3, 5), dtype=bool)
+    X = inference.tokens(features, [0, 3, 10**9], dtype=np.int64, num_buckets=16, hashed=False)
+    assert X[:, -1].tolist() == [11, 14, 26]
+    assert X.max() < len(numpy_params[0][0]["embedding_weights"])
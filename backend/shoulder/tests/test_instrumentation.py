@@ -0,0 +1,82 @@
+import json
+import logging
+import pytest
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework.test import APIClient
+from s2s.db_models import *
+from s2s.utils.instrumentation import collect, registry, timed
+from tests.test_views import generate_app_token
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture(autouse=True)
+def reset_registry():
+    registry.reset()
+
+
+@pytest.mark.django_db
+def test_collect_and_timed():
+    with collect() as metrics:
+        list(HobbyType.objects.all())
+        HobbyType.objects.count()
+        with timed("geocode"):
+            pass
+    with timed("ml"):
+        pass
+
+    assert metrics.db_queries == 2
+    assert metrics.db_seconds > 0
+    summary = metrics.summary()
+    assert "geocode_ms" in summary and "ml_ms" not in summary, "Ensure only calls in the block count"
+    assert 's2s_external_call_seconds_count{category="ml"} 1' in registry.render()
+
+
+@pytest.mark.django_db
+def test_request_summary(api_client, caplog):
+    token = generate_app_token()
+    with caplog.at_level(logging.INFO, logger="s2s.instrumentation"):
+        response = api_client.get("/api/hobbytypes/", HTTP_X_APP_TOKEN=token)
+    assert response.status_code == 200
+    assert int(response["X-DB-Queries"]) > 0
+    assert response["Server-Timing"].startswith("total;dur=")
+
+    summary = json.loads(caplog.records[-1].getMessage())
+    assert summary["view"] == "hobbytype-list"
+    assert summary["status"] == 200
+    assert summary["db_queries"] == int(response["X-DB-Queries"])
+    assert "over_query_threshold" not in summary
+
+    with override_settings(INSTRUMENTATION_QUERY_THRESHOLD=0):
+        with caplog.at_level(logging.INFO, logger="s2s.instrumentation"):
+            api_client.get("/api/hobbytypes/", HTTP_X_APP_TOKEN=token)
+    assert caplog.records[-1].levelno == logging.WARNING
+    assert json.loads(caplog.records[-1].getMessage())["over_query_threshold"]
+    assert (
+        's2s_requests_over_query_threshold_total{view="hobbytype-list",method="GET"} 1'
+        in registry.render()
+    )
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(api_client):
+    api_client.get("/api/hobbytypes/", HTTP_X_APP_TOKEN=generate_app_token())
+
+    user = User.objects.create_user("user", "user@s2s.com", "password")
+    api_client.force_authenticate(user)
+    assert api_client.get("/api/metrics/").status_code == 403
+
+    user.is_staff = True
+    user.save()
+    response = api_client.get("/api/metrics/")
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+
+    text = response.content.decode()
+    assert "# TYPE s2s_request_duration_seconds histogram" in text
+    assert 's2s_request_db_queries_count{view="hobbytype-list",method="GET"} 1' in text
+    assert 's2s_request_db_queries_bucket{view="hobbytype-list",method="GET",le="+Inf"} 1' in text
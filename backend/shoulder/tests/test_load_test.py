@@ -0,0 +1,63 @@
+import pytest
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from gis.gis_module import geocode, stub_geocode
+from s2s.db_models import *
+from s2s.utils.load_test import (
+    LOAD_TEST_DOMAIN,
+    clear_load_test_data,
+    generate_load_test_data,
+    run_load_test,
+    workload,
+)
+
+
+def test_stub_geocode(monkeypatch):
+    monkeypatch.setenv("GEOCODE_STUB", "1")
+    result = geocode("5801 S Ellis Ave Chicago, IL 60637")
+    assert result == stub_geocode("5801 S Ellis Ave Chicago, IL 60637")
+    latitude, longitude = result["coords"]
+    assert 41.7 < latitude < 42.1 and -87.9 < longitude < -87.4
+
+
+@pytest.mark.django_db
+def test_generate_load_test_data():
+    counts = generate_load_test_data(6, 10, num_scenarios=2, num_rsvps=2, num_suggestions=3)
+    assert counts["users"] == 6 and counts["events"] == 10
+
+    users = User.objects.filter(email__endswith=LOAD_TEST_DOMAIN)
+    assert users.count() == 6
+    assert Onboarding.objects.filter(user_id__in=users, onboarded=True).count() == 6
+    assert Scenarios.objects.filter(user_id__in=users).count() == 12
+    assert UserEvents.objects.filter(user_id__in=users).count() == 12
+    assert SuggestionResults.objects.filter(user_id__in=users).count() == 18
+    assert PanelUserPreferences.objects.filter(user_id__in=users).count() == 6
+    assert PanelEvent.objects.count() == 10
+    assert TrainingRow.objects.exists(), "Ensure the training rows are built"
+
+    # more users get new email addresses
+    generate_load_test_data(2, 1)
+    assert User.objects.filter(email__endswith=LOAD_TEST_DOMAIN).count() == 8
+
+    assert clear_load_test_data() == 8
+    assert not Event.objects.exists()
+
+
+@pytest.mark.django_db
+def test_run_load_test():
+    generate_load_test_data(4, 6, num_scenarios=2)
+    requests = workload(12, seed=1)
+    assert requests == workload(12, seed=1), "Ensure the workload is seeded"
+
+    report = run_load_test(12, concurrency=1, seed=1)
+    assert report["all"]["requests"] == 12
+    assert report["all"]["errors"] == 0
+    assert report["all"]["p50_ms"] <= report["all"]["p95_ms"] <= report["all"]["p99_ms"]
+    assert report["all"]["queries_per_request"] > 0
+    assert set(report) - {"all"} == {name for name, *_ in requests}
+
+    out = StringIO()
+    call_command("load_test_m", "--requests", "4", "--concurrency", "1",
+                 "--mix", "get_suggestions=1", stdout=out)
+    assert "get_suggestions: 4 requests, 0 errors" in out.getvalue()
@@ -0,0 +1,237 @@
+import pytest
+import datetime
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+from s2s.db_models import *
+from ml.ml.recommendation import recommend
+from s2s.serializers import PanelEventSerializer, PanelUserPreferencesSerializer
+from s2s.utils.panelization import (
+    EVENT_LAYOUT,
+    SCENARIO_LAYOUT,
+    USER_PREFERENCES_LAYOUT,
+    encode_distances,
+    encode_events,
+    encode_scenarios,
+    encode_user_preferences,
+    save_event_panels,
+    save_scenario_panels,
+    save_user_preference_panels,
+)
+from s2s.views import SuggestionResultsViewSet
+
+
+@pytest.fixture
+def panel_data():
+    '''
+    Create a user with onboarding, availability, a scenario, and an event.
+    '''
+    user = User.objects.create(username="panel.test@s2s.com")
+    outdoors = HobbyType.objects.create(type="OUTDOORS")
+    gaming = HobbyType.objects.create(type="GAMING")
+    hiking = Hobby.objects.create(name="Hiking", type=outdoors)
+    chess = Hobby.objects.create(name="Chess", type=gaming)
+
+    onboarding = Onboarding.objects.create(
+        user_id=user,
+        onboarded=True,
+        num_participants=["1-5", "10-15"],
+        distance="Within 10 miles",
+        similarity_to_group="Moderately similar",
+        similarity_metrics=["Gender"],
+    )
+    onboarding.most_interested_hobby_types.add(gaming)
+    Availability.objects.create(user_id=user, day_of_week="Tuesday", hour=10, available=True)
+    Availability.objects.create(user_id=user, day_of_week="Tuesday", hour=18, available=False)
+
+    scenario = Scenarios.objects.create(
+        user_id=user, hobby1=hiking, hobby2=chess,
+        distance1="Within 1 mile", distance2="Within 50 miles",
+        num_participants1="1-5", num_participants2="15+",
+        day_of_week1="Monday", day_of_week2="Sunday",
+        time_of_day1="Morning (9a-12p)", time_of_day2="Late night (1-4a)",
+        duration_h1=2, duration_h2=8,
+        prefers_event1=False, prefers_event2=True,
+    )
+
+    # a Wednesday at 2pm UTC
+    event = Event.objects.create(
+        title="Board games", hobby_type=gaming,
+        datetime=timezone.make_aware(datetime.datetime(2024, 5, 1, 14)),
+        duration_h=3, address1="5801 S Ellis Ave",
+        latitude=41.7886, longitude=-87.5987, max_attendees=12,
+    )
+    return user, onboarding, scenario, event
+
+
+def true_columns(layout, row):
+    return {column for column, value in zip(layout.columns, row) if value}
+
+
+@pytest.mark.django_db
+def test_encode_events(panel_data):
+    _, _, _, event = panel_data
+    event_ids, array = encode_events(Event.objects.all())
+
+    assert event_ids.tolist() == [event.id]
+    assert array.shape == (1, len(EVENT_LAYOUT.columns))
+    assert true_columns(EVENT_LAYOUT, array[0]) == {
+        "hobby_category_gaming",
+        "num_particip_10to15",
+        "wednesday_afternoon",
+        "duration_3hr",
+    }
+
+
+@pytest.mark.django_db
+def test_encode_scenarios(panel_data):
+    user, _, scenario, _ = panel_data
+    scenario_ids, user_ids, array = encode_scenarios(Scenarios.objects.all())
+
+    assert scenario_ids.tolist() == [scenario.id, scenario.id]
+    assert user_ids.tolist() == [user.id, user.id]
+    assert true_columns(SCENARIO_LAYOUT, array[0]) == {
+        "hobby_category_outdoor_activities",
+        "dist_within_1mi",
+        "num_particip_1to5",
+        "monday_morning",
+        "duration_2hr",
+    }
+    assert true_columns(SCENARIO_LAYOUT, array[1]) == {
+        "hobby_category_gaming",
+        "dist_within_50mi",
+        "num_particip_15p",
+        "sunday_late_night",
+        "duration_8hr",
+        "attended_event",
+    }
+
+
+@pytest.mark.django_db
+def test_encode_user_preferences(panel_data):
+    user, onboarding, _, _ = panel_data
+    user_ids, array = encode_user_preferences(onboarding)
+
+    assert user_ids.tolist() == [user.id]
+    assert true_columns(USER_PREFERENCES_LAYOUT, array[0]) == {
+        "pref_num_particip_1to5",
+        "pref_num_particip_10to15",
+        "pref_dist_within_10mi",
+        "pref_similarity_to_group_3",
+        "pref_gender_similar",
+        "pref_hobby_category_gaming",
+        "pref_tuesday_morning",
+    }
+
+    frame = USER_PREFERENCES_LAYOUT.to_frame(array, index=user_ids)
+    assert bool(frame.loc[user.id, "pref_tuesday_morning"])
+    assert not bool(frame.loc[user.id, "pref_tuesday_evening"])
+
+
+@pytest.mark.django_db
+def test_save_panels_is_idempotent(panel_data):
+    assert save_event_panels(Event.objects.all()) == (1, 0)
+    assert save_event_panels(Event.objects.all()) == (0, 1)
+    assert PanelEvent.objects.count() == 1
+    assert PanelEvent.objects.get().hobby_category_gaming
+
+    save_scenario_panels(Scenarios.objects.all())
+    save_scenario_panels(Scenarios.objects.all())
+    assert PanelScenario.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_panels_command(panel_data):
+    out = StringIO()
+    call_command("panels_m", stdout=out)
+
+    assert "Panels rebuilt successfully" in out.getvalue()
+    assert PanelEvent.objects.count() == 1
+    assert PanelScenario.objects.count() == 2
+    assert PanelUserPreferences.objects.count() == 1
+
+
+def test_encode_distances():
+    array = encode_distances([0.5, 1, 12.3, 49.9, 50, None])
+
+    assert array.sum(axis=1).tolist() == [1, 1, 1, 1, 0, 0]
+    assert array[0, 0] and array[1, 1] and array[2, 3] and array[3, 7]
+
+
+@pytest.mark.django_db
+def test_packed_panels_round_trip(panel_data):
+    save_event_panels(Event.objects.all())
+    event_ids, expected = encode_events(Event.objects.all())
+
+    panel = PanelEvent.objects.get()
+    assert len(panel.packed_features) == EVENT_LAYOUT.num_bytes
+    read_ids, array = EVENT_LAYOUT.read(PanelEvent.objects.all(), "event_id")
+    assert read_ids.tolist() == event_ids.tolist()
+    assert (array == expected).all()
+
+    # rows without a packed bitmask are read from their boolean columns
+    PanelEvent.objects.update(packed_features=None)
+    _, array = EVENT_LAYOUT.read(PanelEvent.objects.all(), "event_id")
+    assert (array == expected).all()
+
+    # and so are rows packed with another layout, i.e. before a column was
+    # added, even when the bitmask is as wide
+    stale = bytes(len(EVENT_LAYOUT.version)) + b"\xff" * (
+        EVENT_LAYOUT.num_bytes - len(EVENT_LAYOUT.version)
+    )
+    PanelEvent.objects.update(packed_features=stale)
+    _, array = EVENT_LAYOUT.read(PanelEvent.objects.all(), "event_id")
+    assert (array == expected).all()
+
+    with pytest.raises(ValueError):
+        EVENT_LAYOUT.unpack([b"\x00"])
+
+
+@pytest.mark.django_db
+def test_saved_panels_are_repacked(panel_data):
+    save_event_panels(Event.objects.all())
+    panel = PanelEvent.objects.get()
+
+    panel.hobby_category_gaming = False
+    panel.hobby_category_travel = True
+    panel.save()
+    _, array = EVENT_LAYOUT.read(PanelEvent.objects.all(), "event_id")
+    assert EVENT_LAYOUT.to_dicts(array)[0]["hobby_category_travel"]
+    assert not EVENT_LAYOUT.to_dicts(array)[0]["hobby_category_gaming"]
+
+    panel.hobby_category_travel = False
+    panel.save(update_fields=["hobby_category_travel"])
+    _, array = EVENT_LAYOUT.read(PanelEvent.objects.all(), "event_id")
+    assert not EVENT_LAYOUT.to_dicts(array)[0]["hobby_category_travel"]
+
+
+@pytest.mark.django_db
+def test_update_suggestions_matches_serialized_rows(panel_data):
+    user, onboarding, _, event = panel_data
+    onboarding.latitude, onboarding.longitude = 41.8781, -87.6298
+    onboarding.save()
+    save_event_panels(Event.objects.all())
+    save_user_preference_panels(onboarding)
+
+    view = SuggestionResultsViewSet()
+    result = view.perform_update_suggestions(user.id)
+    assert len(result["data"]) == 1
+
+    # the probability the model gives the equivalent serialized row
+    row = {
+        **PanelUserPreferencesSerializer(PanelUserPreferences.objects.get()).data,
+        **PanelEventSerializer(PanelEvent.objects.get()).data,
+        **view.distance_calc(event.id, user.id)[0],
+    }
+    expected = float(recommend([row])[0][0])
+    assert SuggestionResults.objects.get().probability_of_attendance == pytest.approx(
+        expected, rel=1e-5
+    )
+
+    # rerunning upserts the same rows
+    SuggestionResults.objects.update(probability_of_attendance=0)
+    assert view.perform_update_suggestions(user.id)["data"][0]["id"] == result["data"][0]["id"]
+    assert SuggestionResults.objects.get().probability_of_attendance == pytest.approx(
+        expected, rel=1e-5
+    )
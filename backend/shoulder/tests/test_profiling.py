@@ -0,0 +1,112 @@
+import json
+import os
+import pstats
+import pytest
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from s2s.db_models import *
+from s2s.utils.instrumentation import timed
+from s2s.utils.profiling import profile
+from tests.test_views import generate_app_token
+
+
+def busy_loop():
+    total = 0
+    for i in range(2_000_000):
+        total += i
+    return total
+
+
+def test_profile_disabled():
+    with profile("nothing", None) as result:
+        pass
+    assert result is None
+    with pytest.raises(ValueError):
+        with profile("nothing", "perf"):
+            pass
+
+
+@pytest.mark.django_db
+def test_sampling_profile(tmp_path):
+    import jax
+    import jax.numpy as jnp
+
+    with profile("sampled", "sampling", str(tmp_path), interval=0.001) as result:
+        busy_loop()
+        HobbyType.objects.count()
+        with timed("ml"):
+            jax.jit(lambda x: x * 3 + 1)(jnp.ones(4)).block_until_ready()
+
+    assert [os.path.splitext(path)[1] for path in result.paths] == [".folded", ".json"]
+    with open(result.paths[0]) as file:
+        lines = file.read().splitlines()
+    assert any("test_profiling:busy_loop" in line for line in lines)
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0 and ";" in stack
+
+    with open(result.paths[1]) as file:
+        summary = json.load(file)
+    assert summary == result.summary
+    assert summary["db_queries"] == 1
+    assert summary["jax"]["compilations"] >= 1
+    assert 0 < summary["jax"]["compile_seconds"] <= summary["ml_seconds"]
+    assert summary["ml_execute_seconds"] >= 0
+
+
+def test_concurrent_cprofile_falls_back_to_sampling(tmp_path):
+    with profile("outer", "cprofile", str(tmp_path)) as outer:
+        with profile("inner", "cprofile", str(tmp_path)) as inner:
+            busy_loop()
+    assert outer.mode == "cprofile"
+    assert inner.mode == "sampling"
+
+    # the lock is released with the profiler
+    with profile("again", "cprofile", str(tmp_path)) as again:
+        pass
+    assert again.mode == "cprofile"
+
+
+@pytest.mark.django_db
+def test_cprofile_command(tmp_path):
+    out = StringIO()
+    call_command(
+        "update_suggestions_m", "--profile", "cprofile", "--profile-dir", str(tmp_path), stdout=out
+    )
+    assert "Profile written to" in out.getvalue()
+
+    prof = [path for path in os.listdir(tmp_path) if path.endswith(".prof")]
+    assert len(prof) == 1 and prof[0].startswith("update_suggestions-")
+    stats = pstats.Stats(str(tmp_path / prof[0]))
+    assert any(function == "update_suggestions" for _, _, function in stats.stats)
+    assert os.path.exists(tmp_path / prof[0].replace(".prof", ".txt"))
+
+
+@pytest.mark.django_db
+def test_profiling_middleware(tmp_path):
+    client = APIClient()
+    token = generate_app_token()
+    user = User.objects.create_user("user", "user@s2s.com", "password")
+    client.credentials(
+        HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}",
+        HTTP_X_APP_TOKEN=token,
+    )
+
+    with override_settings(PROFILING_DIR=str(tmp_path)):
+        response = client.get("/api/hobbytypes/", HTTP_X_PROFILE="1")
+        assert response.status_code == 200
+        assert "X-Profile" not in response, "Ensure only staff can profile"
+        assert not os.listdir(tmp_path)
+
+        user.is_staff = True
+        user.save()
+        response = client.get("/api/hobbytypes/?profile=cprofile")
+        assert response.status_code == 200
+        stem = response["X-Profile"]
+        assert stem.startswith("api_hobbytypes-")
+        assert sorted(os.listdir(tmp_path)) == [stem + ".json", stem + ".prof", stem + ".txt"]
+        with open(tmp_path / (stem + ".json")) as file:
+            assert json.load(file)["db_queries"] > 0
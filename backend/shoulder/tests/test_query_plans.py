@@ -0,0 +1,57 @@
+import pytest
+from io import StringIO
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from s2s.db_models import *
+from s2s.utils.load_test import generate_load_test_data
+from s2s.utils.query_plans import AFTER_MIGRATION, HOT_QUERIES, leaf_migration, measure_queries
+
+
+@pytest.mark.django_db
+def test_unique_constraints():
+    generate_load_test_data(2, 3, num_scenarios=1, num_rsvps=1, num_suggestions=1)
+    for model, fields in [
+        (UserEvents, ["user_id_id", "event_id_id", "rsvp"]),
+        (SuggestionResults, ["user_id_id", "event_id_id", "event_date", "probability_of_attendance"]),
+        (Availability, ["user_id_id", "day_of_week", "hour"]),
+    ]:
+        row = model.objects.values(*fields).first()
+        with pytest.raises(IntegrityError), transaction.atomic():
+            model.objects.create(**row)
+
+
+@pytest.mark.django_db
+def test_measure_queries():
+    generate_load_test_data(5, 10, num_scenarios=1)
+    results = measure_queries(repeat=5)
+    assert set(results) == set(HOT_QUERIES)
+    for result in results.values():
+        assert result["plan"] and 0 <= result["p50_ms"] <= result["p95_ms"]
+
+    if connection.vendor == "sqlite":
+        # the lookups use the composite indexes, not a scan of the table
+        assert "event_datetime" in results["upcoming_events"]["plan"]
+        assert "suggestion_user_probability" in results["top_suggestions"]["plan"]
+        for name in ("availability_slot", "suggestion_for_event", "user_event"):
+            assert "USING INDEX" in results[name]["plan"] or "USING COVERING INDEX" in results[name]["plan"]
+
+    out = StringIO()
+    call_command("query_plans_m", "--repeat", "2", stdout=out)
+    assert "upcoming_events:" in out.getvalue()
+    assert "successfully" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_before_after_refuses_data_loss(settings):
+    """
+    Test --before-after refuses to migrate back past the migrations after
+    0008 unless forced.
+    """
+    # load the migrations even if the tests run with --nomigrations
+    settings.MIGRATION_MODULES = {}
+    assert leaf_migration() != AFTER_MIGRATION
+    out = StringIO()
+    call_command("query_plans_m", "--before-after", "--repeat", "1", stdout=out)
+    assert "--force" in out.getvalue()
+    assert "successfully" not in out.getvalue()
+    assert ZipCode.objects.count() == 0
@@ -2,7 +2,8 @@ import pickle
 import jaxlib
 from pathlib import Path
 import jaxlib.xla_extension
-from shoulder.ml.ml.recommendation import preprocess, pretrain, finetune, recommend
+from shoulder.ml.ml.recommendation import preprocess, pretrain, finetune, recommend, tokenize
+from shoulder.ml.ml.inference import user_buckets
 import os, pathlib
 
 TEST_DATA_DIR = pathlib.Path(__file__).parent
@@ -23,6 +24,19 @@ def test_preprocess():
     assert isinstance(preprocessed_data_prediction, jaxlib.xla_extension.ArrayImpl), "Ensure output is a jax array"
 
 
+def test_tokenize():
+    raw_data = [
+        {"id": 1, "user_id": 3, "event_id": 7, "b": True, "a": False, "c": True},
+        {"id": 2, "user_id": 4, "event_id": 8, "b": False, "a": True, "c": False},
+    ]
+    features = [[False, True, True], [True, False, False]]
+
+    tokens = tokenize(features, [3, 4])
+    buckets = user_buckets([3, 4]).tolist()
+    assert tokens.tolist() == [[0, 3, 5, 6 + buckets[0]], [1, 2, 4, 6 + buckets[1]]], "Ensure tokens match the vocabulary"
+    assert (tokens == preprocess(raw_data, predict=True)).all(), "Ensure preprocess tokenizes the sorted keys"
+
+
 def test_pretrain():
     path = os.path.join(TEST_DATA_DIR, "test_data.pkl")
     with open(path, 'rb') as f:
@@ -0,0 +1,50 @@
+import filecmp
+import json
+import os
+import numpy as np
+from shoulder.ml.ml.search import DEFAULTS, grid, sample, search
+
+
+def test_grid_and_sample():
+    trials = grid({"lr": [0.1, 0.01], "num_factors": [2, 4, 8]})
+    assert len(trials) == 6
+    assert all(trial["batch_size"] == DEFAULTS["batch_size"] for trial in trials)
+    assert {(trial["lr"], trial["num_factors"]) for trial in trials} == {
+        (lr, k) for lr in [0.1, 0.01] for k in [2, 4, 8]
+    }
+
+    sampled = sample({"lr": [0.1, 0.01], "num_factors": [2, 4, 8]}, 4, seed=1)
+    assert len(sampled) == 4
+    assert len({(trial["lr"], trial["num_factors"]) for trial in sampled}) == 4
+
+
+def test_successive_halving(tmp_path):
+    rng = np.random.default_rng(0)
+    features = rng.random((300, 6)) < 0.5
+    user_ids = rng.integers(0, 40, 300)
+    targets = features[:, 0]
+
+    path = tmp_path / "best.pkl"
+    best, records = search(
+        (features, user_ids, targets),
+        {"lr": [0.01, 0.001, 0.0001]},
+        strategy="halving",
+        num_trials=3,
+        num_epochs=3,
+        output_dir=str(tmp_path / "search"),
+        path=str(path),
+        max_workers=3,
+        num_buckets=8,
+    )
+
+    # one rung of 1 epoch for every trial, then the best one trains to 3
+    assert sorted(record["epochs"] for record in records) == [1, 1, 3]
+    assert best["epochs"] == 3 and len(best["loss_list"]) == 3
+
+    with open(tmp_path / "search" / "trials.json") as file:
+        log = json.load(file)
+    assert log["best"] == best["trial"] and len(log["trials"]) == 3
+
+    # the best trial's weights are copied to the model's path
+    assert filecmp.cmp(path, best["weights"], shallow=False)
+    assert os.path.isfile(tmp_path / "best.npz")
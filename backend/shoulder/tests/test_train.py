@@ -1,4 +1,7 @@
-import os, pathlib
+import os, pathlib, subprocess, sys
+import jax
+import numpy as np
+import pytest
 import jaxlib
 from jax import random
 import jax.numpy as jnp
@@ -6,6 +9,7 @@ from pathlib import Path
 from shoulder.ml.ml.dataset import Dataset
 from shoulder.ml.ml.model import init_deep_fm
 from shoulder.ml.ml.train import step, train, predict, save_outputs
+from shoulder.ml.ml.train import evaluate, validation_split
 
 TEST_DATA_DIR = pathlib.Path(__file__).parent
 FIGURES_DIR = os.path.join(pathlib.Path(__file__).parent.absolute().parent, "ml/ml/figures")
@@ -65,3 +69,164 @@ def test_predict_new_user():
                     jnp.array([[1000000]])], axis=1)
     assert not jnp.isnan(predict(X)).any(), "Ensure output is not nan"
 
+
+
+def test_data_parallel_train_matches_single_device(tmp_path):
+    # host CPU devices have to be requested before JAX starts, so train in a
+    # fresh interpreter
+    script = f"""
+import jax, numpy as np
+from jax import random
+from shoulder.ml.ml.dataset import Dataset
+from shoulder.ml.ml.model import init_deep_fm
+from shoulder.ml.ml.train import train
+
+assert jax.local_device_count() == 4
+x = random.randint(random.PRNGKey(706), (1000, 5), minval=0, maxval=50).astype(float)
+y = random.bernoulli(random.PRNGKey(9970), 0.35, (1000,)).astype(float)
+
+# 250 rows per minibatch doesn't split evenly across 4 devices
+single = train(init_deep_fm(51, 5, 5), Dataset(x, y, 250, 127), 3,
+               r"{tmp_path / 'single.pkl'}", dropout=0.0)
+parallel = train(init_deep_fm(51, 5, 5), Dataset(x, y, 250, 127), 3,
+                 r"{tmp_path / 'parallel.pkl'}", num_devices=4, dropout=0.0)
+
+assert np.allclose(single[1], parallel[1], atol=1e-5)
+assert np.allclose(single[2], parallel[2], atol=1e-5)
+for a, b in zip(jax.tree.leaves(single[3]), jax.tree.leaves(parallel[3])):
+    assert np.allclose(a, b, atol=1e-5)
+"""
+    env = {**os.environ, "XLA_FLAGS": "--xla_force_host_platform_device_count=4"}
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=pathlib.Path(__file__).parent.parent.parent,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_validation_split():
+    x = random.randint(random.PRNGKey(12), (100, 5), minval=0, maxval=50).astype(float)
+    y = random.bernoulli(random.PRNGKey(13), 0.35, (100,)).astype(float)
+    (x_train, y_train), (x_val, y_val) = validation_split(x, y, 0.2)
+    assert x_train.shape == (80, 5) and x_val.shape == (20, 5)
+    assert y_train.shape == (80,) and y_val.shape == (20,)
+    rows = {tuple(row) for row in np.asarray(jnp.concat([x_train, x_val]))}
+    assert rows == {tuple(row) for row in np.asarray(x)}, "Ensure every row is kept once"
+
+    assert validation_split(x, y, 0.0)[1] is None
+
+
+def test_train_reports_epoch_means(tmp_path):
+    x = random.randint(random.PRNGKey(14), (100, 5), minval=0, maxval=50).astype(float)
+    y = random.bernoulli(random.PRNGKey(15), 0.35, (100,)).astype(float)
+    params = init_deep_fm(51, 5, 5)
+    _, loss, accuracy, _ = train(params, Dataset(x, y, 30, 1), 1, str(tmp_path / "p.pkl"),
+                                 dropout=0.0)
+
+    # the first epoch's minibatches, replayed from the same parameters
+    import optax
+    solver = optax.adam(0.0001)
+    solver_state = solver.init(params)
+    losses, accs, rows = [], [], []
+    for x_batch, y_batch in Dataset(x, y, 30, 1):
+        params, batch_loss, grads, batch_acc = step(params, x_batch, y_batch, 0.0)
+        updates, solver_state = solver.update(grads, solver_state)
+        params = optax.apply_updates(params, updates)
+        losses.append(float(batch_loss))
+        accs.append(float(batch_acc))
+        rows.append(x_batch.shape[0])
+    assert loss[0] == pytest.approx(np.average(losses, weights=rows), rel=1e-5)
+    assert accuracy[0] == pytest.approx(np.average(accs, weights=rows), rel=1e-5)
+
+
+def test_early_stopping(tmp_path):
+    x = random.randint(random.PRNGKey(16), (200, 5), minval=0, maxval=50).astype(float)
+    y = random.bernoulli(random.PRNGKey(17), 0.35, (200,)).astype(float)
+    # the validation targets are the opposite of the training targets, so the
+    # validation loss only gets worse after the first epoch
+    validation = (x, 1 - y)
+
+    epochs, loss, _, params = train(
+        init_deep_fm(51, 5, 5), Dataset(x, y, 200, 1), 50, str(tmp_path / "p.pkl"),
+        dropout=0.0, lr=0.01, validation=validation, patience=3,
+    )
+    assert epochs == [1, 2, 3, 4], "Ensure training stops after patience epochs"
+
+    _, _, _, best = train(init_deep_fm(51, 5, 5), Dataset(x, y, 200, 1), 1,
+                          str(tmp_path / "best.pkl"), dropout=0.0, lr=0.01)
+    for a, b in zip(jax.tree.leaves(params), jax.tree.leaves(best)):
+        assert np.allclose(a, b), "Ensure the best epoch's weights are kept"
+
+
+class Interrupted(Dataset):
+    """A Dataset that stops the program at the start of an epoch"""
+
+    def __init__(self, *args, interrupt_at: int) -> None:
+        super().__init__(*args)
+        self.epoch = 0
+        self.interrupt_at = interrupt_at
+
+    def __iter__(self):
+        self.epoch += 1
+        if self.epoch == self.interrupt_at:
+            raise KeyboardInterrupt
+        return self
+
+
+def test_resume_from_checkpoint(tmp_path):
+    x = random.randint(random.PRNGKey(18), (100, 5), minval=0, maxval=50).astype(float)
+    y = random.bernoulli(random.PRNGKey(19), 0.35, (100,)).astype(float)
+    # a single minibatch per epoch, so the minibatches don't depend on when
+    # training was resumed
+    checkpoint = str(tmp_path / "checkpoint.pkl")
+
+    expected = train(init_deep_fm(51, 5, 5), Dataset(x, y, 100, 1), 6,
+                     str(tmp_path / "expected.pkl"), dropout=0.0, lr=0.01)
+
+    with pytest.raises(KeyboardInterrupt):
+        train(init_deep_fm(51, 5, 5), Interrupted(x, y, 100, 1, interrupt_at=4), 6,
+              str(tmp_path / "p.pkl"), dropout=0.0, lr=0.01,
+              checkpoint_path=checkpoint)
+    assert os.path.isfile(checkpoint), "Ensure a checkpoint is written"
+
+    epochs, loss, accuracy, params = train(
+        init_deep_fm(51, 5, 5), Dataset(x, y, 100, 1), 6, str(tmp_path / "p.pkl"),
+        dropout=0.0, lr=0.01, checkpoint_path=checkpoint, resume=True,
+    )
+    assert epochs == expected[0]
+    assert np.allclose(loss, expected[1], atol=1e-6)
+    assert np.allclose(accuracy, expected[2], atol=1e-6)
+    for a, b in zip(jax.tree.leaves(params), jax.tree.leaves(expected[3])):
+        assert np.allclose(a, b, atol=1e-6)
+    assert not os.path.isfile(checkpoint), "Ensure the checkpoint is removed when done"
+
+
+def test_resume_after_early_stopping(tmp_path, monkeypatch):
+    from shoulder.ml.ml import train as train_module
+
+    x = random.randint(random.PRNGKey(16), (200, 5), minval=0, maxval=50).astype(float)
+    y = random.bernoulli(random.PRNGKey(17), 0.35, (200,)).astype(float)
+    validation = (x, 1 - y)
+    checkpoint = str(tmp_path / "checkpoint.pkl")
+
+    def interrupted_save_outputs(*args):
+        raise KeyboardInterrupt
+
+    # interrupted after stopping early, before the weights are saved
+    monkeypatch.setattr(train_module, "save_outputs", interrupted_save_outputs)
+    with pytest.raises(KeyboardInterrupt):
+        train(init_deep_fm(51, 5, 5), Dataset(x, y, 200, 1), 50, str(tmp_path / "p.pkl"),
+              dropout=0.0, lr=0.01, validation=validation, patience=3,
+              checkpoint_path=checkpoint)
+    monkeypatch.undo()
+
+    epochs, _, _, _ = train(
+        init_deep_fm(51, 5, 5), Dataset(x, y, 200, 1), 50, str(tmp_path / "p.pkl"),
+        dropout=0.0, lr=0.01, validation=validation, patience=3,
+        checkpoint_path=checkpoint, resume=True,
+    )
+    assert epochs == [1, 2, 3, 4], "Ensure a resumed run doesn't train past its early stop"
+    assert not os.path.isfile(checkpoint)
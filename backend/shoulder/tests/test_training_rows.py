@@ -0,0 +1,187 @@
+import pytest
+import datetime
+from io import StringIO
+from django.core.management import call_command
+from django.utils import timezone
+from ml.ml.dataset import MemmapDataset
+from ml.ml.recommendation import (
+    load_training_file,
+    read_training_file,
+    write_training_memmap,
+)
+from s2s.db_models import *
+from s2s.serializers import (
+    PanelEventSerializer,
+    PanelScenarioSerializer,
+    PanelUserPreferencesSerializer,
+)
+from s2s.utils.panelization import (
+    FEATURE_COLUMNS,
+    save_event_panels,
+    save_scenario_panels,
+    save_user_preference_panels,
+)
+from s2s.utils.training_rows import EVENT, SCENARIO, read_training_rows
+from s2s.views import SuggestionResultsViewSet
+from tests.test_panelization import panel_data
+
+
+@pytest.fixture
+def panels(panel_data):
+    '''
+    Save the panels of panel_data, with the event moved to the future and the
+    user RSVPed to it.
+    '''
+    user, onboarding, _, event = panel_data
+    onboarding.latitude, onboarding.longitude = 41.8781, -87.6298
+    onboarding.save()
+    event.datetime = timezone.now() + datetime.timedelta(days=3)
+    event.save()
+
+    save_user_preference_panels(onboarding)
+    save_scenario_panels(Scenarios.objects.all())
+    save_event_panels(Event.objects.all())
+    UserEvents.objects.create(user_id=user, event_id=event, rsvp="Yes", attended=True)
+    return panel_data
+
+
+@pytest.mark.django_db
+def test_scenario_rows_match_serialized_rows(panels):
+    user, _, _, _ = panels
+
+    features, user_ids, targets = read_training_rows(SCENARIO)
+    assert features.shape == (2, len(FEATURE_COLUMNS))
+    assert user_ids.tolist() == [user.id, user.id]
+    assert targets.tolist() == [False, True]
+
+    preferences = PanelUserPreferencesSerializer(PanelUserPreferences.objects.get()).data
+    for row, panel in zip(features, PanelScenario.objects.order_by("id")):
+        data = {**preferences, **PanelScenarioSerializer(panel).data}
+        assert row.tolist() == [data[column] for column in FEATURE_COLUMNS]
+
+
+@pytest.mark.django_db
+def test_event_rows_match_serialized_rows(panels):
+    user, _, _, event = panels
+
+    features, user_ids, targets = read_training_rows(EVENT, since=timezone.now())
+    assert user_ids.tolist() == [user.id]
+    assert targets.tolist() == [True]
+
+    data = {
+        **PanelUserPreferencesSerializer(PanelUserPreferences.objects.get()).data,
+        **PanelEventSerializer(PanelEvent.objects.get()).data,
+        **SuggestionResultsViewSet().distance_calc(event.id, user.id)[0],
+    }
+    assert features[0].tolist() == [data[column] for column in FEATURE_COLUMNS]
+
+    # past events are left out of finetuning
+    features, _, _ = read_training_rows(
+        EVENT, since=timezone.now() + datetime.timedelta(days=7)
+    )
+    assert len(features) == 0
+
+
+@pytest.mark.django_db
+def test_training_rows_follow_saves(panels):
+    user, onboarding, _, event = panels
+    assert TrainingRow.objects.filter(source=SCENARIO).count() == 2
+    assert TrainingRow.objects.filter(source=EVENT).count() == 1
+
+    # saving a UserEvents row refreshes its training row
+    user_event = UserEvents.objects.get()
+    user_event.attended = False
+    user_event.save()
+    assert not TrainingRow.objects.get(source=EVENT).attended_event
+
+    # re-saving the scenario panels replaces their training rows
+    save_scenario_panels(Scenarios.objects.all())
+    assert TrainingRow.objects.filter(source=SCENARIO).count() == 2
+
+    # saving a user's preferences panel refreshes all of the user's rows
+    panel = PanelUserPreferences.objects.get()
+    panel.pref_hobby_category_travel = True
+    panel.packed_features = None
+    panel.save()
+    column = FEATURE_COLUMNS.index("pref_hobby_category_travel")
+    for source in [SCENARIO, EVENT]:
+        features, _, _ = read_training_rows(source)
+        assert features[:, column].all()
+
+    # saving an event re-panelizes it and refreshes its training rows
+    event.datetime += datetime.timedelta(days=1)
+    event.latitude, event.longitude = 41.879, -87.63
+    event.save()
+    row = TrainingRow.objects.get(source=EVENT)
+    assert row.event_date == event.datetime
+    features, _, _ = read_training_rows(EVENT)
+    assert features[0, FEATURE_COLUMNS.index("dist_within_1mi")]
+    assert PanelEvent.objects.get().packed_features is not None
+
+    # saving the user's onboarding refreshes the distances of their rows
+    onboarding.latitude, onboarding.longitude = 40.7128, -74.006
+    onboarding.save()
+    features, _, _ = read_training_rows(EVENT)
+    assert not features[0, FEATURE_COLUMNS.index("dist_within_1mi")]
+
+    UserEvents.objects.all().delete()
+    assert not TrainingRow.objects.filter(source=EVENT).exists()
+
+    # deleting a user's preferences panel removes the user's rows
+    PanelUserPreferences.objects.all().delete()
+    assert not TrainingRow.objects.exists()
+
+
+@pytest.mark.django_db
+def test_training_rows_command(panels):
+    TrainingRow.objects.all().delete()
+
+    out = StringIO()
+    call_command("training_rows_m", stdout=out)
+
+    assert "Training rows rebuilt successfully: 3 rows" in out.getvalue()
+    assert TrainingRow.objects.count() == 3
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("extension", ["arrow", "parquet"])
+def test_export_training_data(panels, tmp_path, extension):
+    pytest.importorskip("pyarrow")
+
+    out = StringIO()
+    call_command(
+        "export_training_data_m", str(tmp_path), format=extension, batch_size=1,
+        stdout=out,
+    )
+    assert "Training data exported successfully" in out.getvalue()
+
+    for name, source in [("pretraining", SCENARIO), ("finetuning", EVENT)]:
+        features, user_ids, targets = read_training_file(
+            tmp_path / f"{name}.{extension}"
+        )
+        expected = read_training_rows(source)
+        assert (features == expected[0]).all()
+        assert user_ids.tolist() == expected[1].tolist()
+        assert targets.tolist() == expected[2].tolist()
+
+    x, y = load_training_file(tmp_path / f"pretraining.{extension}")
+    assert x.shape == (2, len(FEATURE_COLUMNS) + 1)
+    assert y.tolist() == [0, 1]
+
+
+@pytest.mark.django_db
+def test_write_training_memmap(panels, tmp_path):
+    pytest.importorskip("pyarrow")
+    call_command("export_training_data_m", str(tmp_path), stdout=StringIO())
+
+    num_rows, max_token = write_training_memmap(
+        tmp_path / "pretraining.arrow", tmp_path / "x.npy", tmp_path / "y.npy"
+    )
+    x, y = load_training_file(tmp_path / "pretraining.arrow")
+    assert num_rows == 2
+    assert max_token == int(x.max())
+
+    data = MemmapDataset(tmp_path / "x.npy", tmp_path / "y.npy", 2, 0)
+    x_batch, y_batch = next(iter(data))
+    assert sorted(y_batch.tolist()) == sorted(y.tolist())
+    assert sorted(x_batch.tolist()) == sorted(x.tolist())
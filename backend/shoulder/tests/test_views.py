@@ -714,30 +714,31 @@ def test_get_suggestions_authenticated(api_client):
 
 
 @pytest.mark.django_db
-def test_zip_code_valid(api_client):
+def test_zip_code_valid(api_client, stub_upstream):
     """
     Test that ensures that location is retrieved given a valid zipcode.
     """
-    view = ZipCodeViewSet.as_view({'get': 'list'})
     url = "/api/zipcodes/"
     response = api_client.get(url, {'zip_code': '90210'})
 
     assert response.status_code == status.HTTP_200_OK
-    assert response.data['results']['90210'][0]['city'] == 'Beverly Hills'
-    assert response.data['results']['90210'][0]['state'] == 'California'
+    assert response.json()['results']['90210'][0]['city'] == 'Beverly Hills'
+    assert response.json()['results']['90210'][0]['state'] == 'California'
 
 
 @pytest.mark.django_db
-def test_zip_code_missing(api_client):
+def test_zip_code_missing(api_client, stub_upstream):
     """
     Test that ensures that a location is not retrieved given the zipcode is missing.
     """
-    view = ZipCodeViewSet.as_view({'get': 'list'})
     url = "/api/zipcodes/"
     response = api_client.get(url, {'zip_code': '90210'})
 
     assert response.status_code == status.HTTP_200_OK
-    assert response.data['query']['codes'] == ['90210']
+    assert response.json()['query']['codes'] == ['90210']
+
+    response = api_client.get(url)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
 
 
 @pytest.mark.django_db
@@ -1146,3 +1147,131 @@ def test_panel_scenarios(api_client):
 
 
 
+
+
+@pytest.mark.django_db
+def test_upcoming_past_events(api_client, django_assert_max_num_queries):
+    """
+    Test the upcoming_past_events listing of UserEventsViewSet, whole and in
+    cursor pages.
+    """
+    app_token = generate_app_token()
+    user = User.objects.create_user("events@s2s.com", "events@s2s.com", "DjangoTest1!")
+    hobby_type = HobbyType.objects.create(type="OUTDOOR")
+    now = timezone.now()
+    events = [
+        Event.objects.create(title=f"Event {days}", hobby_type=hobby_type,
+                             datetime=now + datetime.timedelta(days=days), duration_h=2,
+                             address1="5801 S Ellis Ave", latitude="41.7886", longitude="-87.5987",
+                             max_attendees=6)
+        for days in (-3, -1, 1, 2, 5)
+    ]
+    for event in events:
+        UserEvents.objects.create(user_id=user, event_id=event, rsvp="Yes", user_rating="4")
+    declined = Event.objects.create(title="Declined", hobby_type=hobby_type, datetime=now,
+                                    duration_h=1, address1="x", latitude="0", longitude="0",
+                                    max_attendees=2)
+    UserEvents.objects.create(user_id=user, event_id=declined, rsvp="No")
+
+    url = '/api/userevents/upcoming_past_events/'
+    with django_assert_max_num_queries(4):
+        response = api_client.get(url, {"user_id": user.id}, HTTP_X_APP_TOKEN=app_token)
+    assert response.status_code == 200
+    assert response.data["past_events"]["count"] == 2
+    assert response.data["upcoming_events"]["count"] == 3
+    assert [e["title"] for e in response.data["past_events"]["events"]] == ["Event -1", "Event -3"]
+
+    # the lightweight rows match the model serializer
+    expected = dict(EventSerializer(events[2]).data, rating="4", attended=False)
+    assert response.data["upcoming_events"]["events"][0] == expected
+
+    page = api_client.get(url, {"user_id": user.id, "section": "upcoming", "page_size": 2},
+                          HTTP_X_APP_TOKEN=app_token).data
+    titles = [e["title"] for e in page["results"]]
+    while page["next"]:
+        page = api_client.get(page["next"], HTTP_X_APP_TOKEN=app_token).data
+        titles += [e["title"] for e in page["results"]]
+    assert titles == ["Event 1", "Event 2", "Event 5"]
+
+    response = api_client.get(url, {"user_id": user.id, "section": "soon"}, HTTP_X_APP_TOKEN=app_token)
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_sparse_fieldsets_and_cursor_pages(api_client, django_assert_num_queries):
+    """
+    Test ?fields= on the list endpoints and cursor pagination of the large
+    tables.
+    """
+    app_token = generate_app_token()
+    user = User.objects.create_user("pages@s2s.com", "pages@s2s.com", "DjangoTest1!")
+    hobby_type = HobbyType.objects.create(type="OUTDOOR")
+    for i in range(5):
+        event = Event.objects.create(title=f"Event {i}", hobby_type=hobby_type,
+                                     datetime=timezone.now(), duration_h=2, address1="x",
+                                     latitude="41.7886", longitude="-87.5987", max_attendees=6)
+        UserEvents.objects.create(user_id=user, event_id=event, rsvp="Yes")
+
+    response = api_client.get('/api/hobbytypes/', {"fields": "id, type"}, HTTP_X_APP_TOKEN=app_token)
+    assert response.data["results"] == [{"id": hobby_type.id, "type": "OUTDOOR"}]
+
+    url = '/api/userevents/'
+    response = api_client.get(url, {"fields": "id,rsvp,unknown", "page_size": 2},
+                              HTTP_X_APP_TOKEN=app_token)
+    assert set(response.data) == {"next", "previous", "results"}
+    assert [set(row) for row in response.data["results"]] == [{"id", "rsvp"}] * 2
+
+    ids = [row["id"] for row in response.data["results"]]
+    page = response.data
+    while page["next"]:
+        with django_assert_num_queries(1):  # the app token is cached
+            page = api_client.get(page["next"], HTTP_X_APP_TOKEN=app_token).data
+        ids += [row["id"] for row in page["results"]]
+    assert ids == sorted(UserEvents.objects.values_list("id", flat=True))
+
+    # writes ignore ?fields=
+    response = api_client.post(f"{url}?fields=id", {"user_id": user.id, "event_id": event.id},
+                               format='json', HTTP_X_APP_TOKEN=app_token)
+    assert response.status_code == 201
+    assert "rsvp" in response.data
+
+
+def test_resumed_finetune_skips_pretraining(tmp_path, monkeypatch):
+    '''
+    Test resuming a finetuning interrupted after pretraining doesn't pretrain
+    again.
+    '''
+    from ml.ml import recommendation
+    from s2s.utils.panelization import FEATURE_COLUMNS
+
+    calls = []
+
+    def pretrain(*args, **kwargs):
+        calls.append("pretrain")
+        return [1], [0.5], [0.5]
+
+    def interrupted_finetune(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    def finetune(*args, **kwargs):
+        calls.append("finetune")
+        return [1], [0.4], [0.6]
+
+    rows = ([[True]], [1], [True])
+    monkeypatch.setattr(recommendation, "PARAMETERS_PATH", str(tmp_path / "parameters.pkl"))
+    monkeypatch.setattr(recommendation, "pretrain", pretrain)
+    monkeypatch.setattr(recommendation, "finetune", interrupted_finetune)
+    monkeypatch.setattr("s2s.views.read_training_rows", lambda *args, **kwargs: rows)
+    view = SuggestionResultsViewSet()
+
+    with pytest.raises(KeyboardInterrupt):
+        view.perform_finetune()
+    monkeypatch.setattr(recommendation, "finetune", finetune)
+    result = view.perform_finetune(resume=True)
+
+    assert calls == ["pretrain", "finetune"]
+    assert result["pretraining_loss_list"] == [0.5]
+    assert result["data"] == [
+        {**dict.fromkeys(FEATURE_COLUMNS[:1], True), "user_id": 1, "attended_event": True}
+    ]
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,114 @@
+import datetime
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from io import StringIO
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from s2s.db_models import ZipCode
+from s2s.utils.zipcodes import LRUCache, cache
+from tests.conftest import StubUpstreamHandler
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.mark.django_db
+def test_zipcodes_read_through(api_client, stub_upstream):
+    """
+    Test a batch of zip codes is looked up with one API call, and then from
+    the cache and the ZipCode table.
+    """
+    url = "/api/zipcodes/"
+    response = api_client.get(url, {"zip_code": "90210,60637,00000"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["query"]["codes"] == ["90210", "60637", "00000"]
+    assert response.json()["results"]["60637"][0]["city"] == "Chicago"
+    assert "00000" not in response.json()["results"]
+    assert len(StubUpstreamHandler.requests) == 1
+
+    # codes the API doesn't know are stored too
+    assert ZipCode.objects.get(zip_code="00000").results == []
+    assert ZipCode.objects.count() == 3
+
+    response = api_client.get(url, {"zip_code": "90210"})
+    assert response.json()["results"]["90210"][0]["state"] == "California"
+    cache.clear()
+    response = api_client.get(url, {"zip_code": "00000"})
+    assert response.json()["results"] == []
+    assert len(StubUpstreamHandler.requests) == 1
+
+
+@pytest.mark.django_db
+def test_unknown_zipcodes_expire(api_client, stub_upstream, settings):
+    """
+    Test zip codes stored as unknown are looked up again once they expire.
+    """
+    url = "/api/zipcodes/"
+    ZipCode.objects.create(zip_code="00000", results=[])
+    ZipCode.objects.create(zip_code="90210", results=[])
+    ZipCode.objects.filter(zip_code="90210").update(
+        created_at=timezone.now() - datetime.timedelta(days=settings.ZIPCODE_NEGATIVE_TTL + 1)
+    )
+
+    response = api_client.get(url, {"zip_code": "00000,90210"})
+    assert response.json()["results"]["90210"][0]["city"] == "Beverly Hills"
+    # only the expired code is looked up
+    assert "codes=90210&" in StubUpstreamHandler.requests[0]
+    assert ZipCode.objects.get(zip_code="90210").results[0]["city"] == "Beverly Hills"
+    assert len(StubUpstreamHandler.requests) == 1
+
+
+@pytest.mark.django_db
+def test_zipcodes_from_table(api_client):
+    """
+    Test zip codes in the ZipCode table are looked up without the API, and
+    malformed codes have no results.
+    """
+    cache.clear()
+    ZipCode.objects.create(zip_code="60615", results=[{"city": "Chicago", "state": "Illinois"}])
+
+    response = api_client.get("/api/zipcodes/", {"zip_code": "60615, abc"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["results"] == {"60615": [{"city": "Chicago", "state": "Illinois"}]}
+
+    # repeated codes count once
+    response = api_client.get("/api/zipcodes/", {"zip_code": ",".join(["60615"] * 2 + ["1"] * 101)})
+    assert response.status_code == status.HTTP_200_OK
+    response = api_client.get("/api/zipcodes/", {"zip_code": ",".join(str(i) for i in range(101))})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_lru_cache():
+    """
+    Test the LRU cache evicts the least recently used codes.
+    """
+    lru = LRUCache(2)
+    lru.set_many({"a": 1, "b": 2})
+    assert lru.get_many(["a"]) == {"a": 1}
+    lru.set_many({"c": 3})
+    assert lru.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+    assert len(lru) == 2
+
+
+@pytest.mark.django_db
+def test_load_zipcodes(tmp_path):
+    """
+    Test the load_zipcodes_m command loads a GeoNames postal code file.
+    """
+    path = tmp_path / "US.txt"
+    path.write_text(
+        "US\t60637\tChicago\tIllinois\tIL\tCook\t031\t\t\t41.7811\t-87.6051\t4\n"
+        "US\t90210\tBeverly Hills\tCalifornia\tCA\tLos Angeles\t037\t\t\t34.0901\t-118.4065\t4\n"
+    )
+    out = StringIO()
+    call_command("load_zipcodes_m", str(path), stdout=out)
+    assert "2 codes" in out.getvalue()
+
+    result = ZipCode.objects.get(zip_code="60637").results[0]
+    assert result["city"] == "Chicago"
+    assert result["state_code"] == "IL"